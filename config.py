@@ -7,7 +7,7 @@ import json
 
 from util.config import Config, Option
 
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 
 class MainConfig(Config):
@@ -44,6 +44,10 @@ class GalaxyScrapeConfig(MainConfig):
         default=None,  # Default to None to indicate no limit
         required=False,
     )
+    workers: Option[int] = Option(
+            'Number of API pages to fetch concurrently.', default=1)
+    rate_limit: Option[float] = Option(
+            'Maximum number of API requests per second.', required=False)
 
 class CustomScrapeConfig(MainConfig):
     """Configuration for custom scraping."""
@@ -74,6 +78,31 @@ class CloneConfig(MainConfig):
 
     resume: Option[bool] = Option(
             'Resuming cloning from a previous run.', default=True)
+    workers: Option[int] = Option(
+            'Number of repositories to clone concurrently.', default=1)
+    timeout: Option[int] = Option(
+            'Timeout in seconds for cloning a single repository.',
+            required=False)
+    depth: Option[int] = Option(
+            'Create shallow clones with a history truncated to this many commits.',
+            required=False)
+    filter: Option[str] = Option(
+            'Partial clone filter, e.g. blob:none, for stages that only need metadata.',
+            required=False)
+
+
+class ExtractGitMetadataConfig(MainConfig):
+    """Configuration for git metadata extraction."""
+
+    batched: Option[bool] = Option(
+            'Read all commits and tags of a repository with a single git log and git for-each-ref, rather than object by object.',
+            default=True)
+    workers: Option[int] = Option(
+            'Number of worker processes extracting repositories in parallel.',
+            default=1)
+    ordered: Option[bool] = Option(
+            'Store the metadata in the order of the repositories rather than as soon as it is extracted.',
+            default=False)
 
 
 class ExtractStructuralModelsConfig(MainConfig):
@@ -90,6 +119,62 @@ class ExtractStructuralModelsConfig(MainConfig):
         default=None,  # Default to None to indicate no limit
         required=False,
     )
+    workers: Option[int] = Option(
+            'Number of worker processes extracting repositories in parallel.',
+            default=1)
+    checkout: Option[bool] = Option(
+            'Check out each revision in the clone. If disabled, role files are read from the git object database instead.',
+            default=True)
+    parse_cache: Option[bool] = Option(
+            'Cache parsed role files on disk, keyed by their content.',
+            default=False)
+    parse_cache_size: Option[int] = Option(
+            'Maximum size of the parsed role file cache, in MiB.',
+            default=1024)
+    storage_format: Option[str] = Option(
+            'File format to store the structural models in.',
+            click_type=click.Choice(['yaml', 'msgpack']), converter=str,
+            default='yaml')
+    incremental: Option[bool] = Option(
+            'Only extract revisions that are missing from the dataset and merge them into the stored models.',
+            default=False)
+    strict_validation: Option[bool] = Option(
+            'Validate each model with a full YAML dump rather than a check of the value types.',
+            default=False)
+
+
+class ExtractStructuralDiffsConfig(MainConfig):
+    """Configuration for structural diff extraction."""
+
+    workers: Option[int] = Option(
+            'Number of worker processes diffing roles in parallel.',
+            default=1)
+    pair_chunk_size: Option[int] = Option(
+            'Split roles with more revision pairs than this into chunks that are diffed in parallel.',
+            required=False)
+    strict_validation: Option[bool] = Option(
+            'Validate the diffs with a full YAML dump rather than a check of the value types.',
+            default=False)
+
+
+class ExtractTaskTableConfig(MainConfig):
+    """Configuration for the task table extraction."""
+
+    table_format: Option[str] = Option(
+            'File format to store the task table in.',
+            click_type=click.Choice(['parquet', 'feather']), converter=str,
+            default='parquet')
+
+
+def _script_paths(paths: str) -> List[Path]:
+    script_paths = []
+    for path in paths.split(','):
+        script_path = Path(path.strip()).resolve()
+        if not script_path.is_file():
+            raise click.BadParameter(f'Script {path} does not exist.', param_hint='--path')
+        script_paths.append(script_path)
+    return script_paths
+
 
 class DatamineConfig(MainConfig):
     """Configuration for datamining."""
@@ -103,8 +188,24 @@ class DatamineConfig(MainConfig):
         converter=lambda x: json.loads(x) if x else {}  # j ai modifié options pour que ca marche ceci convertit le json en dict
     )
     
-    path: Option[Path] = Option(
-        'Path to the algorithm script', click_type=click.Path(exists=True, readable=True, resolve_path=True),
-        converter=Path, required=True)
+    path: Option[List[Path]] = Option(
+        'Paths to the algorithm scripts, separated by commas. Scripts with a scan plugin share a single pass over the structural models.',
+        click_type=str, converter=_script_paths, required=True)
+
+    task_table: Option[bool] = Option(
+        'Run the scripts that support it on the task table of the extract-task-table stage.',
+        default=False)
+
+    workers: Option[int] = Option(
+        'Number of worker processes scanning shards of the structural models in parallel.',
+        default=1)
+
+    scan_cache: Option[bool] = Option(
+        'Cache the partial results of the scan plugins per file, so that reruns only scan changed files.',
+        default=True)
+
+    scan_cache_size: Option[int] = Option(
+        'Maximum size of the cache of partial scan results, in MiB.',
+        default=1024)
 
 
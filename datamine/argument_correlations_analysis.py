@@ -1,54 +1,55 @@
 import os
-import yaml
 import json
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
-from collections import defaultdict, Counter
-from typing import List, Optional, Dict, Any
+from collections import Counter
+from typing import List, Optional, Dict, Any, Set
 import shutil
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from datamine.models import ModuleArguments
-from pathlib import Path
-import json
+from datamine.argument_usage_analysis import arguments_per_module
+from pipeline.datamine import correlations, engine
 
-def process_common_args(yaml_files: List[str]) -> List[ModuleArguments]:
-    modules_args = defaultdict(list)
 
-    def process_yaml_file(file_path):
-        with open(file_path, "r") as file:
-            data = yaml.safe_load(file)
+class ArgumentsPerModule(engine.ScanPlugin[Dict[str, Set[str]], Dict[str, List[str]]]):
+    """Collect the arguments used with each module, in HEAD revisions."""
 
-            for role in data:
-                if isinstance(role, dict) and role.get('role_rev') == "HEAD":
-                    for task_file in role.get('role_root', {}).get('task_files', []):
-                        for task in task_file.get('content', []):
-                            for block in task.get('block', []):
-                                action = block.get('action')
-                                args = block.get('args', {})
-                                if action and isinstance(args, dict):
-                                    modules_args[action].extend(args.keys())
+    # The accumulators don't depend on the options.
+    accumulator_options = ()
 
-    for file_path in yaml_files:
-        process_yaml_file(file_path)
+    def new_accumulator(self) -> Dict[str, Set[str]]:
+        return {}
 
-    common_args_per_module = {module: list(set(args)) for module, args in modules_args.items()}
-    
-    return common_args_per_module
+    def visit(self, modules_args: Dict[str, Set[str]], model: engine.ScannedModel) -> None:
+        if not model.is_head:
+            return
+        for task in model.tasks:
+            action = task.get('action')
+            args = task.get('args', {})
+            if action and isinstance(args, dict):
+                modules_args.setdefault(action, set()).update(args.keys())
 
+    def merge(self, modules_args: Dict[str, Set[str]], other: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+        for module, args in other.items():
+            modules_args.setdefault(module, set()).update(args)
+        return modules_args
+
+    def finish(self, modules_args: Dict[str, Set[str]]) -> Dict[str, List[str]]:
+        return {module: list(args) for module, args in modules_args.items()}
+
+
+PLUGIN = ArgumentsPerModule
 
-def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
-    directory_path = os.path.join(config.output_directory, roles_dir_name)
 
-    if not os.path.exists(directory_path):
-        raise FileNotFoundError(f"Le répertoire '{directory_path}' n'existe pas.")
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, List[str]]:
+    return arguments_per_module(tasks)
 
-    yaml_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if f.endswith(".yaml")]
 
-    common_args_per_module = process_common_args(yaml_files)
-    return common_args_per_module
+def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
+    return engine.run_plugin(config, roles_dir_name, ArgumentsPerModule(options or {}))
 
 
 def store_results(common_args_per_module: List[ModuleArguments], config, filename):
@@ -57,25 +58,18 @@ def store_results(common_args_per_module: List[ModuleArguments], config, filenam
 
     num_arguments = config.options.get("num_arguments", 20) if config.options else 20
 
-    all_arguments = sorted(set(arg for args in common_args_per_module.values() for arg in args))
-
     arg_counter = Counter(arg for args in common_args_per_module.values() for arg in args)
     top_arguments = [arg for arg, _ in arg_counter.most_common(num_arguments)]
 
-    module_arg_matrix = {module: {arg: 0 for arg in top_arguments} for module in common_args_per_module}
-
-    for module, args in common_args_per_module.items():
-        for arg in args:
-            if arg in top_arguments:  
-                module_arg_matrix[module][arg] = 1
-
-    df = pd.DataFrame.from_dict(module_arg_matrix, orient="index")
-
-    if df.shape[1] < 2:
+    if len(top_arguments) < 2:
         print("not enough")
         return
 
-    correlation_matrix = df.corr().fillna(0)
+    module_arg_matrix = correlations.incidence_matrix(common_args_per_module.values(), top_arguments, binary=True)
+
+    correlation_matrix = pd.DataFrame(
+        correlations.correlation_matrix(module_arg_matrix), index=top_arguments, columns=top_arguments
+    ).fillna(0)
 
     print("Argument correlation matrix:\n", correlation_matrix)
 
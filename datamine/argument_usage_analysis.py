@@ -1,63 +1,63 @@
-import os
-import yaml
 import json
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
-from collections import defaultdict, Counter
-from typing import List, Optional, Dict, Any
+from collections import Counter
+from typing import List, Optional, Dict, Any, Set
 import shutil
-import sys
 from datamine.models import ModuleArguments
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from data.my_dataset.test1 import algo as extract_roles
+from models.datamine.tasks import plugin_tasks
+from pipeline.datamine import engine
 import attr
 
-def process_common_args(yaml_files: List[str]) -> List[ModuleArguments]:
-    # Dictionary to collect all arguments used per module
-    modules_args = defaultdict(list)
 
-    def process_yaml_file(file_path):
-        with open(file_path, "r") as file:
-            data = yaml.safe_load(file)
+class ArgumentUsage(engine.ScanPlugin[Dict[str, Set[str]], List[ModuleArguments]]):
+    """Collect the arguments used with each module, in HEAD revisions."""
 
-            for role in data:
-                # Process roles with revision "HEAD" only
-                if isinstance(role, dict) and role.get('role_rev') == "HEAD":
-                    for task_file in role.get('role_root', {}).get('task_files', []):
-                        for task in task_file.get('content', []):
-                            for block in task.get('block', []):
-                                action = block.get('action')
-                                args = block.get('args', {})
-                                # Collect argument keys if present
-                                if action and isinstance(args, dict):
-                                    modules_args[action].extend(args.keys())
+    # The accumulators don't depend on the options.
+    accumulator_options = ()
 
-    # Process each YAML file provided
-    for file_path in yaml_files:
-        process_yaml_file(file_path)
+    def new_accumulator(self) -> Dict[str, Set[str]]:
+        return {}
 
-    # Identify unique arguments per module
-    common_args_per_module = {module: list(set(args)) for module, args in modules_args.items()}
+    def visit(self, modules_args: Dict[str, Set[str]], model: engine.ScannedModel) -> None:
+        if not model.is_head:
+            return
+        for task in model.tasks:
+            action = task.get('action')
+            args = task.get('args', {})
+            # Collect argument keys if present
+            if action and isinstance(args, dict):
+                modules_args.setdefault(action, set()).update(args.keys())
 
-    return [ModuleArguments(module=mod, common_args=args) for mod, args in common_args_per_module.items()]
+    def merge(self, modules_args: Dict[str, Set[str]], other: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+        for module, args in other.items():
+            modules_args.setdefault(module, set()).update(args)
+        return modules_args
 
+    def finish(self, modules_args: Dict[str, Set[str]]) -> List[ModuleArguments]:
+        return [ModuleArguments(module=mod, common_args=list(args)) for mod, args in modules_args.items()]
+
+
+PLUGIN = ArgumentUsage
 
-def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
-    directory_path = os.path.join(config.output_directory, roles_dir_name)
 
-    # Check if the directory exists
-    if not os.path.exists(directory_path):
-        raise FileNotFoundError(f"Le répertoire '{directory_path}' n'existe pas.")
+def arguments_per_module(tasks: pd.DataFrame) -> Dict[str, List[str]]:
+    """Collect the arguments used with each module in HEAD revisions, from the task table."""
+    tasks = plugin_tasks(tasks, head_only=True)
+    tasks = tasks[tasks['arg_keys'].notna()]
+    arg_keys = tasks[['action', 'arg_keys']].explode('arg_keys').dropna(subset=['arg_keys'])
+    args_per_module = arg_keys.groupby('action', sort=False, observed=True)['arg_keys'].unique()
+    return {module: list(args_per_module.get(module, ())) for module in tasks['action'].unique()}
 
-    # Retrieve YAML files from the specified directory
-    yaml_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if f.endswith(".yaml")]
 
-    # Process YAML files to extract common arguments
-    common_args_results = process_common_args(yaml_files)
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> List[ModuleArguments]:
+    return [ModuleArguments(module=mod, common_args=args) for mod, args in arguments_per_module(tasks).items()]
 
-    return common_args_results
+
+def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
+    return engine.run_plugin(config, roles_dir_name, ArgumentUsage(options or {}))
 
 
 def store_results(common_args_results: List[ModuleArguments], config, filename):
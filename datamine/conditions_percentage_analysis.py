@@ -1,51 +1,67 @@
 from collections import Counter, defaultdict
 import os
-import yaml
+from typing import Any, Dict, Tuple
 import matplotlib.pyplot as plt
+import pandas as pd
+from models.datamine.tasks import plugin_tasks
+from pipeline.datamine import engine
+
+# Nombre total d'apparitions et nombre d'utilisations de 'when' par module
+WhenCounts = Tuple[Counter, Counter]
+
+
+class ConditionsPercentage(engine.ScanPlugin[WhenCounts, Dict[str, float]]):
+    """Analyse l'utilisation de 'when' pour chaque module et garde les modules les plus conditionnés."""
+
+    # Les options ne servent qu'au calcul du résultat final.
+    accumulator_options = ()
+
+    def new_accumulator(self) -> WhenCounts:
+        return Counter(), Counter()
+
+    def visit(self, acc: WhenCounts, model: engine.ScannedModel) -> None:
+        module_total_counts, module_when_counts = acc
+        for task in model.tasks:
+            action = task.get('action')
+            if action:
+                module_total_counts[action] += 1  # Compte chaque apparition du module
+                if 'when' in task:
+                    module_when_counts[action] += 1  # Compte les cas où 'when' est utilisé
+
+    def merge(self, acc: WhenCounts, other: WhenCounts) -> WhenCounts:
+        acc[0].update(other[0])
+        acc[1].update(other[1])
+        return acc
+
+    def finish(self, acc: WhenCounts) -> Dict[str, float]:
+        module_total_counts, module_when_counts = acc
+        num_modules = self.options.get("num_modules", 25)
+
+        # Calculer le pourcentage d'utilisation de "when" pour chaque module
+        module_when_percentages = {
+            module: (module_when_counts[module] / module_total_counts[module]) * 100
+            for module in module_total_counts if module_total_counts[module] > 0
+        }
+
+        # Trier les modules par pourcentage décroissant et garder les top `num_modules`
+        sorted_modules = sorted(module_when_percentages.items(), key=lambda x: x[1], reverse=True)[:num_modules]
+
+        return dict(sorted_modules)
+
+
+PLUGIN = ConditionsPercentage
+
+
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, float]:
+    """Garde les modules les plus conditionnés, à partir du tableau des tâches."""
+    percentages = plugin_tasks(tasks).groupby('action', sort=False, observed=True)['has_when'].mean() * 100
+    top_modules = percentages.sort_values(ascending=False, kind='stable').head(options.get("num_modules", 25))
+    return {module: float(percentage) for module, percentage in top_modules.items()}
+
 
 def algo(config, roles_dir_name: str, options=None):
     """Analyse l'utilisation de 'when' pour chaque module et affiche les modules les plus utilisés."""
-    
-    num_modules = options.get("num_modules", 25) if options else 25
-    roles_directory_path = os.path.join(config.output_directory, roles_dir_name)  
-    module_when_counts = Counter()  # Nombre de fois où 'when' est utilisé par module
-    module_total_counts = Counter()  # Nombre total d'apparitions du module
-
-    if not os.path.exists(roles_directory_path):
-        raise FileNotFoundError(f"Roles directory '{roles_directory_path}' does not exist.")
-
-    def process_yaml_file(file_path):
-        """Parcourt un fichier YAML et met à jour les statistiques des modules."""
-        with open(file_path, 'r') as file:
-            data = yaml.safe_load(file)
-            for role in data:
-                if isinstance(role, dict):
-                    task_files = role.get('role_root', {}).get('task_files', [])
-                    for task_file in task_files:
-                        tasks = task_file.get('content', [])
-                        for task in tasks:
-                            for block in task.get('block', []):
-                                action = block.get('action')
-                                if action:
-                                    module_total_counts[action] += 1  # Compte chaque apparition du module
-                                    if 'when' in block:
-                                        module_when_counts[action] += 1  # Compte les cas où 'when' est utilisé
-
-    # Parcourir tous les fichiers YAML dans le répertoire
-    for filename in os.listdir(roles_directory_path):
-        if filename.endswith(".yaml"):
-            process_yaml_file(os.path.join(roles_directory_path, filename))
-
-    # Calculer le pourcentage d'utilisation de "when" pour chaque module
-    module_when_percentages = {
-        module: (module_when_counts[module] / module_total_counts[module]) * 100
-        for module in module_total_counts if module_total_counts[module] > 0
-    }
-
-    # Trier les modules par pourcentage décroissant et garder les top `num_modules`
-    sorted_modules = sorted(module_when_percentages.items(), key=lambda x: x[1], reverse=True)[:num_modules]
-
-    return dict(sorted_modules)
+    return engine.run_plugin(config, roles_dir_name, ConditionsPercentage(options or {}))
 
 
 def store_results(results, config, filename):
@@ -1,5 +1,3 @@
-import os
-import yaml
 import json
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -10,79 +8,64 @@ from typing import List, Dict, Optional, Any
 import re
 import attr
 from datamine.models import ModuleConditions
+from models.datamine.tasks import plugin_tasks
+from pipeline.datamine import engine
 
 
-def process_module_conditions(yaml_files: List[str]) -> List[ModuleConditions]:
-    module_conditions = defaultdict(list)
-    i = 0  # Initialisation de la variable i pour suivre les itérations
+class ModuleConditionsUsage(engine.ScanPlugin[Dict[str, list], Optional[List[ModuleConditions]]]):
+    """Collecte les conditions `when` de chaque module, dans les révisions HEAD."""
 
-    def process_yaml_file(file_path):
-        nonlocal i  # Pour accéder à la variable i dans la fonction interne
+    # Les accumulateurs ne dépendent pas des options.
+    accumulator_options = ()
 
-        with open(file_path, "r") as file:
-            data = yaml.safe_load(file)
+    def new_accumulator(self) -> Dict[str, list]:
+        return {}
 
-            if not data:
-                print(f" Le fichier {file_path} est vide ou mal formé, ignoré.")
-                return
+    def visit(self, module_conditions: Dict[str, list], model: engine.ScannedModel) -> None:
+        if not model.is_head:
+            return
+        for task in model.tasks:
+            module = task.get('action')
+            condition = task.get('when')
 
-            for role in data:
-                if isinstance(role, dict) and role.get('role_rev') == "HEAD":
-                    i += 1  # Incrémentation de i à chaque traitement d'un rôle
-                    print(f"Traitement du rêle {i}")
-                    for task_file in role.get('role_root', {}).get('task_files', []):
-                        for task in task_file.get('content', []):
-                            for block in task.get('block', []):
-                                module = block.get('action')
-                                condition = block.get('when')
+            if module and condition:
+                if isinstance(condition, list):
+                    module_conditions.setdefault(module, []).extend(condition)
+                else:
+                    module_conditions.setdefault(module, []).append(condition)
 
-                                if module and condition:
-                                    if isinstance(condition, list):
-                                        module_conditions[module].extend(condition)
-                                    else:
-                                        module_conditions[module].append(condition)
+    def merge(self, module_conditions: Dict[str, list], other: Dict[str, list]) -> Dict[str, list]:
+        for module, conditions in other.items():
+            module_conditions.setdefault(module, []).extend(conditions)
+        return module_conditions
 
-    for file in yaml_files:
-        process_yaml_file(file)
+    def finish(self, module_conditions: Dict[str, list]) -> Optional[List[ModuleConditions]]:
+        if not module_conditions:
+            print("Aucun module avec condition `when` trouvé.")
+            return None
 
-    # Debugging: Afficher le contenu de `module_conditions` avant de passer à la création des `ModuleConditions`
-    print("=== Debug: Contenu des conditions avant transformation ===")
-    for mod, conds in module_conditions.items():
-        print(f"Module: {mod}, Conditions: {conds}")
-
-    try:
         return [
             ModuleConditions(module=mod, conditions=list(set([json.dumps(cond) if isinstance(cond, dict) else cond for cond in conds])))
             for mod, conds in module_conditions.items()
         ]
-    except Exception as e:
-        print("Une erreur s'est produite lors de la création des ModuleConditions:")
-        print(e)
-        # Affichage détaillé de chaque condition et de son type
-        for mod, conds in module_conditions.items():
-            for cond in conds:
-                print(f"Condition: {cond}, Type de condition: {type(cond)}")
-        raise  # Relancer l'exception pour qu'elle soit traitée en amont
-
 
 
-def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
-    directory_path = os.path.join(config.output_directory, roles_dir_name)
-
-    if not os.path.exists(directory_path):
-        raise FileNotFoundError(f"Le répertoire '{directory_path}' n'existe pas.")
+PLUGIN = ModuleConditionsUsage
 
-    yaml_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if f.endswith(".yaml")]
 
-    module_conditions = process_module_conditions(yaml_files)
-
-    if not module_conditions:
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> Optional[List[ModuleConditions]]:
+    """Collecte les conditions `when` de chaque module dans les révisions HEAD, à partir du tableau des tâches."""
+    conditions = plugin_tasks(tasks, head_only=True)[['action', 'when']].explode('when').dropna(subset=['when'])
+    if conditions.empty:
         print("Aucun module avec condition `when` trouvé.")
-        return
+        return None
+
+    conditions_per_module = conditions.groupby('action', sort=False, observed=True)['when'].unique()
+    return [ModuleConditions(module=mod, conditions=list(conds)) for mod, conds in conditions_per_module.items()]
 
-    #store_results(module_conditions, config, "Datamine")
 
-    return module_conditions
+def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
+    return engine.run_plugin(config, roles_dir_name, ModuleConditionsUsage(options or {}))
 
 def split_conditions(condition: str) -> Dict[str, List[str]]:
     condition = str(condition).strip()
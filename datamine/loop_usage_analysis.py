@@ -4,60 +4,60 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
-from collections import defaultdict
 from typing import Any, Dict, List, Optional
 import sys
-import yaml
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from data.my_dataset.test1 import algo as extract_roles
-from pathlib import Path
-import json
-import sys
 sys.path.append(os.path.dirname(os.path.abspath('.')))
 from datamine.models import LoopUsage
+from models.datamine.tasks import plugin_tasks
+from pipeline.datamine import engine
 
 
-def process_loop_usage(yaml_files: List[str]) -> List[LoopUsage]:
-    """Process YAML files to calculate loop usage percentage for each module."""
-    loop_usage = defaultdict(lambda: [0, 0])  # Dictionary to store total actions and actions using loops
+class LoopUsagePerModule(engine.ScanPlugin[Dict[str, List[int]], List[LoopUsage]]):
+    """Calculate the loop usage percentage of each module, in HEAD revisions."""
 
-    def process_yaml_file(file_path):
-        with open(file_path, 'r') as file:
-            data = yaml.safe_load(file)  # Load YAML content
+    # The accumulators don't depend on the options.
+    accumulator_options = ()
 
-            for role in data:
-                if isinstance(role, dict) and role.get('role_rev') == "HEAD":
-                    for task_file in role.get('role_root', {}).get('task_files', []):
-                        for task in task_file.get('content', []):
-                            for block in task.get('block', []):
-                                action = block.get('action')
-                                if action:
-                                    loop_usage[action][0] += 1  # Increment total action count
-                                    if 'loop' in block:
-                                        loop_usage[action][1] += 1  # Increment loop count for the action
+    def new_accumulator(self) -> Dict[str, List[int]]:
+        # Total actions and actions using loops
+        return {}
 
-    # Process each YAML file
-    for yaml_file in yaml_files:
-        process_yaml_file(yaml_file)
+    def visit(self, loop_usage: Dict[str, List[int]], model: engine.ScannedModel) -> None:
+        if not model.is_head:
+            return
+        for task in model.tasks:
+            action = task.get('action')
+            if action:
+                counts = loop_usage.setdefault(action, [0, 0])
+                counts[0] += 1  # Increment total action count
+                if 'loop' in task:
+                    counts[1] += 1  # Increment loop count for the action
 
-    # Calculate loop usage percentage per module
-    loop_usage_results = []
-    for module, (total, looped) in loop_usage.items():
-        percentage = (loop_usage[module][1] / loop_usage[module][0]) * 100 if loop_usage[module][0] > 0 else 0
-        loop_usage_results.append(LoopUsage(module=module, loop_percentage=percentage))
+    def merge(self, loop_usage: Dict[str, List[int]], other: Dict[str, List[int]]) -> Dict[str, List[int]]:
+        for action, (total, looped) in other.items():
+            counts = loop_usage.setdefault(action, [0, 0])
+            counts[0] += total
+            counts[1] += looped
+        return loop_usage
 
-    return loop_usage_results
+    def finish(self, loop_usage: Dict[str, List[int]]) -> List[LoopUsage]:
+        # Calculate loop usage percentage per module
+        return [
+            LoopUsage(module=module, loop_percentage=(looped / total) * 100 if total > 0 else 0)
+            for module, (total, looped) in loop_usage.items()]
 
 
-def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
-    directory_path = os.path.join(config.output_directory, roles_dir_name)
+PLUGIN = LoopUsagePerModule
+
 
-    if not os.path.exists(directory_path):
-        raise FileNotFoundError(f"Directory '{directory_path}' does not exist.")
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> List[LoopUsage]:
+    """Calculate the loop usage percentage of each module in HEAD revisions, from the task table."""
+    loops = plugin_tasks(tasks, head_only=True).groupby('action', sort=False, observed=True)['has_loop'].mean() * 100
+    return [LoopUsage(module=module, loop_percentage=float(percentage)) for module, percentage in loops.items()]
 
-    yaml_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if f.endswith(".yaml")]
 
-    loop_usage_results = process_loop_usage(yaml_files)
+def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
+    loop_usage_results = engine.run_plugin(config, roles_dir_name, LoopUsagePerModule(options or {}))
 
     store_results(loop_usage_results, config, "LoopUsageAnalysis")
 
@@ -10,7 +10,14 @@ import matplotlib.pyplot as plt
 import util
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from datamine.module_usage_analysis import algo as extract_roles
+from datamine import module_usage_analysis
+from datamine.module_usage_analysis import ModuleUsage, algo as extract_roles
+from pipeline.datamine import correlations
+
+# The correlations are computed from the module usage when storing the results.
+PLUGIN = ModuleUsage
+# Re-exported, so that the datamine stage runs it on the task table.
+table_algo = module_usage_analysis.table_algo
 
 
 def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
@@ -37,28 +44,21 @@ def store_results(results, config, filename) -> None:
     # Select top N most used modules
     top_modules = [module for module, _ in module_usage_count.most_common(num_modules)]
 
-    # Initialize the module usage matrix for each role
-    module_usage_matrix = {role_id: {module: 0 for module in top_modules} for role_id in modules_per_role}
-
-    # Fill the module usage matrix
-    for role_id, modules in modules_per_role.items():
-        for module in modules:
-            if module in top_modules:
-                module_usage_matrix[role_id][module] += 1
+    # Build the sparse module usage matrix, with a row for each role
+    module_usage_matrix = correlations.incidence_matrix(modules_per_role.values(), top_modules)
 
     # Export the module usage matrix to a CSV file
     output_file = os.path.join(config.output_directory, filename, "modules_par_role.csv")
     with open(output_file, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(["Role"] + top_modules)
-        for role_id, module_counts in module_usage_matrix.items():
-            writer.writerow([role_id] + [module_counts[module] for module in top_modules])
+        for role_id, module_counts in zip(modules_per_role, module_usage_matrix.tocsr().astype(int)):
+            writer.writerow([role_id] + module_counts.toarray().ravel().tolist())
 
     print(f"Module usage matrix saved to {output_file}.")
 
-    # Read the CSV file into a DataFrame to compute the correlation matrix
-    df = pd.read_csv(output_file, index_col=0)
-    correlation_matrix = df.corr()
+    correlation_matrix = pd.DataFrame(
+        correlations.correlation_matrix(module_usage_matrix), index=top_modules, columns=top_modules)
 
     # Generate and save a heatmap visualization of the correlation matrix
     plt.figure(figsize=(12, 10))
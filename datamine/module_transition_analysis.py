@@ -10,7 +10,8 @@ import shutil
 import sys
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from datamine.module_usage_analysis import algo as extract_roles
+from datamine.module_usage_analysis import ModuleUsage, table_algo as roles_table_algo
+from pipeline.datamine import engine
 
 
 def process_transitions(df: pd.DataFrame, threshold: float = 0.05) -> pd.DataFrame:
@@ -22,11 +23,7 @@ def process_transitions(df: pd.DataFrame, threshold: float = 0.05) -> pd.DataFra
     return transition_matrix
 
 
-def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
-    num_modules = options.get("num_modules", 20) if options else 20
-
-    results = extract_roles(config, roles_dir_name, options)
-
+def build_transition_matrix(results) -> pd.DataFrame:
     modules_per_role = defaultdict(list)
     module_transitions = defaultdict(Counter)
 
@@ -56,6 +53,24 @@ def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
     return transition_matrix_normalized
 
 
+class ModuleTransitions(ModuleUsage):
+    """Compute the transition matrix between the modules used by the roles."""
+
+    def finish(self, acc) -> pd.DataFrame:
+        return build_transition_matrix(super().finish(acc))
+
+
+PLUGIN = ModuleTransitions
+
+
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> pd.DataFrame:
+    return build_transition_matrix(roles_table_algo(tasks, options))
+
+
+def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
+    return engine.run_plugin(config, roles_dir_name, ModuleTransitions(options or {}))
+
+
 def filter_top_modules(transition_matrix: pd.DataFrame, num_modules: int = 20) -> pd.DataFrame:
     """Filter the transition matrix to retain only the top N most-used modules."""
     module_usage = transition_matrix.sum(axis=1) + transition_matrix.sum(axis=0)
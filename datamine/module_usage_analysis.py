@@ -4,67 +4,80 @@ from collections import Counter, defaultdict
 import csv
 import os
 
-import yaml
+import pandas as pd
 
 from models.datamine.roles import Module, MostUsedRoles
+from models.datamine.tasks import plugin_tasks
+from pipeline.datamine import engine
 
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
 import util
 
+# Modules used per role, and the number of selected revisions per role.
+ModuleUsageAcc = Tuple[Dict[str, Counter], Counter]
+
+
+class ModuleUsage(engine.ScanPlugin[ModuleUsageAcc, List[MostUsedRoles]]):
+    """Count the modules used by each role."""
+
+    # The accumulators don't depend on the options.
+    accumulator_options = ()
+
+    def new_accumulator(self) -> ModuleUsageAcc:
+        return {}, Counter()
+
+    def visit(self, acc: ModuleUsageAcc, model: engine.ScannedModel) -> None:
+        modules_per_role, role_ids = acc
+        # Besides HEAD, the revision before the last one of a file is used.
+        if not (model.is_head or model.position + 2 == model.num_revisions):
+            return
+        role_ids[model.role_id] += 1
+        for task in model.tasks:
+            action = task.get('action')
+            if action:
+                modules_per_role.setdefault(model.role_id, Counter())[action] += 1
+
+    def merge(self, acc: ModuleUsageAcc, other: ModuleUsageAcc) -> ModuleUsageAcc:
+        modules_per_role, role_ids = acc
+        for role_id, actions in other[0].items():
+            modules_per_role.setdefault(role_id, Counter()).update(actions)
+        role_ids.update(other[1])
+        return acc
+
+    def finish(self, acc: ModuleUsageAcc) -> List[MostUsedRoles]:
+        modules_per_role, role_counts = acc
+        duplicated_roles = {role_id: count for role_id, count in role_counts.items() if count > 1}
+
+        if duplicated_roles:
+            print("Rôles dupliqués détectés :", duplicated_roles)
+
+        most_used_roles = []
+        for role_id, actions in modules_per_role.items():
+            modules = [Module(name=action, uses=count) for action, count in actions.items()]
+            most_used_roles.append(MostUsedRoles(name=role_id, modules=modules))
+
+        return most_used_roles
+
+
+PLUGIN = ModuleUsage
+
+
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> List[MostUsedRoles]:
+    """Count the modules used by each role, from the task table."""
+    # Besides HEAD, the revision before the last one of a file is used.
+    tasks = tasks[(tasks['role_rev'] == 'HEAD') | (tasks['position'] + 2 == tasks['num_revisions'])]
+    counts = plugin_tasks(tasks).groupby(['role_id', 'action'], sort=False, observed=True).size()
+    modules_per_role: Dict[str, List[Module]] = {}
+    for (role_id, action), count in counts.items():
+        modules_per_role.setdefault(role_id, []).append(Module(name=action, uses=int(count)))
+    return [MostUsedRoles(name=role_id, modules=modules) for role_id, modules in modules_per_role.items()]
+
+
 def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
     """Go over each role and read the YAML files obtained from the previous stage."""
-    roles_directory_path = os.path.join(config.output_directory, roles_dir_name)  
-    modules_per_role = defaultdict(lambda: Counter())
-    role_ids = []
-
-    if not os.path.exists(roles_directory_path):
-        raise FileNotFoundError(f"Roles directory '{roles_directory_path}' does not exist.")
-
-    def process_yaml_file(file_path):
-        with open(file_path, 'r') as file:
-            data = yaml.safe_load(file)
-            inc = 1
-
-            for role in data:
-                if isinstance(role, dict):
-                    role_id = role.get('role_id')
-                    print(f"Traitement du rôle avec ID : {role_id}")
-                    inc += 1
-                    role_rev = role.get('role_rev')
-                    task_files = role.get('role_root', {}).get('task_files', [])
-
-                    if role_rev == "HEAD" or inc == len(data):
-                        role_ids.append(role_id)
-
-                        for task_file in task_files:
-                            tasks = task_file.get('content', [])
-                            for task in tasks:
-                                for block in task.get('block', []):
-                                    action = block.get('action')
-                                    if action:
-                                        modules_per_role[role_id][action] += 1
-                else:
-                    print(f"Fichier '{file_path}' à vérifier : {role}")
-                    print(f"Nom du fichier qui pose problème : {file_path}")
-
-    for filename in os.listdir(roles_directory_path):
-        if filename.endswith(".yaml"):
-            process_yaml_file(os.path.join(roles_directory_path, filename))
-
-    role_counts = Counter(role_ids)
-    duplicated_roles = {role_id: count for role_id, count in role_counts.items() if count > 1}
-
-    if duplicated_roles:
-        print("Rôles dupliqués détectés :", duplicated_roles)
-
-    most_used_roles = []
-    for role_id, actions in modules_per_role.items():
-        modules = [Module(name=action, uses=count) for action, count in actions.items()]
-        most_used_roles.append(MostUsedRoles(name=role_id, modules=modules))
-
-    return most_used_roles
+    return engine.run_plugin(config, roles_dir_name, ModuleUsage(options or {}))
     
 def store_results(results, config, filename) -> None:
     """Store the results of a stage in the dataset."""
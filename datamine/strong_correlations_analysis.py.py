@@ -10,59 +10,59 @@ import sys
 import shutil
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from data.my_dataset.test1 import algo as extract_roles  
+from datamine.module_usage_analysis import ModuleUsage, table_algo as roles_table_algo
+from pipeline.datamine import correlations, engine
 
 from datamine.models import StrongCorrelation
 
 
-def process_strong_correlations(df: pd.DataFrame, threshold: float = 0.6) -> List[StrongCorrelation]:
-    correlation_matrix = df.corr()
-    correlations = []
+def process_strong_correlations(usage, modules: List[str], threshold: float = 0.6) -> List[StrongCorrelation]:
+    """Trouve les paires de modules dont l'utilisation est fortement corrélée.
 
-    for module_a in correlation_matrix.columns:
-        for module_b in correlation_matrix.columns:
-            if module_a != module_b:
-                correlation_value = correlation_matrix.loc[module_a, module_b]
-
-                if abs(correlation_value) >= threshold:
-                    correlations.append(StrongCorrelation(
-                        module_a=module_a,
-                        module_b=module_b,
-                        correlation=correlation_value
-                    ))
-
-    return correlations
-
-
-def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
-    directory_path = os.path.join(config.output_directory, roles_dir_name)
-
-    if not os.path.exists(directory_path):
-        raise FileNotFoundError(f"Le répertoire '{directory_path}' n'existe pas.")
+    `usage` est la matrice creuse des utilisations, avec une ligne par rôle et
+    une colonne par module de `modules`.
+    """
+    firsts, seconds, values = correlations.strong_correlations(usage, threshold)
+    return [
+        StrongCorrelation(module_a=modules[first], module_b=modules[second], correlation=value)
+        for first, second, value in zip(firsts.tolist(), seconds.tolist(), values.tolist())
+    ]
 
-    results = extract_roles(config, roles_dir_name, options)
 
+def find_strong_correlations(results) -> List[StrongCorrelation]:
     modules_per_role = defaultdict(list)
     for role in results:
         modules_per_role[role.name] = [module.name for module in role.modules]
 
     all_modules = sorted(set(module for modules in modules_per_role.values() for module in modules))
 
-    module_usage_matrix = {role_id: {module: 0 for module in all_modules} for role_id in sorted(modules_per_role.keys())}
-    
-    for role_id, modules in modules_per_role.items():
-        for module in modules:
-            module_usage_matrix[role_id][module] += 1
+    module_usage_matrix = correlations.incidence_matrix(modules_per_role.values(), all_modules)
 
-    df = pd.DataFrame.from_dict(module_usage_matrix, orient="index")
-
-    strong_correlations = process_strong_correlations(df, threshold=0.6)
+    strong_correlations = process_strong_correlations(module_usage_matrix, all_modules, threshold=0.6)
 
     #store_results(strong_correlations, config, "StrongModuleCorrelations")
 
     return strong_correlations
 
 
+class StrongCorrelations(ModuleUsage):
+    """Find the modules whose usage across roles is strongly correlated."""
+
+    def finish(self, acc) -> List[StrongCorrelation]:
+        return find_strong_correlations(super().finish(acc))
+
+
+PLUGIN = StrongCorrelations
+
+
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> List[StrongCorrelation]:
+    return find_strong_correlations(roles_table_algo(tasks, options))
+
+
+def algo(config, roles_dir_name: str, options: Optional[Dict[str, Any]] = None):
+    return engine.run_plugin(config, roles_dir_name, StrongCorrelations(options or {}))
+
+
 def filter_top_correlations(strong_correlations: List[StrongCorrelation], top_n: int = 20) -> pd.DataFrame:
     """Filtre la matrice de corrélation pour ne garder que les 25 corrélations les plus fortes."""
     if not strong_correlations:
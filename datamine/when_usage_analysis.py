@@ -1,48 +1,63 @@
-from collections import Counter, defaultdict
+from collections import Counter
 import os
-import yaml
+from typing import Any, Dict, Tuple
 import matplotlib.pyplot as plt
+import pandas as pd
+from models.datamine.tasks import plugin_tasks
+from pipeline.datamine import engine
 
-def algo(config, roles_dir_name: str, options=None):
+# Total uses and uses with 'when' per module
+WhenCounts = Tuple[Counter, Counter]
+
+
+class WhenUsage(engine.ScanPlugin[WhenCounts, Dict[str, float]]):
     """Analyse l'utilisation de 'when' pour chaque module des modules les plus utilisés."""
-    num_modules = options.get("num_modules", 20) if options else 20
-    roles_directory_path = os.path.join(config.output_directory, roles_dir_name)  
-    modules_per_role = defaultdict(lambda: Counter())
-    module_when_counts = Counter()
-    module_total_counts = Counter()
-    
-    if not os.path.exists(roles_directory_path):
-        raise FileNotFoundError(f"Roles directory '{roles_directory_path}' does not exist.")
-
-    def process_yaml_file(file_path):
-        with open(file_path, 'r') as file:
-            data = yaml.safe_load(file)
-            for role in data:
-                if isinstance(role, dict):
-                    task_files = role.get('role_root', {}).get('task_files', [])
-                    for task_file in task_files:
-                        tasks = task_file.get('content', [])
-                        for task in tasks:
-                            for block in task.get('block', []):
-                                action = block.get('action')
-                                if action:
-                                    modules_per_role[role.get('role_id')][action] += 1
-                                    module_total_counts[action] += 1
-                                    if 'when' in block:
-                                        module_when_counts[action] += 1
-    
-    for filename in os.listdir(roles_directory_path):
-        if filename.endswith(".yaml"):
-            process_yaml_file(os.path.join(roles_directory_path, filename))
 
-    # Trier les modules les plus utilisés
-    most_used_modules = [module for module, _ in module_total_counts.most_common(num_modules)]
-    
-    # Calculer le pourcentage d'utilisation de "when"
-    module_when_percentages = {module: (module_when_counts[module] / module_total_counts[module]) * 100 
-                               for module in most_used_modules if module_total_counts[module] > 0}
-    
-    return module_when_percentages
+    # Les options ne servent qu'au calcul du résultat final.
+    accumulator_options = ()
+
+    def new_accumulator(self) -> WhenCounts:
+        return Counter(), Counter()
+
+    def visit(self, acc: WhenCounts, model: engine.ScannedModel) -> None:
+        module_total_counts, module_when_counts = acc
+        for task in model.tasks:
+            action = task.get('action')
+            if action:
+                module_total_counts[action] += 1
+                if 'when' in task:
+                    module_when_counts[action] += 1
+
+    def merge(self, acc: WhenCounts, other: WhenCounts) -> WhenCounts:
+        acc[0].update(other[0])
+        acc[1].update(other[1])
+        return acc
+
+    def finish(self, acc: WhenCounts) -> Dict[str, float]:
+        module_total_counts, module_when_counts = acc
+        num_modules = self.options.get("num_modules", 20)
+
+        # Trier les modules les plus utilisés
+        most_used_modules = [module for module, _ in module_total_counts.most_common(num_modules)]
+
+        # Calculer le pourcentage d'utilisation de "when"
+        return {module: (module_when_counts[module] / module_total_counts[module]) * 100
+                for module in most_used_modules if module_total_counts[module] > 0}
+
+
+PLUGIN = WhenUsage
+
+
+def table_algo(tasks: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, float]:
+    """Analyse l'utilisation de 'when' des modules les plus utilisés, à partir du tableau des tâches."""
+    counts = plugin_tasks(tasks).groupby('action', sort=False, observed=True)['has_when'].agg(['size', 'mean'])
+    most_used_modules = counts.sort_values('size', ascending=False, kind='stable').head(options.get("num_modules", 20))
+    return {module: float(percentage) for module, percentage in (most_used_modules['mean'] * 100).items()}
+
+
+def algo(config, roles_dir_name: str, options=None):
+    """Analyse l'utilisation de 'when' pour chaque module des modules les plus utilisés."""
+    return engine.run_plugin(config, roles_dir_name, WhenUsage(options or {}))
 
 def store_results(results, config, filename):
     """Stocke et visualise les résultats de l'analyse."""
@@ -0,0 +1,147 @@
+"""Flat table of the tasks of the structural models."""
+from typing import Any, Dict, List, Mapping, Sequence
+
+import json
+from pathlib import Path
+
+import attr
+import pandas as pd
+
+from models.base import Model
+
+# Suffix of each file format the table can be stored in. Both need pyarrow.
+TABLE_FORMATS: Dict[str, str] = {'parquet': '.parquet', 'feather': '.feather'}
+DEFAULT_TABLE_FORMAT = 'parquet'
+
+_CATEGORY_COLUMNS = ('role_id', 'role_rev', 'file_name', 'action')
+_BLOCK_CONTAINERS = ('block', 'rescue', 'always')
+
+
+def _condition_str(condition: Any) -> str:
+    return condition if isinstance(condition, str) else json.dumps(condition)
+
+
+class TaskTableBuilder:
+    """Collect the tasks of unstructured models into the columns of a table."""
+
+    def __init__(self) -> None:
+        self._columns: Dict[str, List[Any]] = {
+                'role_id': [], 'role_rev': [], 'position': [],
+                'num_revisions': [], 'file_name': [], 'block_path': [],
+                'top_level': [], 'action': [], 'arg_keys': [],
+                'has_when': [], 'when': [], 'has_loop': []}
+
+    def add_file(self, models: Sequence[Mapping[str, Any]]) -> None:
+        """Add the models stored in a single StructuralModels file."""
+        for position, model in enumerate(models):
+            model_cols = (
+                    model.get('role_id'), model.get('role_rev'), position,
+                    len(models))
+            task_files = (model.get('role_root') or {}).get('task_files') or []
+            for task_file in task_files:
+                for idx, block in enumerate(task_file.get('content') or []):
+                    self._add_block(
+                            model_cols, task_file.get('file_name'), block,
+                            str(idx), top_level=True)
+
+    def _add_block(
+            self, model_cols: tuple, file_name: str,
+            block: Mapping[str, Any], path: str, top_level: bool
+    ) -> None:
+        for cont_name in _BLOCK_CONTAINERS:
+            in_top_block = top_level and cont_name == 'block'
+            for idx, child in enumerate(block.get(cont_name) or []):
+                child_path = f'{path}.{cont_name}.{idx}'
+                if 'block' in child:
+                    self._add_block(model_cols, file_name, child, child_path, False)
+                else:
+                    self._add_task(model_cols, file_name, child, child_path, in_top_block)
+
+    def _add_task(
+            self, model_cols: tuple, file_name: str, task: Mapping[str, Any],
+            path: str, top_level: bool
+    ) -> None:
+        cols = self._columns
+        role_id, role_rev, position, num_revisions = model_cols
+        cols['role_id'].append(role_id)
+        cols['role_rev'].append(role_rev)
+        cols['position'].append(position)
+        cols['num_revisions'].append(num_revisions)
+        cols['file_name'].append(file_name)
+        cols['block_path'].append(path)
+        cols['top_level'].append(top_level)
+        cols['action'].append(task.get('action') or None)
+        args = task.get('args', {})
+        cols['arg_keys'].append(list(args) if isinstance(args, dict) else None)
+        cols['has_when'].append('when' in task)
+        condition = task.get('when')
+        if not condition:
+            conditions = []
+        elif isinstance(condition, list):
+            conditions = [_condition_str(cond) for cond in condition]
+        else:
+            conditions = [_condition_str(condition)]
+        cols['when'].append(conditions)
+        cols['has_loop'].append('loop' in task)
+
+    def build(self) -> 'TaskTable':
+        """Build the table of all added tasks."""
+        frame = pd.DataFrame(self._columns)
+        for column in _CATEGORY_COLUMNS:
+            frame[column] = frame[column].astype('category')
+        frame = frame.astype({
+                'position': 'int32', 'num_revisions': 'int32',
+                'top_level': bool, 'has_when': bool, 'has_loop': bool})
+        return TaskTable(frame)
+
+
+@attr.s(auto_attribs=True)
+class TaskTable(Model):
+    """All tasks of the structural models, one row per task.
+
+    Columns:
+      role_id, role_rev: Role and revision of the model.
+      position, num_revisions: Position of the model among the revisions
+          stored in its file, and the number of those revisions.
+      file_name: Task file of the task.
+      block_path: Path to the task in the file, e.g. `0.block.1.rescue.0`.
+      top_level: Whether the task is directly in the `block` section of a
+          top-level block. These are the tasks visited by the scan plugins.
+      action: Module of the task, missing if it has none.
+      arg_keys: Names of the arguments, missing if they're not a mapping.
+      has_when, when: Whether the task has a `when` keyword, and its
+          conditions as strings, which is empty if the keyword is falsy.
+      has_loop: Whether the task has a `loop` keyword.
+    """
+    frame: pd.DataFrame
+
+    @property
+    def id(self) -> str:
+        return 'tasks'
+
+    def dump(self, dirpath: Path, table_format: str = DEFAULT_TABLE_FORMAT) -> Path:
+        """Dump the table to disk and return its path."""
+        fpath = dirpath / (self.id + TABLE_FORMATS[table_format])
+        if table_format == 'parquet':
+            self.frame.to_parquet(fpath, index=False)
+        else:
+            self.frame.to_feather(fpath)
+        return fpath
+
+    @classmethod
+    def load(cls, id: str, path: Path) -> 'TaskTable':
+        """Load the table from disk."""
+        if path.suffix == TABLE_FORMATS['parquet']:
+            return cls(pd.read_parquet(path))
+        return cls(pd.read_feather(path))
+
+
+def plugin_tasks(tasks: pd.DataFrame, head_only: bool = False) -> pd.DataFrame:
+    """Select the tasks with an action that the scan plugins visit.
+
+    With `head_only`, only the tasks of HEAD revisions are selected.
+    """
+    mask = tasks['top_level'] & tasks['action'].notna()
+    if head_only:
+        mask &= tasks['role_rev'] == 'HEAD'
+    return tasks[mask]
@@ -1,7 +1,9 @@
 """Models for Git."""
-from typing import Optional, Union, Sequence
+from typing import Any, ClassVar, Dict, FrozenSet, Iterable, List, Optional, Union, Sequence
 from pathlib import Path
 
+import json
+
 import attr
 import git
 import pendulum
@@ -95,6 +97,50 @@ class GitTag(Model):
                 tagged_datetime=pendulum.from_timestamp(actual_tag.tagged_date))
 
 
+class _LazyFieldsMixin:
+    """Mixin for models loaded from the dataset, structuring fields on access.
+
+    The fields are read from the unstructured content when they're first
+    accessed, so that timestamps are only parsed when they're needed.
+    """
+
+    _datetime_fields: ClassVar[FrozenSet[str]]
+
+    def __init__(self, content: Dict[str, Any]) -> None:
+        # The models are frozen.
+        object.__setattr__(self, '_content', content)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for fields that haven't been accessed yet.
+        try:
+            value = self.__dict__['_content'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+        if name in self._datetime_fields and value is not None:
+            value = CONVERTER.structure(value, pendulum.DateTime)
+        object.__setattr__(self, name, value)
+        return value
+
+
+class _LazyGitCommit(_LazyFieldsMixin, GitCommit):
+    _datetime_fields = frozenset({'authored_datetime', 'committed_datetime'})
+
+
+class _LazyGitTag(_LazyFieldsMixin, GitTag):
+    _datetime_fields = frozenset({'tagged_datetime'})
+
+
+def _dump_json_lines(objs: Iterable[Any], file_path: Path) -> None:
+    with file_path.open('wt', encoding='utf-8') as f:
+        for obj in objs:
+            f.write(json.dumps(CONVERTER.unstructure(obj)) + '\n')
+
+
+def _load_json_lines(file_path: Path) -> List[Dict[str, Any]]:
+    with file_path.open('rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
 @attr.s(auto_attribs=True)
 class GitRepoMetadata(Model):
     commits: Sequence[GitCommit]
@@ -106,20 +152,29 @@ class GitRepoMetadata(Model):
     def id(self) -> str:
         return f'{self.repo_owner}/{self.repo_name}'
 
+    @property
+    def is_empty(self) -> bool:
+        """Check whether the repository has no commits."""
+        return not self.commits
+
     def dump(self, path: Path) -> Path:
-        owner_dir = path / self.repo_owner
-        owner_dir.mkdir(exist_ok=True, parents=True)
-        repo_file = owner_dir / (self.repo_name + '.yaml')
-        content = {
-            'commits': CONVERTER.unstructure(self.commits),
-            'tags': CONVERTER.unstructure(self.tags)
-        }
-        repo_file.write_text(yaml.dump(content, sort_keys=True))
-        return repo_file
+        """Dump the commits and tags to separate JSON lines files.
+
+        They're stored in a directory per repository, so that either can be
+        loaded without the other.
+        """
+        repo_dir = path / self.repo_owner / self.repo_name
+        repo_dir.mkdir(exist_ok=True, parents=True)
+        _dump_json_lines(self.commits, repo_dir / 'commits.jsonl')
+        _dump_json_lines(self.tags, repo_dir / 'tags.jsonl')
+        return repo_dir
 
 
     @classmethod
     def load(self, id: str, path: Path) -> 'GitRepoMetadata':
+        if path.is_dir():
+            return _LazyJsonLinesGitRepoMetadataProxy(path.name, path.parts[-2], path)
+        # Stored as a single YAML file by earlier versions.
         return _LazyGitRepoMetadataProxy(path.stem, path.parts[-2], path)
 
 
@@ -155,3 +210,34 @@ class _LazyGitRepoMetadataProxy(GitRepoMetadata):
     def tags(self) -> str:  # type: ignore[override]
         self._ensure_loaded()
         return self._tags  # type: ignore[no-any-return]
+
+
+class _LazyJsonLinesGitRepoMetadataProxy(_LazyGitRepoMetadataProxy):
+    """Proxy for metadata in JSON lines files, loading commits and tags separately."""
+
+    def __init__(self, repo_name: str, repo_owner: str, path: Path) -> None:
+        super().__init__(repo_name, repo_owner, path)
+        self._commits: Optional[List[GitCommit]] = None
+        self._tags: Optional[List[GitTag]] = None
+
+    @property
+    def is_empty(self) -> bool:
+        if self._commits is None:
+            return (self._file / 'commits.jsonl').stat().st_size == 0
+        return not self._commits
+
+    @property
+    def commits(self) -> List[GitCommit]:  # type: ignore[override]
+        if self._commits is None:
+            self._commits = [
+                    _LazyGitCommit(content)
+                    for content in _load_json_lines(self._file / 'commits.jsonl')]
+        return self._commits
+
+    @property
+    def tags(self) -> List[GitTag]:  # type: ignore[override]
+        if self._tags is None:
+            self._tags = [
+                    _LazyGitTag(content)
+                    for content in _load_json_lines(self._file / 'tags.jsonl')]
+        return self._tags
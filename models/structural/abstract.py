@@ -8,6 +8,7 @@ from typing import (
     Dict,
     Final,
     Generic,
+    Hashable,
     List,
     Mapping,
     Optional,
@@ -203,11 +204,22 @@ class AbstractVariableFile(
             'content': {var.name: var.value for var in self}
         }
 
+    @diff_mod.cached_fingerprint
+    def fingerprint(self) -> Optional[bytes]:
+        # The file name doesn't show up in the diffs of the variables.
+        try:
+            content = diff.encode_value({var.name: var.value for var in self})
+        except TypeError:
+            return None
+        return diff.combine_fingerprints(self.__class__.__name__, [content])
+
     def diff(
             self: _AVFile, other: _AVFile
     ) -> Sequence[diff_mod.Diff]:
         if not isinstance(other, type(self)):
             raise NotImplementedError
+        if diff.same_fingerprint(self, other):
+            return []
 
         var_type_name = self.__class__.__name__.replace('File', 'iable')
         var_added_t = getattr(diff, f'{var_type_name}Addition')
@@ -477,11 +489,22 @@ class AbstractBlockFile(
     def get_path_to(self, ch: _ABType) -> str:
         return f'{self.file_name}[{self.index(ch)}]'
 
+    @diff_mod.cached_fingerprint
+    def fingerprint(self) -> Optional[bytes]:
+        # Blocks are relocated when their file name changes.
+        return diff.combine_fingerprints(
+                self.__class__.__name__,
+                chain(
+                    [diff.encode_value(self.file_name)],
+                    (block.fingerprint for block in self)))
+
     def diff(
             self: _ABFile, other: _ABFile
     ) -> Sequence[diff_mod.Diff]:
         if not isinstance(other, type(self)):
             raise NotImplementedError
+        if diff.same_fingerprint(self, other):
+            return []
 
         # Actual type of the block is not in this module, import it here to
         # prevent cyclic imports
@@ -529,6 +552,7 @@ class AbstractBlockFile(
         # parent block was relocated too
         return cls._remove_redundant_relocations(diffs)
 
+    @diff_mod.memoize_similarity
     def similarity_score(
             self: _ABFile, other: _ABFile
     ) -> float:
@@ -658,6 +682,11 @@ class AbstractBlock(
         ans_type=anspb.block.Block,
         extra_kws={'name', 'block', 'rescue', 'always', 'when'}
 ):
+    # Whole role histories are held in memory while diffing.
+    __slots__ = (
+            '_parent', '_raw_kws', '_misc_kws', '_elements', '_fingerprint',
+            '__weakref__')
+
     def __init__(
             self, *args: object, **kwargs: Any
     ) -> None:
@@ -813,6 +842,7 @@ class AbstractBlock(
 
         return f'{cont_name}[{getattr(self, cont_name).index(child)}]'
 
+    @diff_mod.memoize_similarity
     def similarity_score(self: _ABType, other: _ABType) -> float:
         if not isinstance(other, type(self)):
             raise NotImplementedError
@@ -827,6 +857,23 @@ class AbstractBlock(
                 c1.similarity_score(c2)  # type: ignore[arg-type]
                 if type(c1) == type(c2) else 0)
 
+    def similarity_key(self) -> Optional[Hashable]:
+        # Only the children count towards the similarity, and they need to be
+        # at the same location to avoid the relocation penalty. Empty blocks
+        # score 0 against anything.
+        child_keys = []
+        for cont_name in ('block', 'rescue', 'always'):
+            cont_keys = []
+            for child in getattr(self, cont_name) or ():
+                child_key = child.similarity_key()
+                if child_key is None:
+                    return None
+                cont_keys.append(child_key)
+            child_keys.append(tuple(cont_keys))
+        if not any(child_keys):
+            return None
+        return (self.__class__, tuple(child_keys))
+
     def _diff_self(
             self: _ABType, other: _ABType
     ) -> Sequence[diff_mod.Diff]:
@@ -864,9 +911,33 @@ class AbstractBlock(
         assert not attrs1 and not attrs2
         return []
 
+    @diff_mod.cached_fingerprint
+    def fingerprint(self) -> Optional[bytes]:
+        # Empty blocks are never matched, not even to an identical copy.
+        if not len(self):
+            return None
+        containers = ('block', 'rescue', 'always')
+        kws = {
+                kw: getattr(self, kw)
+                for kw in self._interested_kw_names - set(containers)}
+        kws.update(
+                (kw, val) for kw, val in self.misc_keywords.items()
+                if kw not in containers)
+        try:
+            parts = [diff.encode_value(kws)]
+        except TypeError:
+            return None
+        for cont_name in containers:
+            children = getattr(self, cont_name) or ()
+            parts.append(diff.encode_value((cont_name, len(children))))
+            parts.extend(child.fingerprint for child in children)
+        return diff.combine_fingerprints(self.__class__.__name__, parts)
+
     def diff(self: _ABType, other: _ABType) -> Sequence[diff_mod.Diff]:
         if not isinstance(other, type(self)):
             raise NotImplementedError
+        if diff.same_fingerprint(self, other):
+            return []
 
         all1 = list(chain(self.block, self.rescue, self.always))
         all2 = list(chain(other.block, other.rescue, other.always))
@@ -988,6 +1059,8 @@ class AbstractTask(
         base.BaseTask,
         ans_type=anspb.task.Task,
         extra_kws={'name', 'args', 'action', 'loop', 'loop_control', 'when'}):
+    # Whole role histories are held in memory while diffing.
+    __slots__ = ('_parent', '_raw_kws', '_misc_kws', '_fingerprint')
 
     def gv_visit(self, g: SMGraph) -> None:
         g.add_node(self, '')
@@ -1015,9 +1088,21 @@ class AbstractTask(
         assert isinstance(self.parent, AbstractBlock)
         return self.parent.id + '.' + self.parent.get_path_to(self)
 
+    @diff_mod.cached_fingerprint
+    def fingerprint(self) -> Optional[bytes]:
+        kws = {kw: getattr(self, kw) for kw in self._interested_kw_names}
+        kws.update(self.misc_keywords)
+        try:
+            content = diff.encode_value(kws)
+        except TypeError:
+            return None
+        return diff.combine_fingerprints(self.__class__.__name__, [content])
+
     def diff(self: _ATType, other: _ATType) -> Sequence[diff_mod.Diff]:
         if not isinstance(other, type(self)):
             raise NotImplementedError
+        if diff.same_fingerprint(self, other):
+            return []
 
         edit_t = getattr(diff, self.__class__.__name__ + 'Edit')
 
@@ -1096,6 +1181,7 @@ class AbstractTask(
                         obj_id=r.id, prev_loc=r.id, new_loc=a.id),
                 lambda t1, t2: t1.similarity_score(t2))
 
+    @diff_mod.memoize_similarity
     def similarity_score(self: _ATType, other: _ATType) -> float:
         if not isinstance(other, type(self)):
             raise NotImplementedError
@@ -1112,6 +1198,14 @@ class AbstractTask(
                     and self.misc_keywords[kw] == other.misc_keywords[kw]))
         return (main_kw_matches + misc_kw_matches) / len(all_kws)
 
+    def similarity_key(self) -> Optional[Hashable]:
+        return (
+                self.__class__,
+                tuple(
+                    diff.freeze_value(getattr(self, kw))
+                    for kw in sorted(self._interested_kw_names)),
+                diff.freeze_value(dict(self.misc_keywords)))
+
     @classmethod
     def structure(cls: Type[AbstractTask[_CBType]], obj: Dict[str, Value]) -> AbstractTask[_CBType]:
         return cls(kws=obj)
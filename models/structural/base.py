@@ -17,7 +17,7 @@ class BaseFile(abc.ABC):
 
 class BaseObject(abc.ABC, GraphvizMixin):
     """Base class for role objects."""
-    pass
+    __slots__ = ()
 
 
 class BaseVariable(BaseObject):
@@ -41,25 +41,25 @@ class BaseVariable(BaseObject):
 
 class BaseBlock(BaseObject):
     """A Block represents a list of tasks, or other blocks."""
-    pass
+    __slots__ = ()
 
 
 class BaseTask(BaseObject):
     """A Task represents a single task in a block."""
-    pass
+    __slots__ = ()
 
 
 class DefaultsTrait:
-    pass
+    __slots__ = ()
 
 
 class ConstantsTrait:
-    pass
+    __slots__ = ()
 
 
 class TasksTrait:
-    pass
+    __slots__ = ()
 
 
 class HandlersTrait:
-    pass
+    __slots__ = ()
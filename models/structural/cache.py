@@ -0,0 +1,170 @@
+"""On-disk cache of parsed role files."""
+from typing import Callable, Iterable, List, Tuple, TypeVar
+
+import functools
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+
+from pathlib import Path
+
+# Bump whenever the format of the entries changes, so that stale entries are
+# never loaded. Changes to the structural model classes are covered by the
+# fingerprint of their source.
+CACHE_VERSION = 3
+
+_T = TypeVar('_T')
+
+# Task keywords that make Ansible load other files while parsing the file
+# they're in. Also matches the legacy `include`, which may be static.
+_STATIC_IMPORT_RE = re.compile(
+        rb'\b(?:import_tasks|import_role|import_playbook|include)\s*:')
+
+
+def git_blob_sha(content: bytes) -> str:
+    """Compute the SHA git would assign to a blob with the given content."""
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+
+def has_static_imports(content: bytes) -> bool:
+    """Check whether a file may import other files statically.
+
+    The result of parsing such a file depends on the content of the files it
+    imports too, so it can't be cached by its own content. May report
+    imports that aren't there, but never misses one.
+    """
+    return _STATIC_IMPORT_RE.search(content) is not None
+
+
+def write_pickle(path: Path, obj: object) -> None:
+    """Pickle an object to a file, atomically.
+
+    The object is written to a temporary file first, so that concurrent
+    readers never see a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f_tmp:
+            pickle.dump(obj, f_tmp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def evict_least_recently_used(
+        entry_paths: Iterable[Path], max_size: int
+) -> int:
+    """Delete the least recently used files until they fit in `max_size` bytes.
+
+    Files are ordered by their modification time, which is updated whenever
+    they're used. Returns the number of deleted files.
+    """
+    entries: List[Tuple[float, int, Path]] = []
+    total_size = 0
+    for entry_path in entry_paths:
+        if entry_path.suffix == '.tmp':
+            continue
+        try:
+            st = entry_path.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry_path))
+        total_size += st.st_size
+
+    evicted = 0
+    entries.sort()
+    for _, size, entry_path in entries:
+        if total_size <= max_size:
+            break
+        entry_path.unlink(missing_ok=True)
+        total_size -= size
+        evicted += 1
+    return evicted
+
+
+@functools.lru_cache(maxsize=None)
+def models_fingerprint() -> str:
+    """Fingerprint the source of the structural model modules.
+
+    The cached objects are instances of the classes defined in these
+    modules, so any change to them invalidates all entries.
+    """
+    digest = hashlib.sha1()
+    for module_path in sorted(Path(__file__).parent.glob('*.py')):
+        digest.update(module_path.name.encode('utf-8') + b'\0')
+        digest.update(module_path.read_bytes())
+    return digest.hexdigest()
+
+
+class ParsedFileCache:
+    """Content-addressed cache of parsed role files.
+
+    Entries are keyed by the kind of file, its path within the role and the
+    git blob SHA of its content, so an unchanged file is only parsed once
+    across all revisions of a role. Keys also include the fingerprint of the
+    structural model classes, so entries of older classes are never loaded.
+    Files that import other files statically mustn't be cached, see
+    `has_static_imports`. Entries are pickled into `directory`, which may be
+    shared by multiple processes. Once the cache grows beyond
+    `max_size` bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory: Path, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, kind: str, file_name: str, content: bytes) -> Path:
+        key_src = '\0'.join([
+                str(CACHE_VERSION), models_fingerprint(), kind, file_name,
+                git_blob_sha(content)])
+        key = hashlib.sha1(key_src.encode('utf-8')).hexdigest()
+        return self.directory / key[:2] / key[2:]
+
+    def get_or_parse(
+            self, kind: str, file_name: str, content: bytes,
+            parse: Callable[[], _T],
+            cacheable: Callable[[_T], bool] = lambda _: True
+    ) -> _T:
+        """Get a parsed file from the cache, parsing and storing it on a miss.
+
+        Exceptions raised by `parse` are propagated and nothing is stored,
+        neither are results rejected by `cacheable`.
+        """
+        entry_path = self._entry_path(kind, file_name, content)
+        try:
+            with entry_path.open('rb') as f_entry:
+                obj: _T = pickle.load(f_entry)
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # Corrupt or stale entry, overwrite it.
+            pass
+        else:
+            self.hits += 1
+            try:
+                # Mark as recently used for eviction.
+                os.utime(entry_path)
+            except OSError:
+                pass
+            return obj
+
+        self.misses += 1
+        obj = parse()
+        if cacheable(obj):
+            write_pickle(entry_path, obj)
+        return obj
+
+    def evict(self) -> int:
+        """Evict least recently used entries until within the size bound.
+
+        Returns the number of evicted entries.
+        """
+        return evict_least_recently_used(
+                self.directory.glob('*/*'), self.max_size)
@@ -3,7 +3,11 @@ from __future__ import annotations
 
 from typing import (
         Callable,
+        Counter,
         Dict, Any,
+        Hashable,
+        Iterable,
+        Iterator,
         List,
         Optional,
         Sequence,
@@ -16,6 +20,13 @@ from typing import (
 )
 
 import abc
+import collections
+import functools
+import hashlib
+import math
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from itertools import chain, product
 from operator import itemgetter
 from textwrap import indent
@@ -24,12 +35,14 @@ import re
 
 from models.base import Model
 from .provenance import pformat
+from .storage import check_serializable
 
 if TYPE_CHECKING:
     from .role import StructuralRoleModel, MultiStructuralRoleModel
 
 _SelfType = TypeVar('_SelfType', bound='DiffableMixin')
 _ChildType = TypeVar('_ChildType')
+_ScoredType = TypeVar('_ScoredType')
 
 import yaml
 try:
@@ -45,7 +58,224 @@ except ImportError:
 SIMILARITY_THRESHOLD = .51
 
 
+class SimilarityMemo:
+    """Similarity scores computed during a single diff.
+
+    Keyed by the identity of the compared objects, which are kept alive by
+    the memo so that their IDs cannot be reused.
+    """
+
+    def __init__(self) -> None:
+        self._scores: Dict[Tuple[int, int], Tuple[object, object, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_score(
+            self, obj1: _ScoredType, obj2: _ScoredType,
+            score: Callable[[_ScoredType, _ScoredType], float]
+    ) -> float:
+        key = (id(obj1), id(obj2))
+        try:
+            sim = self._scores[key][2]
+        except KeyError:
+            self.misses += 1
+            sim = score(obj1, obj2)
+            self._scores[key] = (obj1, obj2, sim)
+            return sim
+        self.hits += 1
+        return sim
+
+
+_active_memo: ContextVar[Optional[SimilarityMemo]] = ContextVar(
+        '_active_memo', default=None)
+
+# Reused ('hits') and computed ('misses') scores of all memos in this process.
+MEMO_STATS: Counter[str] = collections.Counter()
+
+
+@contextmanager
+def similarity_memo() -> Iterator[SimilarityMemo]:
+    """Memoize similarity scores for the duration of the context.
+
+    Nested contexts share the memo of the outermost one. The memo is dropped
+    when the outermost context exits, its counters are added to `MEMO_STATS`.
+    """
+    memo = _active_memo.get()
+    if memo is not None:
+        yield memo
+        return
+
+    memo = SimilarityMemo()
+    token = _active_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _active_memo.reset(token)
+        MEMO_STATS['hits'] += memo.hits
+        MEMO_STATS['misses'] += memo.misses
+
+
+def memoize_similarity(
+        score: Callable[[_ScoredType, _ScoredType], float]
+) -> Callable[[_ScoredType, _ScoredType], float]:
+    """Decorate a similarity score method to use the active memo, if any."""
+    @functools.wraps(score)
+    def wrapper(self: _ScoredType, other: _ScoredType) -> float:
+        memo = _active_memo.get()
+        if memo is None:
+            return score(self, other)
+        return memo.get_or_score(self, other, score)
+    return wrapper
+
+
+def freeze_value(value: Any) -> Hashable:
+    """Convert a keyword value to a hashable value with the same equality.
+
+    Two frozen values are equal iff the original values compare equal. Raises
+    `TypeError` for values for which that cannot be guaranteed.
+    """
+    if isinstance(value, OrderedDict):
+        # Equality depends on the type of the other operand.
+        raise TypeError('Cannot freeze OrderedDict')
+    if isinstance(value, dict):
+        return ('dict', frozenset(
+                (key, freeze_value(val)) for key, val in value.items()))
+    if isinstance(value, list):
+        return ('list', tuple(freeze_value(val) for val in value))
+    if isinstance(value, tuple):
+        return ('tuple', tuple(freeze_value(val) for val in value))
+    if isinstance(value, (set, frozenset)):
+        return ('set', frozenset(value))
+    if isinstance(value, float) and math.isnan(value):
+        # NaN is unequal to itself, but containers compare identity first.
+        raise TypeError('Cannot freeze NaN')
+    hash(value)
+    return value
+
+
+def encode_value(value: Any) -> bytes:
+    """Encode a keyword value canonically for fingerprinting.
+
+    Values with equal encodings compare equal. Raises `TypeError` for values
+    for which that cannot be guaranteed.
+    """
+    if value is None:
+        return b'N'
+    if isinstance(value, bool):
+        return b'T' if value else b'F'
+    if isinstance(value, int):
+        return b'i%d;' % value
+    if isinstance(value, float):
+        if math.isnan(value):
+            raise TypeError('Cannot encode NaN')
+        return b'f' + repr(value).encode('ascii') + b';'
+    if isinstance(value, str):
+        data = value.encode('utf-8', errors='surrogatepass')
+        return b's%d:' % len(data) + data
+    if isinstance(value, bytes):
+        return b'b%d:' % len(value) + value
+    if isinstance(value, list):
+        return b'l%d:' % len(value) + b''.join(map(encode_value, value))
+    if isinstance(value, tuple):
+        return b't%d:' % len(value) + b''.join(map(encode_value, value))
+    if isinstance(value, dict) and not isinstance(value, OrderedDict):
+        items = sorted(
+                (encode_value(key), encode_value(val))
+                for key, val in value.items())
+        return b'd%d:' % len(items) + b''.join(key + val for key, val in items)
+    if isinstance(value, (set, frozenset)):
+        return b'S%d:' % len(value) + b''.join(sorted(map(encode_value, value)))
+    raise TypeError(f'Cannot encode {type(value).__name__}')
+
+
+def combine_fingerprints(
+        kind: str, parts: Iterable[Optional[bytes]]
+) -> Optional[bytes]:
+    """Compose a fingerprint from those of an object's parts.
+
+    The result is None if any of the parts has no fingerprint.
+    """
+    digest = hashlib.sha1(kind.encode('utf-8'))
+    num_parts = 0
+    for part in parts:
+        if part is None:
+            return None
+        digest.update(b'%d:' % len(part))
+        digest.update(part)
+        num_parts += 1
+    digest.update(b'#%d' % num_parts)
+    return digest.digest()
+
+
+def cached_fingerprint(
+        compute: Callable[[Any], Optional[bytes]]
+) -> property:
+    """Cache a fingerprint in the object's `_fingerprint` attribute.
+
+    Like `functools.cached_property`, but also works for objects with slots.
+    """
+    @functools.wraps(compute)
+    def getter(self: Any) -> Optional[bytes]:
+        try:
+            return cast(Optional[bytes], self._fingerprint)
+        except AttributeError:
+            fingerprint = self._fingerprint = compute(self)
+            return fingerprint
+    return property(getter)
+
+
+def same_fingerprint(obj1: DiffableMixin, obj2: DiffableMixin) -> bool:
+    """Check whether two objects are identical, i.e., have no diffs."""
+    fingerprint = obj1.fingerprint
+    return fingerprint is not None and fingerprint == obj2.fingerprint
+
+
+def _match_identical(
+        children1: Sequence[_ChildType], children2: Sequence[_ChildType],
+        descending: bool,
+        is_relocated: Optional[Callable[[_ChildType, _ChildType], bool]] = None
+) -> Optional[List[Tuple[int, int]]]:
+    """Greedily match the children that are fully similar.
+
+    Returns the indices of the matched pairs in the order in which the greedy
+    matchers would accept them if all pairs were scored, i.e. in ascending or
+    descending order of indices, since fully similar pairs are tied at the top.
+    Pairs for which `is_relocated` holds are skipped, as the relocation
+    penalty places them below the others. Returns None when a child has no
+    similarity key, in which case all pairs need to be scored.
+    """
+    try:
+        keys1 = [cast(DiffableMixin, c).similarity_key() for c in children1]
+        keys2 = [cast(DiffableMixin, c).similarity_key() for c in children2]
+    except TypeError:
+        return None
+
+    positions2: Dict[Hashable, List[int]] = {}
+    for idx2, key in enumerate(keys2):
+        if key is not None:
+            positions2.setdefault(key, []).append(idx2)
+    candidates = [
+            (idx1, idx2)
+            for idx1, key in enumerate(keys1) if key is not None
+            for idx2 in positions2.get(key, ())
+            if (is_relocated is None
+                or not is_relocated(children1[idx1], children2[idx2]))]
+    candidates.sort(reverse=descending)
+
+    matched: List[Tuple[int, int]] = []
+    taken1: Set[int] = set()
+    taken2: Set[int] = set()
+    for idx1, idx2 in candidates:
+        if idx1 not in taken1 and idx2 not in taken2:
+            matched.append((idx1, idx2))
+            taken1.add(idx1)
+            taken2.add(idx2)
+    return matched
+
+
 class DiffableMixin:
+    __slots__ = ()
+
     def diff(self: _SelfType, other: _SelfType) -> Sequence['Diff']:
         """Calculate the structural difference between self and other.
 
@@ -56,6 +286,26 @@ class DiffableMixin:
         """
         raise NotImplementedError
 
+    def similarity_key(self) -> Optional[Hashable]:
+        """Get a key that is equal for two objects iff they're fully similar.
+
+        Fully similar objects have a similarity score of exactly 1. Returns
+        None if the object can never be fully similar to another one. Raises
+        `TypeError` if no such key can be computed.
+        """
+        raise TypeError(f'{self.__class__.__name__} has no similarity key')
+
+    @property
+    def fingerprint(self) -> Optional[bytes]:
+        """Get a digest of the content that determines the object's diffs.
+
+        Composed from the fingerprints of the object's children, like a Merkle
+        tree. Diffing two objects with the same fingerprint never produces
+        any diffs, so identical subtrees can be skipped. None if the object
+        cannot be skipped, e.g. because it cannot be fingerprinted.
+        """
+        return None
+
     def _sim_score_internal(
             self,
             children1: Sequence[_ChildType],
@@ -72,6 +322,21 @@ class DiffableMixin:
         if not max_num_el:
             return 0
 
+        todo1 = set(children1)
+        todo2 = set(children2)
+
+        best_scores: List[float] = []
+        # Fully similar, unrelocated pairs top the ranking, so their matching
+        # doesn't depend on the scores of other pairs.
+        identical = _match_identical(children1, children2, True, is_relocated)
+        if identical is not None:
+            for idx1, idx2 in identical:
+                best_scores.append(1.0)
+                todo1.remove(children1[idx1])
+                todo2.remove(children2[idx2])
+            children1 = [c for c in children1 if c in todo1]
+            children2 = [c for c in children2 if c in todo2]
+
         candidates = product(children1, children2)
 
         sims = [(c1, c2, calc_child_sim(c1, c2)) for c1, c2 in candidates]
@@ -82,10 +347,6 @@ class DiffableMixin:
             for c1, c2, sim in sims]
         sims = sorted(sims[::-1], key=itemgetter(2), reverse=True)
 
-        todo1 = set(children1)
-        todo2 = set(children2)
-
-        best_scores: List[float] = []
         for c1, c2, sim in sims:
             if not todo1 or not todo2:
                 break
@@ -111,6 +372,25 @@ class DiffableMixin:
     ) -> Sequence['Diff']:
         todo1 = set(v1)
         todo2 = set(v2)
+        diffs: List[Diff] = []
+
+        def match(t1: _SelfType, t2: _SelfType) -> None:
+            todo1.remove(t1)
+            todo2.remove(t2)
+            diffs.extend(t1.diff(t2))
+            if check_relocation(t1, t2):
+                # Relocated in block
+                diffs.append(relocation_t(t1, t2))
+
+        # Identical objects are the best candidates, there's no need to score
+        # them against every other object. Only the rest is scored pairwise.
+        identical = _match_identical(v1, v2, True)
+        if identical is not None:
+            for idx1, idx2 in identical:
+                match(v1[idx1], v2[idx2])
+            v1 = [t for t in v1 if t in todo1]
+            v2 = [t for t in v2 if t in todo2]
+
         candidates = product(v1, v2)
         sims = [(t1, t2, calc_similarity(t1, t2)) for t1, t2 in candidates]
         # Sort by similarity. We want the sort to be stable, so multiple
@@ -128,7 +408,6 @@ class DiffableMixin:
         # given lists matches, and checking relocations similar to how its done
         # with variables.
 
-        diffs: List[Diff] = []
         for t1, t2, sim in sims:
             if sim < SIMILARITY_THRESHOLD:
                 # No more good candidates
@@ -137,17 +416,13 @@ class DiffableMixin:
                 # one of the two tasks is already taken, skip
                 continue
 
-            todo1.remove(t1)
-            todo2.remove(t2)
-            diffs.extend(t1.diff(t2))
-            if check_relocation(t1, t2):
-                # Relocated in block
-                diffs.append(relocation_t(t1, t2))
+            match(t1, t2)
 
         # Remaining tasks are added or removed, might be adjusted later at the
-        # block/file level
-        diffs.extend(chain(*(addition_t(t) for t in todo2)))
-        diffs.extend(chain(*(removal_t(t) for t in todo1)))
+        # block/file level. Keep them in their original order rather than the
+        # arbitrary order of the sets, relocations are matched in this order.
+        diffs.extend(chain(*(addition_t(t) for t in v2 if t in todo2)))
+        diffs.extend(chain(*(removal_t(t) for t in v1 if t in todo1)))
 
         return diffs
 
@@ -171,6 +446,24 @@ class DiffableMixin:
             else:
                 new_diffs.append(d)
 
+        def relocate(a: Addition, r: Removal) -> None:
+            additions.remove(a)
+            removals.remove(r)
+            aval = cast(_SelfType, a.added_value)
+            rval = cast(_SelfType, r.removed_value)
+            new_diffs.extend(rval.diff(aval))
+            new_diffs.append(create_relocation(rval, aval))
+
+        # Identical objects are relocated first, without scoring them against
+        # every other candidate.
+        identical = _match_identical(
+                [a.added_value for a in additions],
+                [r.removed_value for r in removals], False)
+        if identical is not None:
+            pairs = [(additions[idx1], removals[idx2]) for idx1, idx2 in identical]
+            for a, r in pairs:
+                relocate(a, r)
+
         # Pairwise check each addition with each removal, calculate similarity,
         # ones with high similarity will be marked as relocation, others will
         # be kept as addition/removal
@@ -191,12 +484,7 @@ class DiffableMixin:
             if a not in additions or r not in removals:
                 # Already processed
                 continue
-            additions.remove(a)
-            removals.remove(r)
-            aval = cast(_SelfType, a.added_value)
-            rval = cast(_SelfType, r.removed_value)
-            new_diffs.extend(rval.diff(aval))
-            new_diffs.append(create_relocation(rval, aval))
+            relocate(a, r)
 
         # Remaining tasks are still considered added or removed, but this might
         # be adjusted again at a later stage.
@@ -530,16 +818,24 @@ class DiffSet:
 
 class StructuralRoleEvolution(Model):
 
-    def __init__(self, role_id: str, diff_sets: Sequence[DiffSet]) -> None:
+    def __init__(
+            self, role_id: str, diff_sets: Sequence[DiffSet],
+            unstructured_diff_sets: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
         self.role_id = role_id
         self.diff_sets = diff_sets
+        # Reused when dumping, the diffs aren't modified after creation.
+        self._unstructured_diff_sets = unstructured_diff_sets
 
     @property
     def id(self) -> str:
         return self.role_id
 
     @classmethod
-    def create(cls, models: 'MultiStructuralRoleModel') -> StructuralRoleEvolution:
+    def create(
+            cls, models: 'MultiStructuralRoleModel',
+            strict_validation: bool = False
+    ) -> StructuralRoleEvolution:
         all_struct_models = models.structural_models
         if len(all_struct_models) <= 1:
             return cls(models.role_id, [])
@@ -557,12 +853,21 @@ class StructuralRoleEvolution(Model):
         # Verify we can dump it
         try:
             unstructured = [diff_set.unstructure() for diff_set in inst.diff_sets]
-            result = yaml.safe_dump(unstructured)
+            if strict_validation:
+                result = yaml.safe_dump(unstructured)
+            else:
+                check_serializable(unstructured)
+                inst._unstructured_diff_sets = unstructured
         except:
             assert False, f'Will fail to dump {models.role_id}'
 
         return inst
 
+    def unstructure_diff_sets(self) -> List[Dict[str, Any]]:
+        if self._unstructured_diff_sets is not None:
+            return self._unstructured_diff_sets
+        return [diff_set.unstructure() for diff_set in self.diff_sets]
+
     @classmethod
     def load(cls, role_id: str, file_path: Path) -> StructuralRoleEvolution:
         data = yaml.load(file_path.read_text(), Loader=Loader)
@@ -571,7 +876,7 @@ class StructuralRoleEvolution(Model):
     def dump(self, dirpath: Path) -> Path:
         data = {
             'role_id': self.role_id,
-            'diff_sets': [diff_set.unstructure() for diff_set in self.diff_sets]
+            'diff_sets': self.unstructure_diff_sets()
         }
         target = dirpath / (self.role_id + '.yaml')
         target.write_text(yaml.safe_dump(data))
@@ -0,0 +1,245 @@
+"""Generated (un)structure functions for the structural models.
+
+Structuring a task or block through its `structure` method goes through the
+cooperative `__init__` chain of all of its mixins, and blocks create new
+closures to convert their children. Like cattrs does for attrs classes, we
+instead generate a function per class with the keyword handling and child
+types inlined.
+
+The generated functions create the objects without calling `__init__`, so
+they are only generated for classes whose initializers are all known to the
+generator. The objects are identical to the ones created by `structure`.
+"""
+from typing import Any, Callable, Dict, List, Mapping, Type
+
+import linecache
+import sys
+import uuid
+import weakref
+
+from . import abstract, base, mixins
+
+StructureFn = Callable[..., Any]
+UnstructureFn = Callable[[Any], Any]
+
+# Initializers whose effects are replicated by the generated code.
+_KNOWN_INITS = frozenset({
+        object, base.BaseFile, base.BaseVariable, mixins.KeywordsMixin,
+        mixins.ObjectContainerMixin, mixins.ChildObjectMixin,
+        abstract.AbstractBlock})
+
+_BLOCK_CONTAINERS = ('block', 'rescue', 'always')
+
+
+def _check_inits(cls: type) -> None:
+    unknown = [
+            klass.__name__ for klass in cls.__mro__
+            if '__init__' in vars(klass) and klass not in _KNOWN_INITS]
+    if unknown:
+        raise TypeError(
+                f'Cannot generate hooks for {cls.__name__}, unknown '
+                f'initializers in {", ".join(unknown)}')
+
+
+def _compile(
+        fn_name: str, lines: List[str], globs: Dict[str, Any]
+) -> Callable[..., Any]:
+    """Compile a generated function, registering its source for tracebacks."""
+    src = '\n'.join(lines) + '\n'
+    file_name = f'<generated {fn_name} {uuid.uuid4()}>'
+    linecache.cache[file_name] = (len(src), None, src.splitlines(True), file_name)
+    eval(compile(src, file_name, 'exec'), globs)
+    return globs[fn_name]  # type: ignore[no-any-return]
+
+
+def _keyword_lines(
+        cls: Type[mixins.KeywordsMixin], globs: Dict[str, Any]
+) -> List[str]:
+    """Generate lines that initialize the keywords in `kws` like `KeywordsMixin`."""
+    globs.update(
+            _intern=sys.intern, _misc=frozenset(cls._misc_kw_names),
+            _no_kws=mixins.NO_KEYWORDS)
+    return [
+            '    kws = {_intern(k): v for k, v in kws.items()}',
+            '    inst._raw_kws = kws',
+            '    misc = {k: v for k, v in kws.items() if k in _misc and v is not None}',
+            '    inst._misc_kws = misc or _no_kws']
+
+
+def _adopt_lines(elements: str) -> List[str]:
+    """Generate lines that set the parent of the elements to `inst`."""
+    return [
+            '    ref = _ref(inst)',
+            f'    for el in {elements}:',
+            '        el._parent = ref']
+
+
+def make_task_structure_fn(cls: Type[mixins.KeywordsMixin]) -> StructureFn:
+    """Generate a structure function for a task class."""
+    _check_inits(cls)
+    fn_name = f'structure_{cls.__name__}'
+    globs: Dict[str, Any] = {'_cls': cls, '_new': object.__new__}
+    lines = [
+            f'def {fn_name}(kws, _=None):',
+            '    inst = _new(_cls)',
+            '    inst._parent = None',
+            *_keyword_lines(cls, globs),
+            '    return inst']
+    return _compile(fn_name, lines, globs)
+
+
+def make_block_structure_fn(
+        cls: Type[mixins.KeywordsMixin], task_fn: StructureFn
+) -> StructureFn:
+    """Generate a structure function for a block class.
+
+    Nested blocks are structured recursively, other children with `task_fn`.
+    """
+    _check_inits(cls)
+    fn_name = f'structure_{cls.__name__}'
+    globs: Dict[str, Any] = {
+            '_cls': cls, '_new': object.__new__, '_ref': weakref.ref,
+            '_st': task_fn}
+    lines = [
+            f'def {fn_name}(kws, _=None):',
+            '    inst = _new(_cls)',
+            '    inst._parent = None',
+            *_keyword_lines(cls, globs)]
+    for cont_name in _BLOCK_CONTAINERS:
+        lines += [
+                f'    if {cont_name!r} in kws:',
+                f'        kws[{cont_name!r}] = [',
+                '                _sb(c) if "block" in c else _st(c)',
+                f'                for c in kws[{cont_name!r}]]']
+    # The containers default to empty tuples.
+    lines.append('    els = []')
+    for cont_name in _BLOCK_CONTAINERS:
+        lines += [
+                f'    children = kws.get({cont_name!r})',
+                '    if children is not None:',
+                '        els.extend(children)']
+    lines += [
+            '    inst._elements = els',
+            *_adopt_lines('els'),
+            '    return inst']
+    fn = _compile(fn_name, lines, globs)
+    globs['_sb'] = fn
+    return fn
+
+
+def make_block_file_structure_fn(
+        cls: type, block_fn: StructureFn
+) -> StructureFn:
+    """Generate a structure function for a file of blocks."""
+    _check_inits(cls)
+    fn_name = f'structure_{cls.__name__}'
+    globs: Dict[str, Any] = {
+            '_cls': cls, '_new': object.__new__, '_ref': weakref.ref,
+            '_sb': block_fn}
+    lines = [
+            f'def {fn_name}(obj, _=None):',
+            '    inst = _new(_cls)',
+            '    inst._file_name = obj["file_name"]',
+            '    els = [_sb(c) for c in obj["content"]]',
+            '    inst._elements = els',
+            *_adopt_lines('els'),
+            '    return inst']
+    return _compile(fn_name, lines, globs)
+
+
+def make_variable_file_structure_fn(cls: type, var_cls: type) -> StructureFn:
+    """Generate a structure function for a file of variables."""
+    _check_inits(cls)
+    _check_inits(var_cls)
+    fn_name = f'structure_{cls.__name__}'
+    globs: Dict[str, Any] = {
+            '_cls': cls, '_vcls': var_cls, '_new': object.__new__,
+            '_ref': weakref.ref}
+    lines = [
+            f'def {fn_name}(obj, _=None):',
+            '    inst = _new(_cls)',
+            '    inst._file_name = obj["file_name"]',
+            '    els = []',
+            '    for name, value in obj["content"].items():',
+            '        var = _new(_vcls)',
+            '        var._name = name',
+            '        var._value = value',
+            '        els.append(var)',
+            '    inst._elements = els',
+            *_adopt_lines('els'),
+            '    return inst']
+    return _compile(fn_name, lines, globs)
+
+
+def make_block_unstructure_fn(
+        cls: type, child_fns: Mapping[type, UnstructureFn]
+) -> UnstructureFn:
+    """Generate an unstructure function for a block class.
+
+    Children are unstructured with the function for their type, or their
+    `unstructure` method if there is none.
+    """
+    fn_name = f'unstructure_{cls.__name__}'
+    globs: Dict[str, Any] = {'_fns': child_fns, '_any': _unstructure_any}
+    lines = [
+            f'def {fn_name}(inst):',
+            '    res = dict(inst._raw_kws)',
+            '    res.pop("content", None)']
+    for cont_name in _BLOCK_CONTAINERS:
+        lines += [
+                f'    if {cont_name!r} in res:',
+                f'        res[{cont_name!r}] = [',
+                '                _fns.get(c.__class__, _any)(c)',
+                f'                for c in res[{cont_name!r}]]']
+    lines.append('    return res')
+    return _compile(fn_name, lines, globs)
+
+
+def make_block_file_unstructure_fn(
+        cls: type, block_fn: UnstructureFn
+) -> UnstructureFn:
+    """Generate an unstructure function for a file of blocks."""
+    fn_name = f'unstructure_{cls.__name__}'
+    globs: Dict[str, Any] = {'_ub': block_fn}
+    lines = [
+            f'def {fn_name}(inst):',
+            '    return {',
+            '        "file_name": inst._file_name,',
+            '        "content": [_ub(c) for c in inst._elements]}']
+    return _compile(fn_name, lines, globs)
+
+
+def _unstructure_any(obj: Any) -> Any:
+    return obj.unstructure()
+
+
+def _unstructure_task(inst: mixins.KeywordsMixin) -> Dict[str, Any]:
+    return dict(inst._raw_kws)
+
+
+def register_block_hooks(
+        converter: Any, task_cls: type, block_cls: type, file_cls: type
+) -> None:
+    """Register generated hooks for a task, block and block file class."""
+    task_fn = make_task_structure_fn(task_cls)
+    block_fn = make_block_structure_fn(block_cls, task_fn)
+    converter.register_structure_hook(task_cls, task_fn)
+    converter.register_structure_hook(block_cls, block_fn)
+    converter.register_structure_hook(
+            file_cls, make_block_file_structure_fn(file_cls, block_fn))
+
+    child_fns: Dict[type, UnstructureFn] = {task_cls: _unstructure_task}
+    unstructure_block = make_block_unstructure_fn(block_cls, child_fns)
+    child_fns[block_cls] = unstructure_block
+    converter.register_unstructure_hook(task_cls, _unstructure_task)
+    converter.register_unstructure_hook(block_cls, unstructure_block)
+    converter.register_unstructure_hook(
+            file_cls, make_block_file_unstructure_fn(file_cls, unstructure_block))
+
+
+def register_variable_hooks(
+        converter: Any, var_cls: type, file_cls: type
+) -> None:
+    """Register generated hooks for a variable file class."""
+    converter.register_structure_hook(
+            file_cls, make_variable_file_structure_fn(file_cls, var_cls))
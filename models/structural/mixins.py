@@ -7,6 +7,7 @@ from typing import (
     Collection,
     Dict,
     Generic,
+    Iterator,
     List,
     Mapping,
     Optional,
@@ -21,6 +22,7 @@ from typing import (
 
 import abc
 import re
+import sys
 import weakref
 
 import ansible.playbook as anspb
@@ -49,6 +51,46 @@ ObjectWithParentType = TypeVar('ObjectWithParentType', bound='_CanSetParent')
 # The source of a transformation
 SourceType = TypeVar('SourceType')
 
+class _NoKeywords(Mapping[str, Value]):
+    """Immutable empty mapping, shared by all objects without misc keywords."""
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> Value:
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(())
+
+    def __len__(self) -> int:
+        return 0
+
+    def __repr__(self) -> str:
+        return '{}'
+
+    def __reduce__(self) -> str:
+        # Unpickled and copied objects keep sharing the singleton.
+        return 'NO_KEYWORDS'
+
+
+NO_KEYWORDS: Mapping[str, Value] = _NoKeywords()
+
+
+def get_state(obj: object) -> Dict[str, Any]:
+    """Get the attributes of an object, both in slots and its `__dict__`."""
+    state = dict(getattr(obj, '__dict__', {}))
+    for cls in type(obj).__mro__:
+        slots = vars(cls).get('__slots__', ())
+        for name in ((slots,) if isinstance(slots, str) else slots):
+            if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    return state
+
+
+def set_state(obj: object, state: Mapping[str, Any]) -> None:
+    """Restore attributes retrieved by `get_state`."""
+    for name, value in state.items():
+        object.__setattr__(obj, name, value)
+
 
 class _CanSetParent(Protocol):
     @property
@@ -64,6 +106,8 @@ class ObjectContainerMixin(
         abc.ABC, Sequence[ObjectWithParentType]
 ):
     """Mixin for containers of role objects."""
+    __slots__ = ()
+
     def __init__(
             self, *args: object, elements: Collection[ObjectWithParentType],
             **kwargs: object
@@ -74,6 +118,13 @@ class ObjectContainerMixin(
         for e in self._elements:
             e.parent = self
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Parent references aren't pickled (see ChildObjectMixin), restore
+        # them on the unpickled elements.
+        set_state(self, state)
+        for e in self._elements:
+            e.parent = self
+
     def __len__(self) -> int:
         return len(self._elements)
 
@@ -93,6 +144,8 @@ class ObjectContainerMixin(
 
 class ChildObjectMixin(Generic[ParentType]):
     """Mixin for role objects with a parent, such as tasks."""
+    __slots__ = ()
+
     def __init__(
             self, *args: object, **kwargs: object
     ) -> None:
@@ -111,13 +164,33 @@ class ChildObjectMixin(Generic[ParentType]):
     def parent(self, parent: ParentType) -> None:
         self._parent = weakref.ref(parent)
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Weak references cannot be pickled. The parent restores the reference
+        # when it is unpickled itself.
+        state = get_state(self)
+        state['_parent'] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        set_state(self, state)
+
 
 _KwMixin = TypeVar('_KwMixin', bound='KeywordsMixin')
+_IMMUTABLE_DEFAULT_TYPES = (tuple, frozenset, str, int, float, type(None))
 class KeywordsMixin:
-    """Mixin for objects accepting base keywords."""
+    """Mixin for objects accepting base keywords.
+
+    The keywords are only stored in the mapping they were created from, the
+    properties of the interested keywords read them from it. Keyword names
+    are interned, since the same few names occur in every task and block.
+    Absent keywords read as their default, which is created once and shared
+    by all instances, so defaults must be immutable.
+    """
+    __slots__ = ()
 
     _interested_kw_names: ClassVar[KwList]
     _misc_kw_names: ClassVar[KwList]
+    _kw_defaults: ClassVar[Dict[str, Optional[Value]]]
 
     def __init_subclass__(
             cls,
@@ -130,8 +203,11 @@ class KeywordsMixin:
         assert new_interested_kws.issubset(all_kws)
 
         for kw_name in new_interested_kws:
-            def getter(self: KeywordsMixin, kw_name: str = kw_name) -> object:
-                return getattr(self, f'_{kw_name}')
+            def getter(self: KeywordsMixin, kw_name: str = sys.intern(kw_name)) -> object:
+                kws = self._raw_kws
+                if kw_name in kws:
+                    return kws[kw_name]
+                return self._kw_defaults.get(kw_name)
             setattr(cls, kw_name, property(getter))
 
         cls._interested_kw_names = (
@@ -140,6 +216,14 @@ class KeywordsMixin:
         cls._misc_kw_names = (
                 (all_kws | getattr(cls, '_misc_kw_names', set()))
                     - cls._interested_kw_names)
+        cls._kw_defaults = {
+                kw_name: cls.get_default(kw_name)
+                for kw_name in cls._interested_kw_names
+                if hasattr(cls, f'_{kw_name}_default')}
+        # Mutating a shared default would change it for every instance.
+        assert all(
+                isinstance(default, _IMMUTABLE_DEFAULT_TYPES)
+                for default in cls._kw_defaults.values())
 
     @staticmethod
     def get_all_kws(ans_type: Type[anspb.base.Base]) -> KwList:
@@ -174,17 +258,12 @@ class KeywordsMixin:
     ) -> None:
         super().__init__(*args, **kwargs)  # type: ignore[call-arg]
 
-        self._raw_kws = kws
-        for interested_kw_name in self._interested_kw_names:
-            if interested_kw_name in kws:
-                kw_value = kws[interested_kw_name]
-            else:
-                kw_value = self.get_default(interested_kw_name)
-            setattr(self, f'_{interested_kw_name}', kw_value)
-
-        self._misc_kws: Mapping[str, Value] = {
-                kw_name: kw_val for kw_name in self._misc_kw_names
-                if (kw_val := kws.get(kw_name)) is not None}
+        self._raw_kws: Mapping[str, Value] = {
+                sys.intern(kw_name): kw_val for kw_name, kw_val in kws.items()}
+        misc_kws = {
+                kw_name: kw_val for kw_name, kw_val in self._raw_kws.items()
+                if kw_name in self._misc_kw_names and kw_val is not None}
+        self._misc_kws: Mapping[str, Value] = misc_kws or NO_KEYWORDS
 
 
     @classmethod
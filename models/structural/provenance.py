@@ -16,6 +16,7 @@ else:
 import graphviz as gv
 
 class GraphvizMixin:
+    __slots__ = ()
 
     _gv_color: ClassVar[str]
     _gv_shape: ClassVar[str]
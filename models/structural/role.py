@@ -11,6 +11,7 @@ from typing import (
         Sequence,
         IO,
         Tuple,
+        TypeVar,
         Union,
         cast,
         TYPE_CHECKING
@@ -26,10 +27,6 @@ from pathlib import Path
 import attr
 import cattr
 import yaml
-try:
-    from yaml import CLoader as Loader, CDumper as Dumper
-except ImportError:
-    from yaml import Loader, Dumper  # type: ignore[misc]
 
 import ansible as ans
 import ansible.inventory.manager as ansinvmgr
@@ -40,12 +37,16 @@ import ansible.playbook.role as ansrole
 import ansible.playbook.role.include as ansrinc
 
 from models.base import Model
-from . import abstract, base, diff, mixins
+from models import serialize
+from . import abstract, base, diff, hooks, mixins
+from .cache import ParsedFileCache, has_static_imports
+from .storage import DEFAULT_STORAGE_FORMAT, STORAGE_FORMATS, check_serializable, format_for_path
 from .types import AnsTaskOrBlock, Value, convert_to_native
 from .provenance import GraphvizMixin, SMGraph, pformat
 
 
 FileList = List[mixins.FileType]
+_ParsedType = TypeVar('_ParsedType')
 
 @attr.s(auto_attribs=True)
 class BrokenFile:
@@ -74,6 +75,10 @@ class MetaFile(base.BaseFile, GraphvizMixin, diff.DiffableMixin):
         self._metablock = metablock
         metablock.parent = self
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._metablock.parent = self
+
     @property
     def metablock(self) -> MetaBlock:
         return self._metablock
@@ -173,15 +178,29 @@ class MetaBlock(
         except KeyError:
             return dep['name']
 
-    _dependencies_default = list
+    _dependencies_default = tuple
 
     def gv_visit(self, g: SMGraph) -> None:
         g.add_node(self, None)
         self.gv_visit_keywords(g)
 
+    @diff.cached_fingerprint
+    def fingerprint(self) -> Optional[bytes]:
+        platforms = [(p.name, p.version) for p in self.platforms]
+        try:
+            parts = [
+                    diff.encode_value(self.dependencies),
+                    diff.encode_value(dict(self.misc_keywords)),
+                    diff.encode_value(platforms)]
+        except TypeError:
+            return None
+        return diff.combine_fingerprints(self.__class__.__name__, parts)
+
     def diff(self, other: MetaBlock) -> Sequence[diff.Diff]:
         if not isinstance(other, MetaBlock):
             raise NotImplementedError
+        if diff.same_fingerprint(self, other):
+            return []
 
         diff_platforms = diff.diff_set(
                 set(self.platforms), set(other.platforms),
@@ -254,7 +273,7 @@ class Task(
         base.TasksTrait,
         abstract.AbstractTask['Block']
 ):
-    pass
+    __slots__ = ()
 
 
 class HandlerTask(
@@ -263,7 +282,7 @@ class HandlerTask(
         mixins.KeywordsMixin,
         ans_type=anspbh.Handler,
         extra_kws={'listen'}):
-    pass
+    __slots__ = ()
 
 
 # Bug in typing? "Too many parameters for abstract.AbstractBlock"
@@ -272,27 +291,27 @@ if TYPE_CHECKING:
             base.TasksTrait,
             abstract.AbstractBlock['Task', 'Block', 'TaskFile']
     ):
-        pass
+        __slots__ = ()
 
 
     class HandlerBlock(
             base.HandlersTrait,
             abstract.AbstractBlock['HandlerTask', 'HandlerBlock', 'HandlerFile']
     ):
-        pass
+        __slots__ = ()
 else:
     class Block(
             base.TasksTrait,
             abstract.AbstractBlock[Task]
     ):
-        pass
+        __slots__ = ()
 
 
     class HandlerBlock(
             base.HandlersTrait,
             abstract.AbstractBlock[HandlerTask]
     ):
-        pass
+        __slots__ = ()
 
 class TaskFile(
         base.TasksTrait,
@@ -321,13 +340,6 @@ class HandlerFile(
 
 
 
-for tpe in (MetaFile, DefaultVarFile, RoleVarFile, HandlerFile, TaskFile):
-    CONVERTER.register_structure_hook(
-        tpe,
-        lambda obj, cls: cls.structure(obj))  # type: ignore[attr-defined, misc, no-any-return]
-    CONVERTER.register_unstructure_hook(  # type: ignore[misc]
-        tpe, lambda inst: inst.unstructure())  # type: ignore[attr-defined, no-any-return]
-
 class RoleMetadata(ansrole.metadata.RoleMetadata):
     """Custom role to disable dependency resolving."""
 
@@ -385,12 +397,26 @@ class Role(GraphvizMixin, diff.DiffableMixin, gv_shape='ellipse'):
         self.gv_visit_children(g, 'tasks', self.task_files)
         self.gv_visit_children(g, 'handlers', self.handler_files)
 
+    @diff.cached_fingerprint
+    def fingerprint(self) -> Optional[bytes]:
+        parts: List[Optional[bytes]] = [self.meta_file.metablock.fingerprint]
+        for files in (self.default_var_files, self.role_var_files, self.task_files, self.handler_files):
+            parts.append(diff.encode_value(len(files)))
+            parts.extend(f.fingerprint for f in files)
+        return diff.combine_fingerprints(self.__class__.__name__, parts)
+
     def diff(self, other: Role) -> Sequence[diff.Diff]:
-        mdiff = self.meta_file.diff(other.meta_file)
-        dvdiff = DefaultVarFile.diff_multiple(self.default_var_files, other.default_var_files)
-        rvdiff = RoleVarFile.diff_multiple(self.role_var_files, other.role_var_files)
-        tdiff = TaskFile.diff_multiple(self.task_files, other.task_files)
-        hdiff = HandlerFile.diff_multiple(self.handler_files, other.handler_files)
+        # Consecutive revisions are often identical.
+        if diff.same_fingerprint(self, other):
+            return []
+        # The same pairs are scored repeatedly while matching and relocating
+        # blocks and tasks.
+        with diff.similarity_memo():
+            mdiff = self.meta_file.diff(other.meta_file)
+            dvdiff = DefaultVarFile.diff_multiple(self.default_var_files, other.default_var_files)
+            rvdiff = RoleVarFile.diff_multiple(self.role_var_files, other.role_var_files)
+            tdiff = TaskFile.diff_multiple(self.task_files, other.task_files)
+            hdiff = HandlerFile.diff_multiple(self.handler_files, other.handler_files)
         return list(chain(mdiff, dvdiff, rvdiff, tdiff, hdiff))
 
     @classmethod
@@ -411,8 +437,7 @@ class Role(GraphvizMixin, diff.DiffableMixin, gv_shape='ellipse'):
     @classmethod
     def _load_files(
             cls, files_dir: Path,
-            factory: Callable[[Path, mixins.SourceType], mixins.FileType],
-            loader: Callable[[Path], mixins.SourceType],
+            parser: Callable[[Path], mixins.FileType],
             top_level: bool = True,
     ) -> Tuple[FileList[mixins.FileType], Sequence[Tuple[Path, str]]]:
         fl: List[mixins.FileType] = []
@@ -427,15 +452,15 @@ class Role(GraphvizMixin, diff.DiffableMixin, gv_shape='ellipse'):
         for file in all_files:
             if file.is_dir():
                 files, broken_files = cls._load_files(
-                        file, factory, loader, False)
+                        file, parser, False)
                 fl.extend(files)
                 broken.extend(broken_files)
             elif file.suffix.lower() in ('.yml', '.yaml', '.json'):
                 try:
                     if file.stem == 'main' and top_level:
-                        fl.insert(0, factory(file, loader(file)))
+                        fl.insert(0, parser(file))
                     else:
-                        fl.append(factory(file, loader(file)))
+                        fl.append(parser(file))
                 except ans.errors.AnsibleError as err:
                     broken.append((file, str(err)))
         return list(fl), broken
@@ -486,23 +511,85 @@ class Role(GraphvizMixin, diff.DiffableMixin, gv_shape='ellipse'):
         except ans.errors.AnsibleError as e:
             return RoleMetadata(), ((role_path / 'meta/main.yml'), str(e))
 
+    @staticmethod
+    def _cached(
+            cache: Optional[ParsedFileCache], log_capture: LogCapture,
+            kind: str, file_name: str, content: Optional[bytes],
+            parse: Callable[[], _ParsedType],
+            cacheable: Callable[[_ParsedType], bool] = lambda _: True
+    ) -> _ParsedType:
+        """Parse a file through the cache, replaying its captured output."""
+        if cache is None or content is None:
+            return parse()
+
+        parsed = False
+        def parse_with_logs() -> Tuple[_ParsedType, List[str]]:
+            nonlocal parsed
+            parsed = True
+            num_logs = len(log_capture.logs)
+            obj = parse()
+            return obj, log_capture.logs[num_logs:]
+
+        obj, logs = cache.get_or_parse(
+                kind, file_name, content, parse_with_logs,
+                lambda entry: cacheable(entry[0]))
+        if not parsed:
+            log_capture.logs.extend(logs)
+        return obj
+
+    @staticmethod
+    def _read_meta_content(role_path: Path) -> Optional[bytes]:
+        # Ansible picks one of the candidate meta/main files, key the cache on
+        # all of them.
+        candidates = sorted((role_path / 'meta').glob('main*'))
+        if any(not cand.is_file() for cand in candidates):
+            return None
+        return b'\0'.join(
+                cand.name.encode('utf-8') + b'\0' + cand.read_bytes()
+                for cand in candidates)
+
     @classmethod
-    def load_from_ans_obj(cls, role_path: Path) -> Role:
+    def load_from_ans_obj(
+            cls, role_path: Path, cache: Optional[ParsedFileCache] = None
+    ) -> Role:
+        """Load a role from disk.
+
+        When given a `cache`, files whose content has been parsed before are
+        taken from the cache instead of being parsed again.
+        """
         role_path = role_path.resolve()
         log_capture = LogCapture()
         with redirect_stdout(log_capture), redirect_stderr(log_capture):  # type: ignore[arg-type]
             role = cls._load_role(role_path)
             # Load the metadata
-            meta_obj, broken_meta = cls._load_metadata_obj(role_path, role)
-            meta = MetaFile.from_ans_object('meta/main.yml', meta_obj)
+            def parse_meta() -> Tuple[MetaFile, Optional[Tuple[Path, str]]]:
+                meta_obj, broken_meta = cls._load_metadata_obj(role_path, role)
+                return MetaFile.from_ans_object('meta/main.yml', meta_obj), broken_meta
+            meta, broken_meta = cls._cached(
+                    cache, log_capture, MetaFile.__name__, 'meta/main.yml',
+                    cls._read_meta_content(role_path) if cache is not None else None,
+                    parse_meta,
+                    # Broken files refer to the role path, don't cache them.
+                    cacheable=lambda parsed: parsed[1] is None)
             broken_meta_files = []
             if broken_meta is not None:
                 broken_meta_files.append(broken_meta)
 
-            def obj_fact_factory(
-                    obj_fact: Callable[[str, mixins.SourceType], mixins.FileType]
-            ) -> Callable[[Path, mixins.SourceType], mixins.FileType]:
-                return lambda p, o: obj_fact(str(p.relative_to(role_path)), o)
+            def file_parser(
+                    obj_fact: Callable[[str, mixins.SourceType], mixins.FileType],
+                    loader: Callable[[Path], mixins.SourceType],
+                    kind: str
+            ) -> Callable[[Path], mixins.FileType]:
+                def parse(p: Path) -> mixins.FileType:
+                    file_name = str(p.relative_to(role_path))
+                    content = p.read_bytes() if cache is not None else None
+                    if content is not None and has_static_imports(content):
+                        # Depends on the imported files too, don't cache it.
+                        content = None
+                    return cls._cached(
+                            cache, log_capture, kind, file_name, content,
+                            lambda: obj_fact(file_name, loader(p)))
+                return parse
 
             var_loader = partial(cls._load_vars, r=role)
             task_loader = partial(cls._load_tasks, r=role)
@@ -510,16 +597,16 @@ class Role(GraphvizMixin, diff.DiffableMixin, gv_shape='ellipse'):
 
             dfs, bdfs = cls._load_files(
                     role_path / 'defaults',
-                    obj_fact_factory(DefaultVarFile.from_ans_object), var_loader)
+                    file_parser(DefaultVarFile.from_ans_object, var_loader, DefaultVarFile.__name__))
             cfs, bcfs = cls._load_files(
                     role_path / 'vars',
-                    obj_fact_factory(RoleVarFile.from_ans_object), var_loader)
+                    file_parser(RoleVarFile.from_ans_object, var_loader, RoleVarFile.__name__))
             tfs, btfs = cls._load_files(
                     role_path / 'tasks',
-                    obj_fact_factory(TaskFile.from_ans_object), task_loader)
+                    file_parser(TaskFile.from_ans_object, task_loader, TaskFile.__name__))
             hfs, bhfs = cls._load_files(
                     role_path / 'handlers',
-                    obj_fact_factory(HandlerFile.from_ans_object), handler_loader)
+                    file_parser(HandlerFile.from_ans_object, handler_loader, HandlerFile.__name__))
 
         def transform_broken(broken_file: Tuple[Path, str]) -> BrokenFile:
             path, reason = broken_file
@@ -543,20 +630,49 @@ class StructuralRoleModel(Model):
         return f'{self.role_id}@{self.role_rev}'
 
     @classmethod
-    def create(cls, role_path: Path, role_id: str, role_rev: str) -> 'StructuralRoleModel':
-        model = cls(role_root=Role.load_from_ans_obj(role_path), role_id=role_id, role_rev=role_rev)
+    def create(
+            cls, role_path: Path, role_id: str, role_rev: str,
+            cache: Optional[ParsedFileCache] = None,
+            strict_validation: bool = False
+    ) -> 'StructuralRoleModel':
+        model = cls(role_root=Role.load_from_ans_obj(role_path, cache), role_id=role_id, role_rev=role_rev)
 
         # Make sure serialization and deserialization will work, catch problems early
         # unstructured = CONVERTER.unstructure(model.role_root)
         # assert unstructured == CONVERTER.unstructure(CONVERTER.structure(unstructured, Role))
         # assert unstructured == CONVERTER.unstructure(model.role_root)
 
-        # Make sure we can actually dump it to a file without tags
-        can_be_serialized = yaml.safe_dump(CONVERTER.unstructure(model.role_root))
-        assert can_be_serialized
-
+        model.unstructure_checked(strict_validation)
         return model
 
+    @classmethod
+    def create_unstructured(
+            cls, role_path: Path, role_id: str, role_rev: str,
+            cache: Optional[ParsedFileCache] = None,
+            strict_validation: bool = False
+    ) -> Dict[str, Any]:
+        """Create the model of a role in its unstructured form.
+
+        Validated like in `create`, but only the unstructured form is kept,
+        so that it can be handed to the dump as-is.
+        """
+        model = cls(role_root=Role.load_from_ans_obj(role_path, cache), role_id=role_id, role_rev=role_rev)
+        return model.unstructure_checked(strict_validation)
+
+    def unstructure_checked(self, strict_validation: bool = False) -> Dict[str, Any]:
+        """Unstructure the model, making sure it can be dumped without tags.
+
+        Strict validation does a dry run of the dump, otherwise only the types
+        of the unstructured form are checked.
+        """
+        unstructured = cast(Dict[str, Any], CONVERTER.unstructure(self))
+        if strict_validation:
+            can_be_serialized = yaml.safe_dump(unstructured)
+            assert can_be_serialized
+        else:
+            check_serializable(unstructured)
+        return unstructured
+
 
 @attr.s(auto_attribs=True)
 class MultiStructuralRoleModel(Model):
@@ -567,10 +683,13 @@ class MultiStructuralRoleModel(Model):
     def id(self) -> str:
         return str(self.role_id)
 
-    def dump(self, dirpath: Path) -> Path:
+    def dump(
+            self, dirpath: Path, storage_format: str = DEFAULT_STORAGE_FORMAT
+    ) -> Path:
         """Dump the object to disk and return its path."""
-        target = dirpath / (self.role_id + '.yaml')
-        target.write_text(yaml.dump(CONVERTER.unstructure(self.structural_models), Dumper=Dumper))
+        fmt = STORAGE_FORMATS[storage_format]
+        target = dirpath / (self.role_id + fmt.suffix)
+        fmt.dump(self.unstructure_models(), target)
         return target
 
     @classmethod
@@ -578,16 +697,105 @@ class MultiStructuralRoleModel(Model):
         """Load an object from disk."""
         return _LazyProxy(id, file_path)
 
+    @classmethod
+    def from_unstructured(
+            cls, role_id: str, data: List[Dict[str, Any]]
+    ) -> MultiStructuralRoleModel:
+        """Create from unstructured models, structuring them only on access."""
+        return _UnstructuredModels(role_id, data)
+
+    def unstructure_models(self) -> List[Dict[str, Any]]:
+        """Get the unstructured form of the models, as they're stored."""
+        return cast(List[Dict[str, Any]], CONVERTER.unstructure(self.structural_models))
+
+    def revisions(self) -> List[str]:
+        """Get the revisions of the models, in order."""
+        return [model.role_rev for model in self.structural_models]
+
 
 class _LazyProxy(MultiStructuralRoleModel):
 
     def __init__(self, role_id: str, file_path: Path) -> None:
         self.role_id = role_id
         self._file_path = file_path
+        self._revisions: Optional[List[str]] = None
+
+    def dump(
+            self, dirpath: Path, storage_format: str = DEFAULT_STORAGE_FORMAT
+    ) -> Path:
+        """Dump the object to disk and return its path."""
+        target = dirpath / (self.role_id + STORAGE_FORMATS[storage_format].suffix)
+        if target == self._file_path:
+            # Unchanged, no need to load and rewrite it.
+            return target
+        return super().dump(dirpath, storage_format)
 
     @property
     def structural_models(self) -> Sequence[StructuralRoleModel]:  # type: ignore[override]
         # Restructure each time. Inefficient if accessed multiple times, but
         # we'll only access it once when diffing and caching it would be pretty
         # bad for memory usage.
-        return CONVERTER.structure(yaml.load(self._file_path.read_text(), Loader=Loader), List[StructuralRoleModel])
+        return cast(
+                Sequence[StructuralRoleModel],
+                CONVERTER.structure(self.unstructure_models(), List[StructuralRoleModel]))
+
+    def unstructure_models(self) -> List[Dict[str, Any]]:
+        """Load the unstructured models, without structuring them."""
+        return cast(
+                List[Dict[str, Any]],
+                format_for_path(self._file_path).load(self._file_path))
+
+    def revisions(self) -> List[str]:
+        """Get the revisions of the models without structuring them.
+
+        The revisions are kept, so they're only loaded once.
+        """
+        if self._revisions is None:
+            self._revisions = [
+                    model['role_rev'] for model in self.unstructure_models()]
+        return self._revisions
+
+
+class _UnstructuredModels(MultiStructuralRoleModel):
+
+    def __init__(self, role_id: str, data: List[Dict[str, Any]]) -> None:
+        self.role_id = role_id
+        self._data = data
+
+    @property
+    def structural_models(self) -> Sequence[StructuralRoleModel]:  # type: ignore[override]
+        return cast(
+                Sequence[StructuralRoleModel],
+                CONVERTER.structure(self._data, List[StructuralRoleModel]))
+
+    def unstructure_models(self) -> List[Dict[str, Any]]:
+        return self._data
+
+    def revisions(self) -> List[str]:
+        return [model['role_rev'] for model in self._data]
+
+
+def register_hooks(converter: cattr.Converter, generated: bool = True) -> None:
+    """Register the (un)structure hooks for the role models on a converter.
+
+    With `generated`, tasks, blocks and their files are (un)structured by
+    functions generated for each class rather than their `structure` and
+    `unstructure` methods.
+    """
+    for tpe in (MetaFile, DefaultVarFile, RoleVarFile, HandlerFile, TaskFile):
+        converter.register_structure_hook(
+            tpe,
+            lambda obj, cls: cls.structure(obj))  # type: ignore[attr-defined, misc, no-any-return]
+        converter.register_unstructure_hook(  # type: ignore[misc]
+            tpe, lambda inst: inst.unstructure())  # type: ignore[attr-defined, no-any-return]
+    if not generated:
+        return
+
+    hooks.register_block_hooks(converter, Task, Block, TaskFile)
+    hooks.register_block_hooks(converter, HandlerTask, HandlerBlock, HandlerFile)
+    hooks.register_variable_hooks(converter, DefaultVariable, DefaultVarFile)
+    hooks.register_variable_hooks(converter, RoleVariable, RoleVarFile)
+
+
+register_hooks(CONVERTER)
+register_hooks(serialize.CONVERTER)
@@ -0,0 +1,152 @@
+"""Storage formats for serialized structural models."""
+from typing import Any, Dict, List, Set
+
+import datetime
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import yaml
+try:
+    from yaml import CLoader as Loader, CDumper as Dumper
+except ImportError:
+    from yaml import Loader, Dumper  # type: ignore[misc]
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class StorageFormat(ABC):
+    """A file format to store unstructured models in."""
+
+    name: str
+    suffix: str
+
+    @abstractmethod
+    def dump(self, data: Any, file_path: Path) -> None:
+        """Write unstructured data to a file."""
+        ...
+
+    @abstractmethod
+    def load(self, file_path: Path) -> Any:
+        """Read unstructured data from a file."""
+        ...
+
+
+class YAMLFormat(StorageFormat):
+    """Human-readable, but slow to read and write."""
+
+    name = 'yaml'
+    suffix = '.yaml'
+
+    def dump(self, data: Any, file_path: Path) -> None:
+        file_path.write_text(yaml.dump(data, Dumper=Dumper))
+
+    def load(self, file_path: Path) -> Any:
+        return yaml.load(file_path.read_text(), Loader=Loader)
+
+
+# Extension types for values that YAML supports natively but msgpack doesn't.
+_EXT_SET = 1
+_EXT_DATETIME = 2
+_EXT_DATE = 3
+_EXT_BIGINT = 4
+
+
+class MsgpackFormat(StorageFormat):
+    """Compact binary format, an order of magnitude faster to load than YAML."""
+
+    name = 'msgpack'
+    suffix = '.msgpack'
+
+    def _check_available(self) -> None:
+        if msgpack is None:
+            raise RuntimeError(
+                    'The msgpack storage format requires the msgpack package')
+
+    def _encode_ext(self, obj: Any) -> Any:
+        if isinstance(obj, (set, frozenset)):
+            return msgpack.ExtType(_EXT_SET, self._pack(list(obj)))
+        if isinstance(obj, datetime.datetime):
+            return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode('ascii'))
+        if isinstance(obj, datetime.date):
+            return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode('ascii'))
+        if isinstance(obj, int):
+            # Out of range for msgpack's 64-bit integers.
+            return msgpack.ExtType(_EXT_BIGINT, str(obj).encode('ascii'))
+        raise TypeError(f'Cannot serialize {type(obj).__name__} to msgpack')
+
+    def _decode_ext(self, code: int, data: bytes) -> Any:
+        if code == _EXT_SET:
+            return set(self._unpack(data))
+        if code == _EXT_DATETIME:
+            return datetime.datetime.fromisoformat(data.decode('ascii'))
+        if code == _EXT_DATE:
+            return datetime.date.fromisoformat(data.decode('ascii'))
+        if code == _EXT_BIGINT:
+            return int(data.decode('ascii'))
+        return msgpack.ExtType(code, data)
+
+    def _pack(self, data: Any) -> bytes:
+        return msgpack.packb(  # type: ignore[no-any-return]
+                data, default=self._encode_ext, use_bin_type=True)
+
+    def _unpack(self, data: bytes) -> Any:
+        return msgpack.unpackb(
+                data, ext_hook=self._decode_ext, raw=False,
+                strict_map_key=False)
+
+    def dump(self, data: Any, file_path: Path) -> None:
+        self._check_available()
+        file_path.write_bytes(self._pack(data))
+
+    def load(self, file_path: Path) -> Any:
+        self._check_available()
+        return self._unpack(file_path.read_bytes())
+
+
+STORAGE_FORMATS: Dict[str, StorageFormat] = {
+        fmt.name: fmt for fmt in (YAMLFormat(), MsgpackFormat())}
+DEFAULT_STORAGE_FORMAT = 'yaml'
+
+
+def format_for_path(file_path: Path) -> StorageFormat:
+    """Get the storage format of a file from its suffix."""
+    for fmt in STORAGE_FORMATS.values():
+        if file_path.suffix == fmt.suffix:
+            return fmt
+    raise ValueError(f'Unknown storage format for {file_path}')
+
+
+# Types that yaml.safe_dump can represent. Representers are looked up by exact
+# type, so subclasses, e.g. Ansible's tagged strings, are rejected.
+_SAFE_TYPES = frozenset(
+        tpe for tpe in yaml.SafeDumper.yaml_representers if tpe is not None)
+_SAFE_CONTAINER_TYPES = (list, tuple, set)
+
+
+def check_serializable(data: Any) -> None:
+    """Check that unstructured data can be dumped without YAML tags.
+
+    Equivalent to a dry run of yaml.safe_dump, but only walks the types.
+    Raises a TypeError for the first value that cannot be represented.
+    """
+    todo: List[Any] = [data]
+    seen: Set[int] = set()
+    while todo:
+        obj = todo.pop()
+        tpe = type(obj)
+        if tpe not in _SAFE_TYPES:
+            raise TypeError(f'Cannot safely serialize {tpe.__name__}: {obj!r}')
+        if tpe is dict or tpe in _SAFE_CONTAINER_TYPES:
+            # Shared containers are dumped as aliases.
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if tpe is dict:
+                todo.extend(obj.keys())
+                todo.extend(obj.values())
+            else:
+                todo.extend(obj)
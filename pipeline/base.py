@@ -1,12 +1,13 @@
 """Base pipeline stage."""
 from typing import (
-        Any, ClassVar, Dict, Generic, Iterable, Iterator, Mapping,
+        Any, ClassVar, Counter, Dict, Generic, Iterable, Iterator, Mapping,
         Optional, Protocol, Sequence, Tuple, Type, TypeVar, Union,
         cast, final, get_origin, get_args, TYPE_CHECKING)
 
 import collections.abc
 import json
 import operator
+import os
 
 from abc import ABC, abstractmethod
 from pathlib import Path
@@ -14,6 +15,10 @@ from pathlib import Path
 import cattr
 import click
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore[misc]
 
 from config import MainConfig
 from models import Model
@@ -60,8 +65,57 @@ class CacheMiss(Exception):
     """Raised on cache miss."""
 
 
+class ResultLoadError(Exception):
+    """Raised when a result stored in the dataset cannot be loaded."""
+
+
 STAGES: Dict[Type['Stage[Any, Any]'], Type[Any]] = {}
 
+INDEX_FILE_NAME = 'index.yaml'
+# One JSON array of [result ID, path] per line. Much faster to read than the
+# YAML index, which is still written for humans and external tools.
+COMPACT_INDEX_FILE_NAME = 'index.jsonl'
+
+
+def write_index(dataset_dir_path: Path, index: Mapping[IDType, str]) -> None:
+    """Write the index of a stage's results, in both formats.
+
+    Both are replaced atomically, so a crash never leaves a partial index.
+    """
+    sorted_index = dict(sorted(index.items()))
+    for file_name in (INDEX_FILE_NAME, COMPACT_INDEX_FILE_NAME):
+        index_path = dataset_dir_path / file_name
+        tmp_path = index_path.with_name(file_name + '.tmp')
+        with tmp_path.open('wt') as f_index:
+            if file_name == INDEX_FILE_NAME:
+                yaml.dump(sorted_index, f_index, sort_keys=True)
+            else:
+                for item in sorted_index.items():
+                    f_index.write(json.dumps(item) + '\n')
+        os.replace(tmp_path, index_path)
+
+
+def read_index(dataset_dir_path: Path) -> Dict[IDType, str]:
+    """Read the index of a stage's results.
+
+    Prefers the compact index, falling back to the YAML index for datasets
+    that predate it. Raises `OSError` when neither exists, `ValueError` or
+    `yaml.YAMLError` when the index is corrupt.
+    """
+    try:
+        with (dataset_dir_path / COMPACT_INDEX_FILE_NAME).open('rt') as f_index:
+            return {
+                    result_id: result_path
+                    for result_id, result_path in map(json.loads, f_index)}
+    except FileNotFoundError:
+        pass
+
+    with (dataset_dir_path / INDEX_FILE_NAME).open('rt') as f_index:
+        index = yaml.load(f_index, Loader=SafeLoader)
+    if not isinstance(index, dict):
+        raise ValueError(f'Malformed index in {dataset_dir_path}')
+    return index
+
 
 class ResultMap(Mapping[str, ResultType]):
     """Result container.
@@ -110,6 +164,56 @@ class ResultMap(Mapping[str, ResultType]):
         return self._storage[key]
 
 
+class LazyResultMap(ResultMap[ResultType]):
+    """Result container backed by the results stored in the dataset.
+
+    Only the index is kept in memory. Results are loaded from disk when
+    they're first accessed. Unless `retain` is set, they aren't kept
+    afterwards, so iterating through the map needs memory for a single
+    result at a time.
+    """
+
+    def __init__(
+            self, dataset_dir_path: Path, index: Mapping[IDType, str],
+            target_type: Type[ResultType], retain: bool = False
+    ) -> None:
+        """Initialize the map from a stage's dataset directory and index."""
+        self._storage = {}
+        self._dataset_dir_path = dataset_dir_path
+        self._index = dict(index)
+        self._target_type = target_type
+        self._retain = retain
+
+    def __iter__(self) -> Iterator[str]:
+        """Get an iterator through the mapping."""
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        """Get the size of the mapping."""
+        return len(self._index)
+
+    def __contains__(self, key: object) -> bool:
+        """Check whether a result exists, without loading it."""
+        return key in self._index
+
+    def __getitem__(self, key: str) -> ResultType:
+        """Load an item of the mapping from disk."""
+        try:
+            return self._storage[key]
+        except KeyError:
+            pass
+        result_path = self._dataset_dir_path / self._index[key]
+        try:
+            result = cast(ResultType, self._target_type.load(key, result_path))
+        except (OSError, ValueError, yaml.YAMLError) as exc:
+            raise ResultLoadError(
+                    f'Cannot load result {key} from {result_path}: {exc}. The '
+                    'dataset is corrupt, regenerate it with --force.') from exc
+        if self._retain:
+            cast(Dict[IDType, ResultType], self._storage)[key] = result
+        return result
+
+
 def _extract_type_args_from_subclass(
         klass: Type['Stage[ResultType, ConfigType]']
 ) -> Optional[Tuple[Type[ResultType], Type[ConfigType]]]:
@@ -134,6 +238,12 @@ class Stage(ABC, Generic[ResultType, ConfigType]):
     Override `run` and `report_results` for custom logic.
     Override `dump` to dump the data to the dataset.
     Call `process` as a client.
+
+    `run` either returns a `ResultMap`, or yields the results one by one. In
+    the latter case, each result is dumped as soon as it is produced and is
+    then dropped, and the stage's results are a `LazyResultMap` that loads
+    them back from the dataset on access. Override `count_result` so that
+    the counts reported on such results are collected while they're stored.
     """
 
     # NOTE: `run` isn't included as an abstract method because each stage
@@ -143,6 +253,10 @@ class Stage(ABC, Generic[ResultType, ConfigType]):
 
     config: ConfigType
 
+    # Sums of `count_result` over the results stored by the last streaming
+    # run, None if the results weren't streamed.
+    stream_counts: Optional[Counter[str]] = None
+
     __requires__: ClassVar[Sequence[Type['Stage']]]  # type: ignore[type-arg]
 
     def __init__(self, config: ConfigType) -> None:
@@ -195,7 +309,10 @@ class Stage(ABC, Generic[ResultType, ConfigType]):
             results = stage._run_with_input()
 
         if not from_cache:
-            stage.store_in_dataset(results)
+            if results is None or isinstance(results, collections.abc.Mapping):
+                stage.store_in_dataset(results)
+            else:
+                results = stage.store_stream_in_dataset(results)
 
         if config.report and not (dependency and from_cache):
             stage.report_results(results)
@@ -206,7 +323,9 @@ class Stage(ABC, Generic[ResultType, ConfigType]):
 
 
     @final
-    def _run_with_input(self) -> ResultMap[ResultType]:
+    def _run_with_input(
+            self
+    ) -> Union[ResultMap[ResultType], Iterator[ResultType]]:
         """Run the stage, first getting the result of the requirement."""
         # Try getting the results of the requirement stage. Will only work
         # if the results are cached, or when the required configuration is
@@ -228,7 +347,7 @@ class Stage(ABC, Generic[ResultType, ConfigType]):
                         f'{req_name} OPTIONS... {name} OPTIONS...') from exc
 
         return cast(
-                ResultMap[ResultType],
+                Union[ResultMap[ResultType], Iterator[ResultType]],
                 self.run(**input_data))  # type: ignore[attr-defined]
 
     def store_in_dataset(self, results: ResultMap[ResultType]) -> None:
@@ -241,43 +360,134 @@ class Stage(ABC, Generic[ResultType, ConfigType]):
         index: Dict[str, str] = {}
         for result_id in results:
             # Don't catch OSErrors, need to be able to save the data.
-            cache_file_path = results[result_id].dump(dataset_dir_path)
+            cache_file_path = self.dump_result(
+                    results[result_id], dataset_dir_path)
             index[result_id] = str(
                     cache_file_path.relative_to(dataset_dir_path))
 
-        # Write the index
-        with (dataset_dir_path / 'index.yaml').open('wt') as f_index:
-            yaml.dump(index, f_index, sort_keys=True)
+        write_index(dataset_dir_path, index)
+        # Results of an interrupted streaming run were overwritten.
+        (dataset_dir_path / 'index.partial.jsonl').unlink(missing_ok=True)
+
+    def store_stream_in_dataset(
+            self, results: Iterable[ResultType]
+    ) -> LazyResultMap[ResultType]:
+        """Store results in the dataset while they're being produced.
+
+        Every result is dumped as soon as it is produced, and its index entry
+        is appended to a journal (`index.partial.jsonl`), so that the results
+        that were completed before a crash can be recovered through
+        `load_partial_from_dataset`. The index is only written once all
+        results have been stored. As long as the journal exists, the index of
+        the previous run no longer matches the stored files and
+        `load_from_dataset` won't use it.
+
+        Every access to the returned map loads the result from disk again, so
+        the counts of `count_result` are summed into `stream_counts` while
+        the results are stored.
+        """
+        dataset_dir_path = self.config.output_directory / self.dataset_dir_name
+        dataset_dir_path.mkdir(exist_ok=True, parents=True)
+        journal_path = dataset_dir_path / 'index.partial.jsonl'
+        index: Dict[str, str] = {}
+        counts: Counter[str] = collections.Counter()
+        with journal_path.open('at') as f_journal:
+            for result in results:
+                counts.update(self.count_result(result))
+                cache_file_path = self.dump_result(result, dataset_dir_path)
+                result_path = str(cache_file_path.relative_to(dataset_dir_path))
+                index[result.id] = result_path
+                f_journal.write(json.dumps([result.id, result_path]) + '\n')
+                f_journal.flush()
+
+        write_index(dataset_dir_path, index)
+        journal_path.unlink()
+        self.stream_counts = counts
+
+        return LazyResultMap(
+                dataset_dir_path, index, self._extract_result_type())
+
+    def load_partial_from_dataset(self) -> ResultMap[ResultType]:
+        """Load the results of a previous run, even if it was interrupted.
+
+        Results of an interrupted streaming run take precedence over those of
+        the last completed run.
+        """
+        dataset_dir_path = self.config.output_directory / self.dataset_dir_name
+        index: Dict[str, str] = {}
+        try:
+            index.update(read_index(dataset_dir_path))
+        except (OSError, ValueError, yaml.YAMLError):
+            pass
+        try:
+            with (dataset_dir_path / 'index.partial.jsonl').open('rt') as f_journal:
+                for line in f_journal:
+                    try:
+                        result_id, result_path = json.loads(line)
+                    except ValueError:
+                        # The last entry may have been cut off by the crash.
+                        continue
+                    index[result_id] = result_path
+        except OSError:
+            pass
+        return LazyResultMap(
+                dataset_dir_path, index, self._extract_result_type())
+
+    def count_result(self, result: ResultType) -> Mapping[str, int]:
+        """Get the counts of a result that `report_results` sums up."""
+        return {}
+
+    def result_counts(self, results: ResultMap[ResultType]) -> Counter[str]:
+        """Sum the counts of all results, for `report_results`.
+
+        Uses the counts collected while streaming the results if possible,
+        otherwise goes through the results once.
+        """
+        if self.stream_counts is not None:
+            return self.stream_counts
+        counts: Counter[str] = collections.Counter()
+        for result in results.values():
+            counts.update(self.count_result(result))
+        return counts
+
+    def dump_result(self, result: ResultType, dirpath: Path) -> Path:
+        """Dump a single result to the dataset and return its path.
+
+        Override to pass stage-specific options to the result's `dump`.
+        """
+        return result.dump(dirpath)
 
     def load_from_dataset(self) -> ResultMap[ResultType]:
         """Load the results of a previous run from the dataset.
 
-        Raises `CacheMiss` when not found in the dataset.
+        Only the index is read, results are loaded when they're first
+        accessed. Raises `CacheMiss` when the index or any of the indexed
+        files is not found in the dataset, or when a streaming run was
+        interrupted after overwriting some of the indexed files.
         """
-        print(self.config.output_directory)
-        print(self.dataset_dir_name)
         dataset_dir_path = self.config.output_directory / self.dataset_dir_name
         target_type: Type[ResultType] = self._extract_result_type()
-        result_type = Mapping[str, target_type]  # type: ignore[valid-type]
+
+        if (dataset_dir_path / 'index.partial.jsonl').exists():
+            print(f'Previous run of {self.__class__.__name__} was interrupted')
+            raise CacheMiss()
 
         # Open the index
         try:
-            with (dataset_dir_path / 'index.yaml').open('rt') as f_index:
-                index = yaml.full_load(f_index)
-
-            loaded: Dict[str, target_type] = {}  # type: ignore[valid-type]
-            for result_id, result_path in index.items():
-                result_full_path = dataset_dir_path / Path(result_path)
-                loaded[result_id] = target_type.load(
-                        result_id, result_full_path)
-
-            return ResultMap(loaded)
+            index = read_index(dataset_dir_path)
         except OSError as exc:
             raise CacheMiss()
-        except yaml.YAMLError as exc:
+        except (ValueError, yaml.YAMLError) as exc:
             print(exc)
             raise CacheMiss()
 
+        for result_path in index.values():
+            if not (dataset_dir_path / result_path).is_file():
+                print(f'Result file {result_path} is missing from {dataset_dir_path}')
+                raise CacheMiss()
+
+        return LazyResultMap(dataset_dir_path, index, target_type, retain=True)
+
     @classmethod
     def _extract_result_type(cls) -> Type[ResultType]:
         """Extract the result type through introspection on the subclass."""
@@ -313,4 +523,4 @@ class Stage(ABC, Generic[ResultType, ConfigType]):
         #                 number of types. Maybe check the run method?
 
         STAGES[cls] = type_args[1]
-        cls.__requires__ = requires
\ No newline at end of file
+        cls.__requires__ = requires
\ No newline at end of file
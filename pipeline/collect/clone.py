@@ -1,8 +1,10 @@
 """Clone stage."""
-from typing import Iterable, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import re
+import shutil
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import git
@@ -28,6 +30,18 @@ class AlreadyClonedException(CloneException):
 _GH_REPO_URL_FMT = 'https://github.com/{user}/{repo}.git'
 
 
+def _remove_partial_clone(repo_path: Path, keep_directory: bool) -> None:
+    """Remove what a failed clone left behind in a repository directory."""
+    if not keep_directory:
+        shutil.rmtree(repo_path, ignore_errors=True)
+        return
+    for child in repo_path.iterdir():
+        if child.is_dir() and not child.is_symlink():
+            shutil.rmtree(child, ignore_errors=True)
+        else:
+            child.unlink()
+
+
 class CloneProgress(git.RemoteProgress):
     """Print progress of a clone operation in tqdm."""
     _pbar: tqdm
@@ -90,21 +104,70 @@ class Clone(Stage[GitRepo, CloneConfig], requires=ExtractRoleMetadata):
         """Run the stage: Clone the repositories."""
         repo_paths = set()
         repos: Iterable[Repository] = extract_role_metadata['dummy'].repositories.values()
-        if self.config.progress:
-            repos = tqdm(repos, desc='Cloning repos')
 
+        for repo, result in self._clone_all(repos):
+            if isinstance(result, CloneException):  # pragma: no cover
+                tqdm.write(f'Failed to clone repository {repo.github_url}: {result}')
+                continue
+            repo_paths.add(result)
+        return ResultMap(repo_paths)
+
+    def _clone_all(
+            self, repos: Iterable[Repository]
+    ) -> Iterator[Tuple[Repository, Union[GitRepo, CloneException]]]:
+        """Clone all repositories, yielding each result as it is finished.
+
+        With more than one worker, repositories are cloned concurrently in a
+        thread pool. Only the overall progress is shown then, since the
+        progress bars of the individual clones would interleave.
+        """
+        if self.config.workers <= 1:
+            if self.config.progress:
+                repos = tqdm(repos, desc='Cloning repos')
+            for repo in repos:
+                yield repo, self._clone_repo(repo, verbose=True)
+            return
+
+        # Repositories that map onto the same directory are cloned one after
+        # the other, as they would be without workers. Otherwise, they'd race
+        # to clone into the same directory.
+        groups: Dict[Tuple[str, ...], List[Repository]] = {}
         for repo in repos:
             try:
-                user, repo_name = self._parse_info(repo)
+                key: Tuple[str, ...] = self._parse_info(repo)
+            except CloneException:
+                key = (repo.github_url,)
+            groups.setdefault(key, []).append(repo)
+
+        total = sum(len(group) for group in groups.values())
+        pbar = tqdm(total=total, desc='Cloning repos', disable=not self.config.progress)
+        with pbar, ThreadPoolExecutor(max_workers=self.config.workers) as executor:
+            futures = [
+                    executor.submit(self._clone_group, group)
+                    for group in groups.values()]
+            for future in as_completed(futures):
+                for repo, result in future.result():
+                    pbar.update(1)
+                    yield repo, result
+
+    def _clone_group(
+            self, repos: List[Repository]
+    ) -> List[Tuple[Repository, Union[GitRepo, CloneException]]]:
+        return [(repo, self._clone_repo(repo, progress=False)) for repo in repos]
+
+    def _clone_repo(
+            self, repo: Repository, progress: bool = True,
+            verbose: bool = False
+    ) -> Union[GitRepo, CloneException]:
+        try:
+            user, repo_name = self._parse_info(repo)
+            if verbose:
                 print(user, repo_name)
-                path = self.clone(user, repo_name, repo)
-            except CloneException as exc:  # pragma: no cover
-                tqdm.write(f'Failed to clone repository {repo.github_url}: {exc}')
-                continue
-
-            repo_paths.add(GitRepo(
-                    user, repo_name, XrefID(Repository, repo.entity_id), path))
-        return ResultMap(repo_paths)
+            path = self.clone(user, repo_name, repo, progress)
+        except CloneException as exc:
+            return exc
+        return GitRepo(
+                user, repo_name, XrefID(Repository, repo.entity_id), path)
 
     def _parse_info(self, repo: Repository) -> Tuple[str, str]:
         match = re.match(r'^https://github.com/([a-zA-Z0-9_\.\-]+)/([a-zA-Z0-9_\-\.]+)/?$', repo.github_url)
@@ -118,12 +181,16 @@ class Clone(Stage[GitRepo, CloneConfig], requires=ExtractRoleMetadata):
         print('--- Repository Cloning ---')
         print(f'Cloned {len(results)} repositories into {self.repo_path}')
 
-    def clone(self, user: str, repo_name: str, repo: Repository) -> Path:
+    def clone(
+            self, user: str, repo_name: str, repo: Repository,
+            progress: bool = True
+    ) -> Path:
         """Clone a given repository into the base repo path.
 
         Returns the path to the repo. The path is relative to main output
         directory, so it should be possible to reuse them across different
-        installations.
+        installations. Progress is only shown if it's enabled in the config
+        and `progress` is set.
         """
 
         repo_path = self.repo_path / user / repo_name
@@ -135,6 +202,7 @@ class Clone(Stage[GitRepo, CloneConfig], requires=ExtractRoleMetadata):
             raise CloneException(
                     'Unable to create repo directory: '
                     f'Attempted path traversal on {repo_path}')
+        created = not repo_path.exists()
         try:
             repo_path.mkdir(exist_ok=True, parents=True)
         except OSError as exc:
@@ -148,19 +216,45 @@ class Clone(Stage[GitRepo, CloneConfig], requires=ExtractRoleMetadata):
                         'Unable to clone repo: Target directory not empty')
             return repo_path.relative_to(self.repo_path)
 
-        progress: Optional[git.RemoteProgress] = None
-        if self.config.progress:
-            progress = CloneProgress()
-
         try:
-            clone_repo = git.Repo.clone_from(
-                    url=repo.github_url,
-                    to_path=repo_path,
-                    env={'GIT_TERMINAL_PROMPT': '0'},
-                    progress=progress)
+            self._clone_into(repo.github_url, repo_path, progress)
         except git.exc.GitError as exc:
+            # Don't leave a partial clone behind, it'd be mistaken for a
+            # finished one when resuming. git doesn't clean up when it's
+            # killed, e.g. on timeout, so always empty the directory.
+            _remove_partial_clone(repo_path, keep_directory=not created)
             raise CloneException(f'Unable to clone repo: {exc}') from exc
 
+        return repo_path.relative_to(self.repo_path)
+
+    def _clone_options(self) -> List[str]:
+        options = []
+        if self.config.depth is not None:
+            options.append(f'--depth={self.config.depth}')
+        if self.config.filter is not None:
+            options.append(f'--filter={self.config.filter}')
+        return options
+
+    def _clone_into(self, url: str, repo_path: Path, progress: bool) -> None:
+        env = {'GIT_TERMINAL_PROMPT': '0'}
+        if self.config.timeout is not None:
+            # GitPython can't time out a clone while it's reporting progress,
+            # so run the command directly.
+            git.Git().execute(
+                    ['git', 'clone', *self._clone_options(), '--', url, str(repo_path)],
+                    kill_after_timeout=self.config.timeout, env=env)
+            return
+
+        clone_progress: Optional[git.RemoteProgress] = None
+        if self.config.progress and progress:
+            clone_progress = CloneProgress()
+
+        clone_repo = git.Repo.clone_from(
+                url=url,
+                to_path=repo_path,
+                env=env,
+                progress=clone_progress,
+                multi_options=self._clone_options())
+
         # Close the cloned repository, we'll come back to it later
         clone_repo.close()
-        return repo_path.relative_to(self.repo_path)
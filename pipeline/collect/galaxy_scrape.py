@@ -11,7 +11,7 @@ from tqdm import tqdm
 from config import GalaxyScrapeConfig
 from models.galaxy import GalaxyAPIPage
 from pipeline.base import ResultMap, Stage
-from services.galaxy import GalaxyAPI
+from services.galaxy import GalaxyAPI, RateLimiter
 
 
 API_URLS = {
@@ -38,6 +38,16 @@ class GalaxyScrape(Stage[GalaxyAPIPage, GalaxyScrapeConfig]):
 
     dataset_dir_name = 'GalaxyScrape'
 
+    _api: Optional[GalaxyAPI] = None
+
+    @property
+    def api(self) -> GalaxyAPI:
+        """Get the API service, shared so that requests share a rate limit."""
+        if self._api is None:
+            self._api = GalaxyAPI(
+                    rate_limiter=RateLimiter(self.config.rate_limit))
+        return self._api
+
     def run(self) -> ResultMap[GalaxyAPIPage]:
         """Run the stage."""
         all_results: List[GalaxyAPIPage] = []
@@ -50,12 +60,22 @@ class GalaxyScrape(Stage[GalaxyAPIPage, GalaxyScrapeConfig]):
         # role page includes more information though, and we've got both the
         # role search and the roles themselves. Any roles in the search page
         # that aren't present in the role pages need to be loaded separately
-        # too. We'll give these incremental page numbers.
+        # too. They're stored in a page after the last page of the listing.
         all_results = self.import_missing_roles(all_results)
         return ResultMap(all_results)
 
 
     def import_missing_roles(self, results: List[GalaxyAPIPage]) -> List[GalaxyAPIPage]:
+        # The cached pages of an earlier run already contain a page of missing
+        # roles, replace it rather than adding another one after it.
+        manifest = self._load_manifest('roles')
+        missing_page_num = None
+        if manifest is not None:
+            missing_page_num = manifest['last_page'] + 1
+            results = [
+                    page for page in results
+                    if page.page_type != 'roles' or page.page_num != missing_page_num]
+
         role_ids: Set[int] = set()
         role_search_ids: Set[int] = set()
         highest_role_page_num = 0
@@ -97,20 +117,21 @@ class GalaxyScrape(Stage[GalaxyAPIPage, GalaxyScrapeConfig]):
             missing_ids = list(missing_ids)[:remaining_roles] if remaining_roles > 0 else []
 
         new_pages: List[Any] = []
-        api = GalaxyAPI()
 
-        for role_id in tqdm(missing_ids, desc='Loading missing roles'):
+        role_it = self.api.load_roles(missing_ids, workers=self.config.workers)
+        for _, role_page in tqdm(role_it, desc='Loading missing roles', total=len(missing_ids)):
             if max_roles is not None and roles_loaded >= max_roles:  # Check again just in case
                 break
-            role_page = api.load_role(role_id)
             if role_page is not None:
                 new_pages.append(role_page)
-                roles_loaded += len(role_page.response.get('results', []))  # Increment based on new roles loaded
+                roles_loaded += 1
 
         # Add the new pages with missing roles to the results
         page_content = {'results': new_pages}
+        if missing_page_num is None:
+            missing_page_num = highest_role_page_num + 1
         results.append(GalaxyAPIPage(
-                'roles', highest_role_page_num + 1, json.dumps(page_content)))
+                'roles', missing_page_num, json.dumps(page_content)))
 
         return results
 
@@ -120,20 +141,66 @@ class GalaxyScrape(Stage[GalaxyAPIPage, GalaxyScrapeConfig]):
         if cached_results is not None:
             return cached_results
 
-        api = GalaxyAPI()
         page_size = PAGE_SIZES.get(page_name, 500)
-        it_pages = api.load_pages(page_name, page_url, page_size=page_size)
+        # Resume a previous scrape that was interrupted, unless the pages are
+        # incompatible.
+        manifest = self._load_manifest(page_name)
+        existing = self._load_existing_pages(page_name)
+        if manifest is not None and manifest['complete']:
+            # The page after the last page of a finished scrape holds the roles
+            # that were missing from the listing, it's not a listing page.
+            existing.pop(manifest['last_page'] + 1, None)
+        start_page = 1
+        # Pages that failed with a server error, which won't be fetched again.
+        skipped: Set[int] = set()
+        if manifest is not None and manifest['page_size'] != page_size:
+            # None of the pages can be reused, start over.
+            manifest = None
+        else:
+            if manifest is not None:
+                skipped = set(manifest.get('skipped', []))
+            while start_page in existing or start_page in skipped:
+                start_page += 1
+        skipped = {page_num for page_num in skipped if page_num < start_page}
+        results = [
+                existing[page_num] for page_num in range(1, start_page)
+                if page_num in existing]
+        if results:
+            tqdm.write(f'Resuming {page_name} scrape from page {start_page}')
+        dataset_dir_path = self.config.output_directory / self.dataset_dir_name
+        for page_num in existing:
+            if page_num >= start_page:
+                # Will be fetched again, don't let stale pages linger.
+                (dataset_dir_path / f'{page_name}_{page_num}.json').unlink()
+
+        manifest = {
+            'page_size': page_size,
+            'count': manifest['count'] if manifest is not None else None,
+            'last_page': max(
+                (page.page_num for page in results), default=0),
+            'skipped': sorted(skipped),
+            'max_roles': self.config.max_roles,
+            'complete': False,
+        }
+        self._save_manifest(page_name, manifest)
+
+        it_pages = self.api.load_pages(
+                page_name, page_url, page_size=page_size,
+                workers=self.config.workers, start_page=start_page)
         pbar = tqdm(
-                desc=f'Loading {page_name} pages', unit='pages', leave=False)
-        results: List[GalaxyAPIPage] = []
+                desc=f'Loading {page_name} pages', unit='pages', leave=False,
+                initial=len(results))
 
         total_set = False
-        roles_loaded = 0
+        roles_loaded = sum(
+                len(cast(List[Any], page.response.get('results', [])))
+                for page in results if page.page_type == 'roles')
         for page in it_pages:
             if self.config.max_roles is not None and roles_loaded >= self.config.max_roles:
                 break  # Stop loading more pages if we reach the max roles, unless max_roles is None
             if not total_set:
-                pbar.total = (cast(int, page.response['count']) // page_size) + 1
+                manifest['count'] = cast(int, page.response['count'])
+                pbar.total = (manifest['count'] // page_size) + 1
                 total_set = True
             pbar.update(1)
             # Check how many roles are on this page and update the count
@@ -147,35 +214,121 @@ class GalaxyScrape(Stage[GalaxyAPIPage, GalaxyScrapeConfig]):
                 roles_loaded += roles_in_page
             results.append(page)
 
+            # Checkpoint, so that an interrupted scrape can resume here.
+            page.dump(dataset_dir_path)
+            skipped.update(range(manifest['last_page'] + 1, page.page_num))
+            manifest['skipped'] = sorted(skipped)
+            manifest['last_page'] = page.page_num
+            self._save_manifest(page_name, manifest)
+
             # Stop processing if we've hit the role limit, unless max_roles is None
             if self.config.max_roles is not None and roles_loaded >= self.config.max_roles:
                 break
+        else:
+            # Reached the end of the listing, any pages that the API reported
+            # but that weren't loaded failed at the end.
+            if manifest['count'] is not None:
+                num_pages = -(-manifest['count'] // page_size)
+                skipped.update(range(manifest['last_page'] + 1, num_pages + 1))
+                manifest['skipped'] = sorted(skipped)
         pbar.close()
-        self.save_pages(results)
+
+        manifest['complete'] = True
+        self._save_manifest(page_name, manifest)
         return results
 
-    def save_pages(self, results: List[GalaxyAPIPage]) -> None:
+    def _manifest_path(self, page_name: str) -> Path:
         dataset_dir_path = self.config.output_directory / self.dataset_dir_name
-        os.makedirs(dataset_dir_path, exist_ok=True)
-        for page in results:
-            page.dump(dataset_dir_path)
+        return dataset_dir_path / f'manifest_{page_name}.json'
+
+    def _load_manifest(self, page_name: str) -> Optional[Dict[str, Any]]:
+        """Load the checkpoint manifest of a scrape, if any."""
+        try:
+            return cast(Dict[str, Any], json.loads(
+                    self._manifest_path(page_name).read_text()))
+        except (OSError, ValueError):
+            return None
 
-    def try_load_pages(self, page_name: str) -> Optional[List[GalaxyAPIPage]]:
+    def _save_manifest(self, page_name: str, manifest: Dict[str, Any]) -> None:
+        manifest_path = self._manifest_path(page_name)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        # Replace atomically, a crash mid-write mustn't lose the checkpoint.
+        tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(manifest, sort_keys=True, indent=2))
+        os.replace(tmp_path, manifest_path)
+
+    def _load_existing_pages(self, page_name: str) -> Dict[int, GalaxyAPIPage]:
         dataset_dir_path = self.config.output_directory / self.dataset_dir_name
         existing_files = list(dataset_dir_path.glob(f'{page_name}_*.json'))
-        if not existing_files:
-            return None
 
-        cached_results = []
+        cached_results = {}
         for file in existing_files:
             comps = file.stem.split('_')
             file_type = '_'.join(comps[:-1])
-            page_num = int(comps[-1])
-            cached_results.append(
-                    GalaxyAPIPage.load(f'{file_type}/{page_num}', file))
+            try:
+                page_num = int(comps[-1])
+                page = GalaxyAPIPage.load(f'{file_type}/{page_num}', file)
+            except ValueError:
+                # Not a page, or a page that was only partially written.
+                continue
+            cached_results[page_num] = page
 
         return cached_results
 
+    def _is_complete(
+            self, page_name: str, pages: Dict[int, GalaxyAPIPage]
+    ) -> bool:
+        manifest = self._load_manifest(page_name)
+        if manifest is None:
+            # Scraped before checkpointing was introduced. Those were only
+            # saved once finished, check that nothing went missing since.
+            num_pages = len(pages)
+            return (
+                    set(pages) == set(range(1, num_pages + 1))
+                    and pages[num_pages].response.get('next') is None)
+
+        if not manifest['complete']:
+            return False
+        if manifest['page_size'] != PAGE_SIZES.get(page_name, 500):
+            return False
+        # A limited scrape doesn't contain all roles a full scrape would.
+        limit = manifest['max_roles']
+        if limit is not None and limit != self.config.max_roles:
+            return False
+        # Check that no page went missing since. The page of roles that were
+        # missing from the listing is stored after the last scraped page.
+        # Pages that failed with a server error leave gaps.
+        last_page = manifest['last_page']
+        skipped = set(manifest.get('skipped', []))
+        scraped = set(pages) - {last_page + 1}
+        skipped_before = {page_num for page_num in skipped if page_num <= last_page}
+        if scraped | skipped_before != set(range(1, last_page + 1)):
+            return False
+        if scraped & skipped:
+            return False
+        if limit is not None or not last_page:
+            return True
+        # Without a limit, the scrape must have reached the end of the listing
+        # and loaded all pages that the API reported, unless the last ones
+        # failed.
+        count = manifest['count']
+        page_size = manifest['page_size']
+        final_page = max(skipped | {last_page})
+        return (
+                (final_page > last_page
+                 or pages[last_page].response.get('next') is None)
+                and (count is None or final_page >= -(-count // page_size)))
+
+    def try_load_pages(self, page_name: str) -> Optional[List[GalaxyAPIPage]]:
+        """Load the pages of a previous scrape, if it is complete."""
+        pages = self._load_existing_pages(page_name)
+        if not pages:
+            return None
+        if not self._is_complete(page_name, pages):
+            tqdm.write(f'Cached {page_name} pages are incomplete')
+            return None
+        return [pages[page_num] for page_num in sorted(pages)]
+
     def report_results(self, results: ResultMap[GalaxyAPIPage]) -> None:
         """Report statistics on loaded pages."""
         print('--- Galaxy Scrape ---')
@@ -2,4 +2,5 @@
 
 from . import (
     datamine_roles as datamine_roles,
+    task_table as task_table,
 )
@@ -0,0 +1,151 @@
+"""On-disk cache of the partial results of the datamine scan plugins."""
+from typing import Any, Dict, List, Optional
+
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import pickle
+import sys
+
+from pathlib import Path
+
+from models.structural.cache import evict_least_recently_used, write_pickle
+
+# Bump whenever the format of the entries changes, so that stale entries are
+# never loaded.
+CACHE_VERSION = 2
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _plugin_sources(plugin_cls: type) -> List[str]:
+    """Get the source of the modules defining a plugin class and its bases.
+
+    These include the scan engine, which defines the scanned models. The
+    `store_results` function of datamine scripts is left out, as it doesn't
+    affect the accumulators.
+    """
+    sources = []
+    module_names = []
+    for cls in plugin_cls.__mro__:
+        if hasattr(cls, 'visit') and cls.__module__ not in module_names:
+            module_names.append(cls.__module__)
+    for module_name in module_names:
+        module = sys.modules[module_name]
+        source = inspect.getsource(module)
+        store_results = getattr(module, 'store_results', None)
+        if inspect.isfunction(store_results) and store_results.__module__ == module_name:
+            source = source.replace(inspect.getsource(store_results), '')
+        sources.append(source)
+    return sources
+
+
+def _touch(path: Path) -> None:
+    """Mark a file as recently used for eviction."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+class PartialResultCache:
+    """Cache of the accumulators of scan plugins for single files.
+
+    Each file has a single entry, keyed by the hash of its content, which maps
+    the keys of plugins and their options to accumulators. A plugin is
+    identified by its class name and the source of the modules of its class
+    hierarchy, including the scan engine, but excluding the `store_results`
+    function of its script, so that changes to how results are stored keep
+    the entries valid. Only the options that the plugin declares in its
+    `accumulator_options` are part of the key. Plugins whose source isn't
+    available aren't cached. The content hashes are cached too, keyed by the
+    path, size and modification time of the files, so that unchanged files
+    aren't read at all.
+
+    The directory may be shared by multiple processes. `hits` and `misses`
+    count the files whose accumulators were and weren't all cached. Once the
+    cache grows beyond `max_size` bytes, the least recently used entries and
+    content hashes are evicted.
+    """
+
+    def __init__(
+            self, directory: Path, read: bool = True,
+            max_size: int = 1024 * 1024 * 1024
+    ) -> None:
+        self.directory = directory
+        # Whether to use existing entries, or only (over)write them.
+        self.read = read
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def plugin_key(self, plugin: Any) -> Optional[str]:
+        """Get the key of a plugin and its options, None if not cacheable."""
+        plugin_cls = type(plugin)
+        try:
+            sources = _plugin_sources(plugin_cls)
+        except (OSError, TypeError, KeyError):
+            return None
+        used_options = plugin.options
+        if plugin.accumulator_options is not None:
+            used_options = {
+                    name: value for name, value in used_options.items()
+                    if name in plugin.accumulator_options}
+        options = json.dumps(used_options, sort_keys=True, default=str)
+        return _sha1('\0'.join([
+                str(CACHE_VERSION), plugin_cls.__qualname__, options, *sources]))
+
+    def file_key(self, file_path: Path) -> str:
+        """Get the key of a file's content."""
+        st = file_path.stat()
+        stat_key = _sha1(f'{file_path.resolve()}\0{st.st_size}\0{st.st_mtime_ns}')
+        hash_path = self.directory / 'files' / stat_key[:2] / stat_key[2:]
+        try:
+            with hash_path.open('rb') as f_hash:
+                content_hash: str = pickle.load(f_hash)
+            _touch(hash_path)
+            return content_hash
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+        content_hash = hashlib.sha1(file_path.read_bytes()).hexdigest()
+        write_pickle(hash_path, content_hash)
+        return content_hash
+
+    def _entry_path(self, file_key: str) -> Path:
+        return self.directory / 'entries' / file_key[:2] / file_key[2:]
+
+    def load(self, file_key: str) -> Dict[str, Any]:
+        """Load the accumulators cached for a file, by plugin key."""
+        if not self.read:
+            return {}
+        entry_path = self._entry_path(file_key)
+        try:
+            with entry_path.open('rb') as f_entry:
+                accs: Dict[str, Any] = pickle.load(f_entry)
+            _touch(entry_path)
+            return accs
+        except FileNotFoundError:
+            return {}
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # Corrupt or stale entry, overwrite it.
+            return {}
+
+    def store(self, file_key: str, accs: Dict[str, Any]) -> None:
+        """Store the accumulators of a file, by plugin key."""
+        write_pickle(self._entry_path(file_key), accs)
+
+    def evict(self) -> int:
+        """Evict least recently used entries until within the size bound.
+
+        Returns the number of evicted entries and content hashes.
+        """
+        return evict_least_recently_used(
+                itertools.chain(
+                    self.directory.glob('entries/*/*'),
+                    self.directory.glob('files/*/*')),
+                self.max_size)
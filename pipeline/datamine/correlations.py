@@ -0,0 +1,111 @@
+"""Pearson correlations between the columns of sparse usage matrices.
+
+The correlation analyses of the datamine scripts compare how often labels,
+e.g. modules, are used across many rows, e.g. roles. Most rows use only a few
+of the labels, so the usage is kept in a sparse matrix rather than a dense
+table, and the correlations are derived from its Gram matrix.
+"""
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Maximum number of correlations computed at once when thresholding, to bound
+# the memory used for large numbers of columns.
+_BLOCK_ELEMENTS = 1 << 22
+
+
+def incidence_matrix(
+        rows: Iterable[Iterable[str]], columns: Sequence[str],
+        binary: bool = False
+) -> sparse.csc_matrix:
+    """Count the occurrences of column labels in each row.
+
+    Labels that aren't in `columns` are ignored. With `binary`, the matrix
+    only records whether a label occurs in a row.
+    """
+    col_indices = {label: idx for idx, label in enumerate(columns)}
+    row_ind = []
+    col_ind = []
+    num_rows = 0
+    for row_idx, labels in enumerate(rows):
+        num_rows = row_idx + 1
+        for label in labels:
+            col_idx = col_indices.get(label)
+            if col_idx is not None:
+                row_ind.append(row_idx)
+                col_ind.append(col_idx)
+    matrix = sparse.csc_matrix(
+            (np.ones(len(row_ind)), (row_ind, col_ind)),
+            shape=(num_rows, len(columns)))
+    matrix.sum_duplicates()
+    if binary:
+        matrix.data[:] = 1
+    return matrix
+
+
+def _moments(matrix: sparse.spmatrix) -> Tuple[np.ndarray, np.ndarray]:
+    num_rows = matrix.shape[0]
+    col_sums = np.asarray(matrix.sum(axis=0), dtype=np.float64).ravel()
+    sq_sums = np.asarray(
+            matrix.multiply(matrix).sum(axis=0), dtype=np.float64).ravel()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Scaled by the number of rows, which cancels out in the correlations.
+        variances = sq_sums - col_sums * col_sums / num_rows
+    return col_sums, np.sqrt(np.maximum(variances, 0))
+
+
+def _correlation_block(
+        matrix: sparse.csc_matrix, start: int, stop: int,
+        col_sums: np.ndarray, stds: np.ndarray
+) -> np.ndarray:
+    """Correlations of the columns `start:stop` with all columns."""
+    num_rows = matrix.shape[0]
+    gram = (matrix[:, start:stop].T @ matrix).toarray()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = gram - np.outer(col_sums[start:stop], col_sums) / num_rows
+        corr = cov / np.outer(stds[start:stop], stds)
+    # Constant columns have no correlation, as with `pandas.DataFrame.corr`.
+    corr[~np.isfinite(corr)] = np.nan
+    return np.clip(corr, -1, 1, out=corr)
+
+
+def correlation_matrix(matrix: sparse.spmatrix) -> np.ndarray:
+    """Compute the dense matrix of the correlations between the columns.
+
+    Correlations with columns whose values are constant are NaN.
+    """
+    matrix = sparse.csc_matrix(matrix, dtype=np.float64)
+    col_sums, stds = _moments(matrix)
+    return _correlation_block(matrix, 0, matrix.shape[1], col_sums, stds)
+
+
+def strong_correlations(
+        matrix: sparse.spmatrix, threshold: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the pairs of distinct columns that are strongly correlated.
+
+    Returns the indices of the first and second columns of all pairs whose
+    absolute correlation is at least `threshold`, and their correlations.
+    Both orders of each pair are included, sorted by the first and then the
+    second column.
+    """
+    matrix = sparse.csc_matrix(matrix, dtype=np.float64)
+    num_cols = matrix.shape[1]
+    col_sums, stds = _moments(matrix)
+    block_size = max(1, _BLOCK_ELEMENTS // max(num_cols, 1))
+    firsts, seconds, values = [], [], []
+    for start in range(0, num_cols, block_size):
+        stop = min(start + block_size, num_cols)
+        corr = _correlation_block(matrix, start, stop, col_sums, stds)
+        with np.errstate(invalid='ignore'):
+            mask = np.abs(corr) >= threshold
+        block_rows = np.arange(stop - start)
+        mask[block_rows, block_rows + start] = False
+        first, second = np.nonzero(mask)
+        firsts.append(first + start)
+        seconds.append(second)
+        values.append(corr[first, second])
+    if not firsts:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    return np.concatenate(firsts), np.concatenate(seconds), np.concatenate(values)
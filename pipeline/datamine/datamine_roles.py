@@ -1,9 +1,38 @@
 import importlib.util
 import os
-from typing import Any, Optional
+import re
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+import click
 from pipeline.base import Stage, ResultMap
+from pipeline.datamine import engine
+from pipeline.datamine.cache import PartialResultCache
+from pipeline.datamine.task_table import ExtractTaskTable
 from config import DatamineConfig
 
+
+def load_script(path: Path) -> ModuleType:
+    """Charge un script de datamining.
+
+    Le module est enregistré dans `sys.modules`, pour que ses plugins
+    puissent être transmis aux processus de travail.
+    """
+    name = "external_algo_" + re.sub(r"\W", "_", path.stem)
+    spec = importlib.util.spec_from_file_location(name, path)
+    external_algo = importlib.util.module_from_spec(spec)
+    sys.modules[name] = external_algo
+    spec.loader.exec_module(external_algo)
+    return external_algo
+
+
+def load_scripts(paths: List[Path]) -> None:
+    """Charge les scripts dans un processus de travail."""
+    for path in paths:
+        load_script(path)
+
+
 class DatamineStage(Stage[Any, DatamineConfig]):
     """
     Stage générique qui délègue l'algorithme à un script externe.
@@ -15,35 +44,82 @@ class DatamineStage(Stage[Any, DatamineConfig]):
 
     def run(self) -> ResultMap[Any]:
         """
+        Exécute les scripts donnés par `--path`.
+
+        Les scripts qui exposent un plugin (`PLUGIN`) sont exécutés ensemble
+        par le moteur de scan, en un seul passage sur les modèles
+        structurels. Les autres sont exécutés via leur fonction `algo`.
+        Les résultats partiels des plugins sont mis en cache par fichier, de
+        sorte qu'une nouvelle exécution n'analyse que les fichiers modifiés.
 
-        :param algo_script_path: Chemin vers le script Python de l'algorithme.
-        :param needs_data: Booléen indiquant si l'algorithme nécessite des données.
-        :param data: Les données à transmettre à l'algorithme (si besoin).
-        :return: Un ResultMap contenant le résultat de l'algorithme.
+        Avec `--task-table`, les scripts qui définissent `table_algo` sont
+        exécutés sur le tableau des tâches de l'étape extract-task-table.
         """
-    
-        spec = importlib.util.spec_from_file_location("external_algo", self.config.path)
-        external_algo = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(external_algo)
+        scripts = [self._load_script(path) for path in self.config.path]
+        results: Dict[ModuleType, Any] = {}
+        if self.config.task_table:
+            results.update(self._run_on_task_table(
+                    [script for script in scripts if hasattr(script, "table_algo")]))
+        results.update(self._run_plugins(
+                [script for script in scripts if script not in results and hasattr(script, "PLUGIN")]))
+
+        for path, script in zip(self.config.path, scripts):
+            if script in results:
+                result = results[script]
+            elif self.config.options:
+                result = script.algo(self.config, "StructuralModels", self.config.options)
+            else:
+                result = script.algo(self.config, "StructuralModels")
 
-        if not hasattr(external_algo, "algo"):
-            raise AttributeError("Le script de l'algorithme doit contenir une fonction 'run_algo'.")
+            # L'idée est de checker si mon script externe contient une fonction store_result. 
+            # De sorte, nous n'aurons pas toujours besoin de lancer certains algorithmes (gain de temps et d'energie) 
+            output = os.path.join(self.dataset_dir_name, os.path.basename(path))
+            if hasattr(script, "store_results"):
+                script.store_results(result, self.config, output)
 
-        # Exécuter l'algorithme en fonction du paramètre needs_data 
-        if self.config.options:
-            result = external_algo.algo(self.config, "StructuralModels", self.config.options)
-        else:
-            result = external_algo.algo(self.config, "StructuralModels")
+        return None
 
-        filename = os.path.basename(self.config.path)
+    def _load_script(self, path: Path) -> ModuleType:
+        external_algo = load_script(path)
 
-        # L'idée est de checker si mon script externe contient une fonction store_result. 
-        # De sorte, nous n'aurons pas toujours besoin de lancer certains algorithmes (gain de temps et d'energie) 
-        output = os.path.join(self.dataset_dir_name, filename)
-        if hasattr(external_algo, "store_results"):
-            external_algo.store_results(result, self.config, output)
+        if not hasattr(external_algo, "algo") and not hasattr(external_algo, "PLUGIN"):
+            raise AttributeError(
+                    f"Le script de l'algorithme {path} doit contenir une fonction 'algo' ou un plugin 'PLUGIN'.")
+        return external_algo
 
-        return None
+    def _run_plugins(self, scripts: List[ModuleType]) -> Dict[ModuleType, Any]:
+        if not scripts:
+            return {}
+        plugins = [script.PLUGIN(self.config.options or {}) for script in scripts]
+        models_dir = self.config.output_directory / "StructuralModels"
+        cache = None
+        if self.config.scan_cache:
+            cache = PartialResultCache(
+                    self.config.output_directory / "DatamineCache",
+                    read=not self.config.force,
+                    max_size=self.config.scan_cache_size * 1024 * 1024)
+        results = engine.scan(
+                models_dir, plugins, self.config.workers,
+                initializer=load_scripts, initargs=(self.config.path,),
+                cache=cache)
+        if cache is not None:
+            print(f"Cache du scan : {cache.hits} fichiers réutilisés, {cache.misses} fichiers analysés")
+            evicted = cache.evict()
+            if evicted:
+                print(f"{evicted} entrées supprimées du cache du scan")
+        return dict(zip(scripts, results))
+
+    def _run_on_task_table(self, scripts: List[ModuleType]) -> Dict[ModuleType, Any]:
+        if not scripts:
+            return {}
+        try:
+            tables = ExtractTaskTable.process(self.config, dependency=True)
+        except (AttributeError, click.BadParameter) as exc:
+            raise click.UsageError(
+                    "Le tableau des tâches n'a pas été extrait, ou il est obsolète. Relancez avec "
+                    "extract-task-table OPTIONS... datamine-stage OPTIONS...") from exc
+        tasks = tables["tasks"].frame
+        return {script: script.table_algo(tasks, self.config.options or {}) for script in scripts}
 
     def report_results(self, results: ResultMap[Any]) -> None:
         print("Résultats de l'algorithme :")
@@ -0,0 +1,278 @@
+"""Shared scan engine for the datamine scripts.
+
+The datamine analyses all walk the same structural models. Rather than each
+of them parsing the whole dataset, the engine parses every file of the
+StructuralModels directory once and passes each model to all plugins, which
+each update their own accumulator.
+
+With multiple workers, the files are sharded across a process pool. Each
+shard is scanned into fresh accumulators, which are then merged in the order
+of the files, so the results are the same as those of a serial scan.
+
+With a partial result cache, the accumulator of each plugin for each file is
+stored on disk, and files whose accumulators are all cached aren't parsed
+again. Only the final merge and `finish` run on every scan.
+"""
+from typing import (
+        Any, Callable, ClassVar, Dict, Generic, Iterable, Iterator, List, Mapping, Optional,
+        Sequence, Tuple, TypeVar)
+
+import functools
+import hashlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import attr
+
+from models.structural.storage import format_for_path
+from pipeline.base import read_index
+from pipeline.datamine.cache import PartialResultCache
+
+# Number of shards per worker, to balance the load of the workers.
+_SHARDS_PER_WORKER = 8
+
+AccType = TypeVar('AccType')
+ResultType = TypeVar('ResultType')
+
+TaskDict = Dict[str, Any]
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ScannedModel:
+    """A structural model, as passed to the scan plugins."""
+    role_id: str
+    role_rev: str
+    # Position of the model among the revisions stored in its file.
+    position: int
+    num_revisions: int
+    # The tasks of the top-level blocks of each task file, in order, as
+    # (file name, tasks) pairs.
+    task_files: List[Tuple[str, List[TaskDict]]]
+
+    @property
+    def is_head(self) -> bool:
+        return self.role_rev == 'HEAD'
+
+    @property
+    def tasks(self) -> Iterator[TaskDict]:
+        """Iterate over the tasks of all task files."""
+        for _, tasks in self.task_files:
+            yield from tasks
+
+
+class ScanPlugin(ABC, Generic[AccType, ResultType]):
+    """An analysis driven by the scan engine.
+
+    A datamine script exposes its plugin class as `PLUGIN`. The engine
+    creates an accumulator per scan, visits every model with it, and turns
+    it into the script's result with `finish`. That result is what the
+    script's `algo` would return, and it's passed to `store_results`.
+
+    In parallel scans, plugins and accumulators are pickled to and from the
+    worker processes, and the accumulators of the shards are combined with
+    `merge`.
+
+    The accumulators of each file may be cached. Plugins whose accumulators
+    only depend on some of the options, or on none of them, declare these in
+    `accumulator_options`, so that changing the other options, such as those
+    only used by `finish`, keeps the cached accumulators valid.
+    """
+
+    # Names of the options used by `new_accumulator` and `visit`, None if the
+    # accumulators may depend on all of them.
+    accumulator_options: ClassVar[Optional[Tuple[str, ...]]] = None
+
+    def __init__(self, options: Mapping[str, Any]) -> None:
+        self.options = options
+
+    @abstractmethod
+    def new_accumulator(self) -> AccType:
+        """Create an empty accumulator."""
+        ...
+
+    @abstractmethod
+    def visit(self, acc: AccType, model: ScannedModel) -> None:
+        """Add a model to the accumulator."""
+        ...
+
+    @abstractmethod
+    def merge(self, acc: AccType, other: AccType) -> AccType:
+        """Merge the accumulator of the next shard into `acc`.
+
+        Must be associative. Returns the merged accumulator, which may be
+        `acc` itself.
+        """
+        ...
+
+    @abstractmethod
+    def finish(self, acc: AccType) -> ResultType:
+        """Compute the result from the accumulated models."""
+        ...
+
+
+def _top_level_tasks(task_file: Mapping[str, Any]) -> List[TaskDict]:
+    return [
+            task for block in task_file.get('content') or []
+            for task in block.get('block') or []]
+
+
+def load_models(file_path: Path) -> List[Dict[str, Any]]:
+    """Load the unstructured models of a StructuralModels file."""
+    content = format_for_path(file_path).load(file_path) or []
+    return [model for model in content if isinstance(model, dict)]
+
+
+def iter_models(file_path: Path) -> Iterator[ScannedModel]:
+    """Parse a StructuralModels file into the models passed to plugins."""
+    models = load_models(file_path)
+    for position, model in enumerate(models):
+        task_files = (model.get('role_root') or {}).get('task_files') or []
+        yield ScannedModel(
+                role_id=model.get('role_id'), role_rev=model.get('role_rev'),
+                position=position, num_revisions=len(models),
+                task_files=[
+                    (task_file.get('file_name'), _top_level_tasks(task_file))
+                    for task_file in task_files])
+
+
+def model_files(models_dir: Path) -> List[Path]:
+    """Get the paths to the files of the StructuralModels directory."""
+    if not models_dir.is_dir():
+        raise FileNotFoundError(f"Roles directory '{models_dir}' does not exist.")
+    return [models_dir / file_name for file_name in read_index(models_dir).values()]
+
+
+def models_fingerprint(models_dir: Path) -> str:
+    """Fingerprint the files of the StructuralModels directory.
+
+    Based on the name, size and modification time of the files, so it changes
+    whenever the models are extracted again.
+    """
+    digest = hashlib.sha1()
+    for file_path in model_files(models_dir):
+        st = file_path.stat()
+        digest.update(f'{file_path.name}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def scan_file(
+        file_path: Path, plugins: Sequence[ScanPlugin[Any, Any]],
+        accs: Sequence[Any]
+) -> None:
+    """Visit the models of a single file with all plugins."""
+    for model in iter_models(file_path):
+        for plugin, acc in zip(plugins, accs):
+            plugin.visit(acc, model)
+
+
+def scan_shard(
+        plugins: Sequence[ScanPlugin[Any, Any]], file_paths: Sequence[Path]
+) -> List[Any]:
+    """Scan files into new accumulators, one per plugin."""
+    accs = [plugin.new_accumulator() for plugin in plugins]
+    for file_path in file_paths:
+        scan_file(file_path, plugins, accs)
+    return accs
+
+
+def _scan_shard_cached(
+        plugins: Sequence[ScanPlugin[Any, Any]],
+        plugin_keys: Sequence[Optional[str]], cache: PartialResultCache,
+        file_paths: Sequence[Path]
+) -> Tuple[List[Any], int]:
+    """Scan files into new accumulators, reusing the cached ones.
+
+    Returns the accumulators and the number of files that had to be parsed.
+    """
+    accs = [plugin.new_accumulator() for plugin in plugins]
+    num_parsed = 0
+    for file_path in file_paths:
+        file_key = cache.file_key(file_path)
+        cached = cache.load(file_key)
+        file_accs = [cached.get(plugin_key) for plugin_key in plugin_keys]
+        missing = [
+                idx for idx, plugin_key in enumerate(plugin_keys)
+                if plugin_key not in cached]
+        if missing:
+            num_parsed += 1
+            new_accs = scan_shard([plugins[idx] for idx in missing], [file_path])
+            for idx, acc in zip(missing, new_accs):
+                file_accs[idx] = acc
+                plugin_key = plugin_keys[idx]
+                if plugin_key is not None:
+                    cached[plugin_key] = acc
+            cache.store(file_key, cached)
+        accs = [
+                plugin.merge(acc, file_acc)
+                for plugin, acc, file_acc in zip(plugins, accs, file_accs)]
+    return accs, num_parsed
+
+
+def _shards(file_paths: List[Path], num_shards: int) -> List[List[Path]]:
+    shard_size = max(1, -(-len(file_paths) // num_shards))
+    return [
+            file_paths[start:start + shard_size]
+            for start in range(0, len(file_paths), shard_size)]
+
+
+def _merge_shards(
+        plugins: Sequence[ScanPlugin[Any, Any]],
+        shard_paths: Sequence[Sequence[Path]], shard_results: Iterable[Any],
+        cache: Optional[PartialResultCache]
+) -> List[Any]:
+    """Merge the accumulators of the shards, in order."""
+    accs = [plugin.new_accumulator() for plugin in plugins]
+    for file_paths, shard_accs in zip(shard_paths, shard_results):
+        if cache is not None:
+            shard_accs, num_parsed = shard_accs
+            cache.misses += num_parsed
+            cache.hits += len(file_paths) - num_parsed
+        accs = [
+                plugin.merge(acc, shard_acc)
+                for plugin, acc, shard_acc in zip(plugins, accs, shard_accs)]
+    return accs
+
+
+def scan(
+        models_dir: Path, plugins: Sequence[ScanPlugin[Any, Any]],
+        workers: int = 1, initializer: Optional[Callable[..., None]] = None,
+        initargs: Tuple[Any, ...] = (),
+        cache: Optional[PartialResultCache] = None
+) -> List[Any]:
+    """Run plugins over all structural models in a single pass.
+
+    With more than one worker, the files are scanned in parallel worker
+    processes, which are set up with `initializer(*initargs)`. With a cache,
+    only the files without cached accumulators are parsed, and the hit and
+    miss counts of the cache are updated.
+
+    Returns the result of each plugin, in order.
+    """
+    file_paths = model_files(models_dir)
+    if cache is None:
+        scan_paths: Callable[[Sequence[Path]], Any] = functools.partial(
+                scan_shard, plugins)
+    else:
+        plugin_keys = [cache.plugin_key(plugin) for plugin in plugins]
+        scan_paths = functools.partial(
+                _scan_shard_cached, plugins, plugin_keys, cache)
+    if workers <= 1:
+        accs = _merge_shards(
+                plugins, [file_paths], map(scan_paths, [file_paths]), cache)
+    else:
+        shard_paths = _shards(file_paths, workers * _SHARDS_PER_WORKER)
+        with ProcessPoolExecutor(
+                workers, initializer=initializer, initargs=initargs
+        ) as executor:
+            accs = _merge_shards(
+                    plugins, shard_paths, executor.map(scan_paths, shard_paths),
+                    cache)
+    return [plugin.finish(acc) for plugin, acc in zip(plugins, accs)]
+
+
+def run_plugin(
+        config: Any, roles_dir_name: str, plugin: ScanPlugin[Any, ResultType]
+) -> ResultType:
+    """Run a single plugin, for the `algo` function of datamine scripts."""
+    return scan(Path(config.output_directory) / roles_dir_name, [plugin])[0]
@@ -0,0 +1,76 @@
+"""Task table extraction stage."""
+from typing import Optional
+
+from pathlib import Path
+
+from tqdm import tqdm
+
+from config import ExtractTaskTableConfig
+from models.datamine.tasks import TaskTable, TaskTableBuilder
+from pipeline.base import CacheMiss, ResultMap, Stage
+from pipeline.datamine import engine
+
+
+class ExtractTaskTable(Stage[TaskTable, ExtractTaskTableConfig]):
+    """Flatten the tasks of the structural models into a single table.
+
+    The datamine scripts that define a `table_algo` function can run on the
+    table as vectorized operations rather than visiting each model.
+    """
+
+    dataset_dir_name = 'TaskTable'
+
+    # Fingerprint of the structural models the table was extracted from.
+    models_fingerprint: Optional[str] = None
+
+    @property
+    def fingerprint_path(self) -> Path:
+        """Get the path to the stored fingerprint of the structural models."""
+        return (self.config.output_directory / self.dataset_dir_name
+                / 'structural_models.sha1')
+
+    def run(self) -> ResultMap[TaskTable]:
+        """Run the stage."""
+        builder = TaskTableBuilder()
+        models_dir = self.config.output_directory / 'StructuralModels'
+        self.models_fingerprint = engine.models_fingerprint(models_dir)
+        file_paths = engine.model_files(models_dir)
+        for file_path in tqdm(
+                file_paths, desc='Extract task table',
+                disable=not self.config.progress):
+            builder.add_file(engine.load_models(file_path))
+        return ResultMap([builder.build()])
+
+    def dump_result(self, result: TaskTable, dirpath: Path) -> Path:
+        """Dump the table in the configured file format."""
+        if self.models_fingerprint is not None:
+            self.fingerprint_path.write_text(self.models_fingerprint)
+        return result.dump(dirpath, self.config.table_format)
+
+    def load_from_dataset(self) -> ResultMap[TaskTable]:
+        """Load the table of a previous run from the dataset.
+
+        Raises `CacheMiss` when the structural models were extracted again
+        since the table was extracted.
+        """
+        results = super().load_from_dataset()
+        try:
+            current = engine.models_fingerprint(
+                    self.config.output_directory / 'StructuralModels')
+        except OSError:
+            # The models are gone, the table is all that's left.
+            return results
+        try:
+            stored: Optional[str] = self.fingerprint_path.read_text()
+        except OSError:
+            stored = None
+        if stored != current:
+            print('The task table is outdated, the structural models were extracted again')
+            raise CacheMiss()
+        return results
+
+    def report_results(self, results: ResultMap[TaskTable]) -> None:
+        """Report statistics on the table."""
+        tasks = results['tasks'].frame
+        print('--- Task Table Extraction ---')
+        print(f'Extracted {len(tasks)} tasks of {tasks["role_id"].nunique()} roles')
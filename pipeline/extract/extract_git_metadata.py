@@ -1,47 +1,198 @@
 """Version stages."""
-from typing import Iterable, List, Tuple, Optional, Iterator
+from typing import IO, Any, Dict, List, Mapping, Tuple, Optional, Iterator
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import git
 import pendulum
 
 from tqdm import tqdm
 
-from config import MainConfig
+from config import ExtractGitMetadataConfig
 from models.git import GitRepo, GitRepoMetadata, GitCommit, GitTag
 from pipeline.base import ResultMap, Stage
 from pipeline.collect.clone import Clone
 
 
-class ExtractGitMetadata(Stage[GitRepoMetadata, MainConfig], requires=Clone):
+# Fields of the batched git output. They're separated by NUL bytes, which
+# cannot occur in commit or tag messages.
+_LOG_FIELDS = ('%H', '%e', '%an', '%ae', '%at', '%cn', '%ce', '%ct', '%B')
+_TAG_FIELDS = (
+        '%(refname:strip=2)', '%(objecttype)', '%(objectname)', '%(object)',
+        '%(tag)', '%(taggername)', '%(taggeremail)', '%(taggerdate:unix)',
+        '%(contents)')
+_READ_SIZE = 1 << 16
+
+
+def _iter_records(stream: IO[bytes], num_fields: int) -> Iterator[List[str]]:
+    """Split NUL-terminated fields streamed from git into records."""
+    record: List[str] = []
+    rest = b''
+    for chunk in iter(lambda: stream.read(_READ_SIZE), b''):
+        *fields, rest = (rest + chunk).split(b'\0')
+        for field in fields:
+            record.append(field.decode('utf-8', 'replace'))
+            if len(record) == num_fields:
+                yield record
+                record = []
+
+
+def _run_batched(repo_ref: git.Repo, args: List[str], num_fields: int) -> Iterator[List[str]]:
+    proc = repo_ref.git.execute(['git', *args], as_process=True)
+    yield from _iter_records(proc.stdout, num_fields)
+    # Raises GitCommandError if git failed.
+    proc.wait()
+
+
+def iter_commits_batched(repo_ref: git.Repo) -> Iterator[GitCommit]:
+    """Iterate over the commits reachable from HEAD with a single `git log`.
+
+    Yields the same commits, in the same order, as `GitCommit.from_git_commit`
+    on `repo_ref.iter_commits()`.
+    """
+    args = [
+            '-c', 'log.showSignature=false', 'log', '-z', '--no-mailmap',
+            '--encoding=UTF-8', '--format=' + '%x00'.join(_LOG_FIELDS)]
+    for (sha1, encoding, author_name, author_email, authored_ts, committer_name,
+         committer_email, committed_ts, message) in _run_batched(repo_ref, args, len(_LOG_FIELDS)):
+        if encoding:
+            # git re-encodes these commits, whereas GitPython always decodes
+            # them as UTF-8. They're rare, so let GitPython handle them.
+            yield GitCommit.from_git_commit(repo_ref.commit(sha1))
+            continue
+        yield GitCommit(
+                sha1=sha1, message=message,
+                author_name=author_name, author_email=author_email,
+                authored_datetime=pendulum.from_timestamp(int(authored_ts)),
+                committer_name=committer_name, committer_email=committer_email,
+                committed_datetime=pendulum.from_timestamp(int(committed_ts)))
+
+
+def iter_tags_batched(repo_ref: git.Repo) -> Iterator[GitTag]:
+    """Iterate over the tags with a single `git for-each-ref`.
+
+    Yields the same tags, in the same order, as `GitTag.from_git_tag` on
+    `repo_ref.tags`.
+    """
+    # The newline that for-each-ref puts after each record ends up at the
+    # start of the next record's first field.
+    args = ['for-each-ref', '--format=' + '%00'.join(_TAG_FIELDS) + '%00', 'refs/tags']
+    for (ref_name, obj_type, obj_sha1, target_sha1, tag_name, tagger_name,
+         tagger_email, tagged_ts, message) in _run_batched(repo_ref, args, len(_TAG_FIELDS)):
+        ref_name = ref_name.lstrip('\n')
+        if obj_type != 'tag':
+            yield GitTag(
+                    name=ref_name, commit_sha1=obj_sha1, message=None,
+                    tagger_name=None, tagger_email=None, tagged_datetime=None)
+            continue
+        # GitPython reads the message line by line, dropping the last
+        # line break.
+        yield GitTag(
+                name=tag_name, message='\n'.join(message.splitlines()),
+                commit_sha1=target_sha1, tagger_name=tagger_name,
+                tagger_email=tagger_email[1:-1] if tagger_email.startswith('<') else tagger_email,
+                tagged_datetime=pendulum.from_timestamp(int(tagged_ts or 0)))
+
+
+def get_tags(repo_ref: git.Repo, batched: bool = True) -> List[GitTag]:
+    if batched:
+        return list(iter_tags_batched(repo_ref))
+    return [git_tag for tag in repo_ref.tags if (git_tag := GitTag.from_git_tag(tag)) is not None]
+
+
+def get_commits(repo_ref: git.Repo, batched: bool = True) -> List[GitCommit]:
+    try:
+        if batched:
+            return list(iter_commits_batched(repo_ref))
+        return [GitCommit.from_git_commit(commit)
+                for commit in repo_ref.iter_commits()]
+    except (ValueError, git.GitCommandError) as e:
+        tqdm.write(f'{e}. Empty repo? {repo_ref}')
+        return []
+
+
+def extract_meta(git_repo: GitRepo, batched: bool = True) -> GitRepoMetadata:
+    """Extract the metadata of a repository. Runs in worker processes."""
+    repo_ref = git.Repo(git_repo.path)
+
+    return GitRepoMetadata(
+            repo_owner=git_repo.owner, repo_name=git_repo.name,
+            tags=get_tags(repo_ref, batched),
+            commits=get_commits(repo_ref, batched))
+
+
+class ExtractGitMetadata(Stage[GitRepoMetadata, ExtractGitMetadataConfig], requires=Clone):
     """Extract the versions from the git repositories."""
 
     dataset_dir_name = 'RepositoryMetadata'
 
-    def run(self, clone: ResultMap[GitRepo]) -> ResultMap[GitRepoMetadata]:
-        repos: Iterable[GitRepo] = clone.values()
-        if self.config.progress:
-            repos = tqdm(repos, total=len(clone))
+    def run(self, clone: ResultMap[GitRepo]) -> Iterator[GitRepoMetadata]:
+        """Run the stage.
+
+        The metadata is yielded per repository as soon as it's extracted, so
+        that it can be stored and released one at a time.
+        """
+        repos = list(clone.values())
+        with tqdm(total=len(repos), unit=' repos', disable=not self.config.progress) as pbar:
+            yield from self._extract_all(repos, pbar)
 
-        return ResultMap(map(self.extract_meta, repos))
+    def _extract_all(
+            self, repos: List[GitRepo], pbar: tqdm
+    ) -> Iterator[GitRepoMetadata]:
+        """Extract the metadata of each repository.
+
+        With more than one worker, repositories are distributed over a
+        process pool. The results are yielded in completion order, unless
+        the stage is configured to keep them in order. Then, results that
+        complete early are held back until all of their predecessors are
+        done. The progress is updated as soon as a repository completes.
+        """
+        workers = self._option('workers', 1)
+        if workers <= 1:
+            for repo in repos:
+                meta = self.extract_meta(repo)
+                pbar.update(1)
+                yield meta
+            return
+
+        batched = self._option('batched', True)
+        ordered = self._option('ordered', False)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                    executor.submit(extract_meta, repo, batched): idx
+                    for idx, repo in enumerate(repos)}
+            held_back: Dict[int, GitRepoMetadata] = {}
+            next_idx = 0
+            for future in as_completed(futures):
+                pbar.update(1)
+                if not ordered:
+                    yield future.result()
+                    continue
+                held_back[futures[future]] = future.result()
+                while next_idx in held_back:
+                    yield held_back.pop(next_idx)
+                    next_idx += 1
 
     def extract_meta(self, git_repo: GitRepo) -> GitRepoMetadata:
-        repo_ref = git.Repo(git_repo.path)
+        return extract_meta(git_repo, self._option('batched', True))
+
+    def _option(self, name: str, default: Any) -> Any:
+        """Get an option of the stage, or its default when run as a dependency.
 
-        return GitRepoMetadata(
-                repo_owner=git_repo.owner, repo_name=git_repo.name,
-                tags=[git_tag for tag in repo_ref.tags if (git_tag := GitTag.from_git_tag(tag)) is not None],
-                commits=self.get_commits(repo_ref))
+        Dependencies are run with the configuration of the dependent stage,
+        which lacks the options of this stage or has unrelated options of
+        the same name.
+        """
+        if isinstance(self.config, ExtractGitMetadataConfig):
+            return getattr(self.config, name)
+        return default
 
-    def get_commits(self, repo_ref: git.Repo) -> List[GitCommit]:
-        try:
-            return [GitCommit.from_git_commit(commit)
-                    for commit in repo_ref.iter_commits()]
-        except ValueError as e:
-            tqdm.write(f'{e}. Empty repo? {repo_ref}')
-            return []
+    def count_result(self, result: GitRepoMetadata) -> Mapping[str, int]:
+        return {'tags': len(result.tags), 'commits': len(result.commits)}
 
     def report_results(self, results: ResultMap[GitRepoMetadata]) -> None:
-        len_all_tags = sum(len(meta.tags) for meta in results.values())
-        len_all_commits = sum(len(meta.commits) for meta in results.values())
+        counts = self.result_counts(results)
+        len_all_tags = counts['tags']
+        len_all_commits = counts['commits']
         print('--- Extract Git Metadata ---')
         print(f'Extracted {len_all_tags} tags and {len_all_commits} commits from {len(results)} repos')
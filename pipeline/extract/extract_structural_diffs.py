@@ -1,20 +1,25 @@
 """Discovery part of the pipeline."""
-from typing import Any, Dict, List, Iterable, Mapping, Sequence, Set, cast, Tuple, Optional
+from typing import Any, Callable, Dict, List, Iterable, Iterator, Mapping, Sequence, Set, cast, Tuple, Optional
 
+import functools
 import itertools
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 
+import attr
 import git
 import pendulum
 from ansible.errors import AnsibleError
 from tqdm import tqdm
 
-from config import MainConfig
+from config import ExtractStructuralDiffsConfig
 from models.role_metadata import GalaxyMetadata
 from models.git import GitRepo, GitCommit, GitTag, GitRepoMetadata
 from models.serialize import CONVERTER
-from models.structural.role import StructuralRoleModel, MultiStructuralRoleModel
-from models.structural.diff import StructuralRoleEvolution
+from models.structural.role import StructuralRoleModel, MultiStructuralRoleModel, _LazyProxy
+from models.structural import diff
+from models.structural.diff import DiffSet, StructuralRoleEvolution
 from models.version import Version
 from pipeline.base import ResultMap, Stage, CacheMiss
 from pipeline.extract.extract_structural_models import ExtractStructuralModels
@@ -22,8 +27,64 @@ from pipeline.extract.extract_structural_models import ExtractStructuralModels
 
 from pprint import pprint
 
+
+# Number of roles diffed ahead of the consumer per worker.
+_ROLES_AHEAD_PER_WORKER = 2
+
+
+@attr.s(auto_attribs=True)
+class _DiffChunk:
+    """Diff sets of a range of revisions of a role, computed by a worker."""
+    role_id: str
+    start: int
+    # Unstructured, the diffs reference the structural models otherwise.
+    diff_sets: List[Dict[str, Any]]
+    num_models: int
+    memo_stats: Dict[str, int]
+    # Unstructured models after the first chunk, for the remaining chunks.
+    rest: Optional[List[Dict[str, Any]]] = None
+
+
+def _diff_models(
+        role_id: str, start: int, data: List[Dict[str, Any]],
+        strict_validation: bool = False
+) -> _DiffChunk:
+    """Diff the consecutive revisions of a role, starting at `start`.
+
+    Module-level so that it can be dispatched to worker processes. The models
+    are passed unstructured, they're structured in the worker.
+    """
+    diff.MEMO_STATS.clear()
+    struct_models = CONVERTER.structure(data, List[StructuralRoleModel])
+    evolution = StructuralRoleEvolution.create(
+            MultiStructuralRoleModel(role_id, struct_models),
+            strict_validation)
+    return _DiffChunk(
+            role_id, start, evolution.unstructure_diff_sets(), len(data),
+            dict(diff.MEMO_STATS))
+
+
+def _diff_revisions(
+        models: _LazyProxy, stop: Optional[int] = None,
+        strict_validation: bool = False
+) -> _DiffChunk:
+    """Diff the revisions of a stored role up to `stop`.
+
+    The worker loads the models itself, so only the proxy crosses the process
+    boundary. The file is only loaded once: the models after the first chunk
+    are returned unstructured, to be sent to the workers of the other chunks.
+    """
+    data = models.unstructure_models()
+    chunk = _diff_models(models.role_id, 0, data[:stop], strict_validation)
+    chunk.num_models = len(data)
+    if stop is not None and stop < len(data):
+        # Chunks overlap by a revision.
+        chunk.rest = data[stop - 1:]
+    return chunk
+
+
 class ExtractStructuralDiffs(
-        Stage[StructuralRoleEvolution, MainConfig],
+        Stage[StructuralRoleEvolution, ExtractStructuralDiffsConfig],
         requires=ExtractStructuralModels
 ):
     """Extract metadata from the collected roles."""
@@ -33,18 +94,120 @@ class ExtractStructuralDiffs(
     def run(
             self,
             extract_structural_models: ResultMap[MultiStructuralRoleModel]
-    ) -> ResultMap[StructuralRoleEvolution]:
-        """Run the stage."""
+    ) -> Iterator[StructuralRoleEvolution]:
+        """Run the stage.
+
+        Results are yielded as they are produced so that they're stored
+        immediately.
+        """
+        diff.MEMO_STATS.clear()
+        if self.config.workers > 1:
+            yield from self._diff_in_workers(extract_structural_models)
+            return
+
         models_it: Iterable[MultiStructuralRoleModel] = extract_structural_models.values()
 
         if self.config.progress:
             models_it = tqdm(models_it, desc='Extract structural diffs')
 
-        return ResultMap(map(StructuralRoleEvolution.create, models_it))
+        create = functools.partial(
+                StructuralRoleEvolution.create,
+                strict_validation=self.config.strict_validation)
+        yield from map(create, models_it)
+
+    def _diff_in_workers(
+            self, all_models: ResultMap[MultiStructuralRoleModel]
+    ) -> Iterator[StructuralRoleEvolution]:
+        """Diff the roles in a process pool, yielding them as they finish.
+
+        With a pair chunk size, the revision pairs of long-history roles are
+        split over several workers as well. Each chunk overlaps the next one
+        by a revision. The worker of the first chunk loads the role and sends
+        back the models of the other chunks, which are then submitted. Roles
+        that aren't stored in the dataset are diffed in this process. Only
+        `_ROLES_AHEAD_PER_WORKER` roles per worker are submitted ahead of the
+        consumer, so that the results don't pile up in memory.
+        """
+        chunk_size = self.config.pair_chunk_size
+        strict_validation = self.config.strict_validation
+        pbar = None
+        if self.config.progress:
+            pbar = tqdm(total=len(all_models), desc='Extract structural diffs')
+        # Chunks of each role received so far, and how many are expected.
+        chunks: Dict[str, Dict[int, List[Dict[str, Any]]]] = {}
+        num_chunks: Dict[str, int] = {}
+        done: 'queue.Queue[Future[_DiffChunk]]' = queue.Queue()
+
+        roles = iter(all_models.values())
+
+        with ProcessPoolExecutor(max_workers=self.config.workers) as executor:
+            def submit(role_id: str, fn: Callable[..., _DiffChunk], *args: Any) -> None:
+                future = executor.submit(fn, *args)
+                future.add_done_callback(done.put)
+                num_chunks[role_id] = num_chunks.get(role_id, 0) + 1
+
+            def submit_next_role() -> Iterator[StructuralRoleEvolution]:
+                for models in roles:
+                    if not isinstance(models, _LazyProxy):
+                        if pbar is not None:
+                            pbar.update(1)
+                        yield StructuralRoleEvolution.create(models, strict_validation)
+                        continue
+                    chunks[models.role_id] = {}
+                    submit(
+                            models.role_id, _diff_revisions, models,
+                            chunk_size + 1 if chunk_size else None,
+                            strict_validation)
+                    return
+
+            for _ in range(self.config.workers * _ROLES_AHEAD_PER_WORKER):
+                yield from submit_next_role()
+
+            while chunks:
+                chunk = done.get().result()
+                diff.MEMO_STATS.update(chunk.memo_stats)
+                role_chunks = chunks[chunk.role_id]
+                role_chunks[chunk.start] = chunk.diff_sets
+
+                if chunk.rest is not None:
+                    assert chunk_size
+                    num_pairs = chunk.num_models - 1
+                    for start in range(chunk_size, num_pairs, chunk_size):
+                        offset = start - chunk_size
+                        submit(
+                                chunk.role_id, _diff_models, chunk.role_id,
+                                start, chunk.rest[offset:offset + chunk_size + 1],
+                                strict_validation)
+
+                if len(role_chunks) < num_chunks[chunk.role_id]:
+                    continue
+                del chunks[chunk.role_id]
+                unstructured = [
+                        diff_set
+                        for start in sorted(role_chunks)
+                        for diff_set in role_chunks[start]]
+                diff_sets = [DiffSet.structure(diff_set) for diff_set in unstructured]
+                if pbar is not None:
+                    pbar.update(1)
+                yield StructuralRoleEvolution(chunk.role_id, diff_sets, unstructured)
+                yield from submit_next_role()
+
+        if pbar is not None:
+            pbar.close()
+
+    def count_result(self, result: StructuralRoleEvolution) -> Mapping[str, int]:
+        """Count the diff sets and diffs of a role, for the report."""
+        return {
+                'diff_sets': len(result.diff_sets),
+                'diffs': sum(len(diffs.diffs) for diffs in result.diff_sets)}
 
     def report_results(self, results: ResultMap[StructuralRoleEvolution]) -> None:
         """Report statistics on gathered roles."""
-        num_diff_sets = sum(len(res.diff_sets) for res in results.values())
-        num_diffs = sum(len(diffs.diffs) for res in results.values() for diffs in res.diff_sets)
+        counts = self.result_counts(results)
+        num_diff_sets = counts['diff_sets']
+        num_diffs = counts['diffs']
         print('--- Role Structural Diff Extraction ---')
         print(f'Extracted {num_diff_sets} diff sets ({num_diffs} diffs) for {len(results)} roles')
+        hits, misses = diff.MEMO_STATS['hits'], diff.MEMO_STATS['misses']
+        if hits or misses:
+            print(f'Similarity scores: {misses} computed, {hits} reused ({hits / (hits + misses):.1%})')
@@ -1,9 +1,14 @@
 """Discovery part of the pipeline."""
-from typing import Any, Dict, List, Iterable, Mapping, Sequence, Set, cast, Tuple, Optional
+from typing import Any, Callable, Dict, List, Iterable, Iterator, Mapping, Sequence, Set, cast, Tuple, Optional
 
 import itertools
+import os
+import posixpath
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from pathlib import Path
 
+import attr
 import git
 import pendulum
 from ansible.errors import AnsibleError
@@ -13,6 +18,7 @@ from config import ExtractStructuralModelsConfig
 from models.role_metadata import GalaxyMetadata
 from models.git import GitRepo, GitCommit, GitTag, GitRepoMetadata
 from models.serialize import CONVERTER
+from models.structural.cache import ParsedFileCache
 from models.structural.role import StructuralRoleModel, MultiStructuralRoleModel
 from models.version import Version
 from pipeline.base import ResultMap, Stage, CacheMiss
@@ -27,6 +33,188 @@ def _log(text: str) -> None:
     with Path('galaxy.log').open('at') as flog:
         flog.write(text + '\n')
 
+# Directories of a role that are parsed into a structural model.
+_ROLE_DIRS = ('tasks', 'handlers', 'defaults', 'vars', 'meta')
+_SYMLINK_MODE = 0o120000
+_MAX_SYMLINK_DEPTH = 8
+# Repositories submitted to each worker ahead of the consumer.
+_REPOS_AHEAD_PER_WORKER = 2
+
+
+def _resolve_tree_path(
+        commit: git.Commit, path: str, depth: int = 0
+) -> Optional[git.objects.base.Object]:
+    """Look up a path in a commit's tree, following symbolic links."""
+    obj = commit.tree
+    parts = [part for part in path.split('/') if part]
+    for idx, part in enumerate(parts):
+        if obj.type != 'tree':
+            return None
+        try:
+            obj = obj / part
+        except KeyError:
+            return None
+        if obj.mode == _SYMLINK_MODE:
+            if depth >= _MAX_SYMLINK_DEPTH:
+                return None
+            link = obj.data_stream.read().decode('utf-8', errors='replace')
+            if posixpath.isabs(link):
+                return None
+            base = '/'.join(parts[:idx])
+            target = posixpath.normpath(posixpath.join(base, link))
+            if target == '..' or target.startswith('../'):
+                return None
+            rest = '/'.join([target] + parts[idx + 1:])
+            return _resolve_tree_path(commit, rest, depth + 1)
+    return obj
+
+
+def _write_tree_object(
+        commit: git.Commit, obj: git.objects.base.Object, tree_path: str,
+        target: Path
+) -> None:
+    if obj.type == 'tree':
+        target.mkdir(parents=True, exist_ok=True)
+        for child in obj:
+            child_path = posixpath.join(tree_path, child.name)
+            _write_tree_object(commit, child, child_path, target / child.name)
+    elif obj.type == 'blob' and obj.mode == _SYMLINK_MODE:
+        resolved = _resolve_tree_path(commit, tree_path)
+        if resolved is not None:
+            _write_tree_object(commit, resolved, tree_path, target)
+        else:
+            # Points outside of the repository, or dangling. Keep it as a
+            # link, it'll behave the same as it would in a checkout.
+            os.symlink(obj.data_stream.read().decode('utf-8', errors='replace'), target)
+    elif obj.type == 'blob':
+        target.write_bytes(obj.data_stream.read())
+    else:
+        # Submodules: An uninitialised submodule is an empty directory.
+        target.mkdir(parents=True, exist_ok=True)
+
+
+def materialize_role_tree(repo: git.Repo, sha1: str, target: Path) -> None:
+    """Write the role files of a revision to `target` without a checkout.
+
+    Only the directories that make up a role's structural model are read,
+    straight from the git object database, so the clone's working tree is
+    never touched.
+    """
+    commit = repo.commit(sha1)
+    target.mkdir(parents=True, exist_ok=True)
+    for dir_name in _ROLE_DIRS:
+        obj = _resolve_tree_path(commit, dir_name)
+        if obj is not None:
+            _write_tree_object(commit, obj, dir_name, target / dir_name)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class _ExtractionOptions:
+    """Options for the extraction of a repository, passed to workers."""
+    extract_head: bool
+    checkout: bool = True
+    cache_dir: Optional[Path] = None
+    cache_size: int = 0
+    strict_validation: bool = False
+
+
+@attr.s(auto_attribs=True)
+class _RepositoryResult:
+    model: MultiStructuralRoleModel
+    # (repo, rev, error) for each revision that failed to load.
+    failures: List[Tuple[str, str, str]]
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+
+def _extract_revision(
+        repo: git.Repo, role_name: str, sha1: str, rev: str,
+        checkout: bool = True, cache: Optional[ParsedFileCache] = None,
+        strict_validation: bool = False
+) -> Dict[str, Any]:
+    if checkout:
+        repo.git.checkout(sha1, force=True)
+        return StructuralRoleModel.create_unstructured(
+                Path(repo.working_tree_dir), role_name, rev, cache,
+                strict_validation)
+
+    with tempfile.TemporaryDirectory(prefix='voyager-') as tmpdir:
+        # Keep the directory name of the clone, the role name is derived from it.
+        role_path = Path(tmpdir) / Path(repo.working_tree_dir).name
+        materialize_role_tree(repo, sha1, role_path)
+        return StructuralRoleModel.create_unstructured(
+                role_path, role_name, rev, cache, strict_validation)
+
+
+def _extract_repository(
+        repo_path: Path, role_name: str, revs: List[Tuple[str, str]],
+        options: _ExtractionOptions,
+        on_extracted: Optional[Callable[[], None]] = None
+) -> _RepositoryResult:
+    """Extract the structural models of all revisions of a repository.
+
+    Module-level so that it can be dispatched to worker processes. Failing
+    revisions are recorded in the result. The repository is always reset to
+    its original HEAD. Without `checkout`, revisions are read from the object
+    database and the repository is left untouched. The models are kept in
+    their unstructured form, as they're dumped, so that they're neither held
+    nor sent back in both forms.
+    """
+    cache = None
+    if options.cache_dir is not None:
+        cache = ParsedFileCache(options.cache_dir, options.cache_size)
+
+    role_models: List[Dict[str, Any]] = []
+    failures: List[Tuple[str, str, str]] = []
+
+    def extract(sha1: str, rev: str) -> None:
+        try:
+            role_models.append(_extract_revision(
+                    git_repo_obj, role_name, sha1, rev, options.checkout,
+                    cache, options.strict_validation))
+        except Exception as exc:
+            failures.append((str(git_repo_obj), rev, str(exc)))
+            return
+        if on_extracted is not None:
+            on_extracted()
+
+    git_repo_obj = git.Repo(repo_path)
+    try:
+        if not options.checkout:
+            for sha1, rev in revs:
+                extract(sha1, rev)
+            if options.extract_head:
+                extract('HEAD', 'HEAD')
+        else:
+            if git_repo_obj.head.is_detached:
+                save_branch = git_repo_obj.head.commit.hexsha  # Save the commit hash instead
+            else:
+                save_branch = git_repo_obj.active_branch  # Save the branch normally
+            try:
+                for sha1, rev in revs:
+                    extract(sha1, rev)
+
+                # Also extract for the latest commit if we're extracting tags.
+                if options.extract_head:
+                    git_repo_obj.git.checkout(save_branch, force=True)
+                    extract('HEAD', 'HEAD')
+            finally:
+                # Make sure to reset the repo to the HEAD from before
+                git_repo_obj.git.checkout(save_branch, force=True)
+    finally:
+        # Close the repository's persistent git processes, which would leak in
+        # long-lived worker processes.
+        git_repo_obj.close()
+
+    result = _RepositoryResult(
+            MultiStructuralRoleModel.from_unstructured(role_name, role_models),
+            failures)
+    if cache is not None:
+        result.cache_hits = cache.hits
+        result.cache_misses = cache.misses
+    return result
+
+
 class ExtractStructuralModels(
         Stage[MultiStructuralRoleModel, ExtractStructuralModelsConfig],
         requires=(ExtractRoleMetadata, Clone, ExtractGitMetadata)
@@ -35,14 +223,29 @@ class ExtractStructuralModels(
 
     dataset_dir_name = 'StructuralModels'
 
+    # (hits, misses) of the parsed file cache during the last run.
+    cache_stats: Optional[Tuple[int, int]] = None
+
     def run(
             self,
             extract_role_metadata: ResultMap[GalaxyMetadata],
             extract_git_metadata: ResultMap[GitRepoMetadata],
             clone: ResultMap[GitRepo]
-    ) -> ResultMap[MultiStructuralRoleModel]:
-        """Run the stage."""
+    ) -> Iterator[MultiStructuralRoleModel]:
+        """Run the stage.
+
+        Models are yielded per role as soon as they're extracted, so that
+        they can be stored and released one at a time.
+        """
         role_repos = self.get_role_repositories(extract_role_metadata, clone, extract_git_metadata, self.config.max_roles, self.config.start_roles, self.config.end_roles)
+        all_revs = {role_name: revs for _, role_name, revs in role_repos}
+        existing: Mapping[str, MultiStructuralRoleModel] = {}
+        if self.config.incremental:
+            # Includes the roles stored before an earlier run was interrupted.
+            # The stored models are only loaded as needed, but the proxies are
+            # kept so that their revisions are only read once.
+            existing = dict(self.load_partial_from_dataset())
+            role_repos = self._keep_missing_revisions(role_repos, existing)
         num_revs = sum(len(revs) for (_, _, revs) in role_repos)
         if not self.config.commits:
             num_revs += len(role_repos)
@@ -60,60 +263,170 @@ class ExtractStructuralModels(
             task_list = role_repos
             rev_pbar = None
 
-        results: List[MultiStructuralRoleModel] = []
-        failures = 0
-        for repo, role_name, revs in task_list:
-            git_repo_obj = git.Repo(repo.path)
-            if git_repo_obj.head.is_detached:
-                save_branch = git_repo_obj.head.commit.hexsha  # Save the commit hash instead
-            else:
-                save_branch = git_repo_obj.active_branch  # Save the branch normally
-            role_models = []
-            try:
-                for sha1, rev in revs:
-                    model = self.extract(git_repo_obj, role_name, sha1, rev, rev_pbar)
-                    if model is None:
-                        failures += 1
-                    else:
-                        role_models.append(model)
+        options = _ExtractionOptions(
+                extract_head=not self.config.commits,
+                checkout=self.config.checkout,
+                cache_dir=self.cache_directory if self.config.parse_cache else None,
+                cache_size=self.config.parse_cache_size * 1024 * 1024,
+                strict_validation=self.config.strict_validation)
 
-                # Also extract for the latest commit if we're extracting tags.
-                if not self.config.commits:
-                    git_repo_obj.git.checkout(save_branch, force=True)
-                    model = self.extract(git_repo_obj, role_name, 'HEAD', 'HEAD', rev_pbar)
-                    if model is None:
-                        failures += 1
-                    else:
-                        role_models.append(model)
-            finally:
-                # Make sure to reset the repo to the HEAD from before
-                git_repo_obj.git.checkout(save_branch, force=True)
-            results.append(MultiStructuralRoleModel(role_name, role_models))
+        extracted_ids: Set[str] = set()
+        failures = 0
+        cache_hits = cache_misses = 0
+        for result in self._extract_repositories(role_repos, task_list, rev_pbar, options):
+            for repo_str, rev, error in result.failures:
+                tqdm.write(f'Failed to load {repo_str} {rev}: {error}')
+                _log(f"EXTRACT ERROR | Repo: {repo_str} | Rev: {rev} | Error: {error}")
+            failures += len(result.failures)
+            cache_hits += result.cache_hits
+            cache_misses += result.cache_misses
+            model = result.model
+            if model.role_id in existing:
+                model = self._merge_models(
+                        existing[model.role_id], model,
+                        all_revs[model.role_id], options.extract_head)
+            extracted_ids.add(model.role_id)
+            yield model
         if rev_pbar is not None:
             rev_pbar.close()
 
         print(f'{failures} roles failed to load')
 
-        return ResultMap(results)
+        # Keep the roles that were up-to-date or not selected in this run.
+        for role_id in existing:
+            if role_id not in extracted_ids:
+                yield existing[role_id]
+        if options.cache_dir is not None:
+            self.cache_stats = (cache_hits, cache_misses)
+            evicted = ParsedFileCache(options.cache_dir, options.cache_size).evict()
+            if evicted:
+                print(f'Evicted {evicted} entries from the parse cache')
+
+    def load_from_dataset(self) -> ResultMap[MultiStructuralRoleModel]:
+        """Load the results of a previous run from the dataset.
+
+        An incremental run always needs to check for new revisions, so it
+        never uses the cached results as-is.
+        """
+        if (isinstance(self.config, ExtractStructuralModelsConfig)
+                and self.config.incremental):
+            raise CacheMiss()
+        return super().load_from_dataset()
+
+    def _keep_missing_revisions(
+            self, role_repos: List[Tuple[GitRepo, str, List[Tuple[str, str]]]],
+            existing: Mapping[str, MultiStructuralRoleModel]
+    ) -> List[Tuple[GitRepo, str, List[Tuple[str, str]]]]:
+        """Drop the revisions that have already been extracted.
+
+        Only the revisions of the stored models are read, the models aren't
+        structured.
+        """
+        missing_repos = []
+        for repo, role_name, revs in role_repos:
+            if role_name in existing:
+                done = set(existing[role_name].revisions())
+                revs = [(sha1, rev) for sha1, rev in revs if rev not in done]
+                # HEAD may have moved since, so it's always extracted again.
+                if not revs and self.config.commits:
+                    continue
+            missing_repos.append((repo, role_name, revs))
+        return missing_repos
+
+    def _merge_models(
+            self, old: MultiStructuralRoleModel, new: MultiStructuralRoleModel,
+            revs: List[Tuple[str, str]], extract_head: bool
+    ) -> MultiStructuralRoleModel:
+        """Merge newly extracted revisions into the previous ones.
+
+        Models are ordered like in a full extraction, revisions that are no
+        longer in the repository's metadata are dropped. The models are merged
+        in their unstructured form, so the previous ones aren't structured.
+        """
+        by_rev = {model['role_rev']: model for model in old.unstructure_models()}
+        by_rev.update((model['role_rev'], model) for model in new.unstructure_models())
+        order = [rev for _, rev in revs]
+        if extract_head:
+            order.append('HEAD')
+        return MultiStructuralRoleModel.from_unstructured(
+                new.role_id, [by_rev[rev] for rev in order if rev in by_rev])
+
+    def dump_result(self, result: MultiStructuralRoleModel, dirpath: Path) -> Path:
+        """Dump a role's models in the configured storage format."""
+        return result.dump(dirpath, self.config.storage_format)
+
+    def count_result(self, result: MultiStructuralRoleModel) -> Mapping[str, int]:
+        """Count the models of a role, for the report."""
+        return {'models': len(result.revisions())}
 
     def report_results(self, results: ResultMap[MultiStructuralRoleModel]) -> None:
         """Report statistics on gathered roles."""
-        num_all_roles = sum(len(res.structural_models) for res in results.values())
+        num_all_roles = self.result_counts(results)['models']
         print('--- Role Structural Model Extraction ---')
         print(f'Extracted {num_all_roles} structural models for {len(results)} roles')
+        if self.cache_stats is not None:
+            hits, misses = self.cache_stats
+            total = hits + misses
+            hit_rate = hits / total if total else 0
+            print(f'Parse cache: {hits} hits, {misses} misses ({hit_rate:.1%} hit rate)')
 
+    @property
+    def cache_directory(self) -> Path:
+        """Get the directory of the parsed file cache.
 
-    def extract(self, repo: git.Repo, role_name: str, sha1: str, rev: str, rev_pbar: Optional[tqdm]) -> Optional[StructuralRoleModel]:
-        try:
-            repo.git.checkout(sha1, force=True)
-            model = StructuralRoleModel.create(Path(repo.working_tree_dir), role_name, rev)
-            if rev_pbar is not None:
-                rev_pbar.update(1)
-            return model
-        except Exception as exc:
-            tqdm.write(f'Failed to load {repo} {rev}: {exc}')
-            _log(f"EXTRACT ERROR | Repo: {repo} | Rev: {rev} | Error: {exc}")
-            return None
+        Kept outside of the stage's output directory so that it survives
+        regenerating the dataset.
+        """
+        return self.config.output_directory / (self.dataset_dir_name + 'Cache')
+
+
+    def _extract_repositories(
+            self, role_repos: List[Tuple[GitRepo, str, List[Tuple[str, str]]]],
+            task_list: Iterable[Tuple[GitRepo, str, List[Tuple[str, str]]]],
+            rev_pbar: Optional[tqdm], options: _ExtractionOptions
+    ) -> Iterator[_RepositoryResult]:
+        """Extract the models of each repository, yielding them as they finish.
+
+        With more than one worker, repositories are distributed over a
+        process pool and results are yielded in completion order. Progress is
+        reported by the main process only. Only `_REPOS_AHEAD_PER_WORKER`
+        repositories per worker are in flight, so that the results don't pile
+        up in memory.
+        """
+        if self.config.workers <= 1:
+            on_extracted = (lambda: rev_pbar.update(1)) if rev_pbar is not None else None
+            for repo, role_name, revs in task_list:
+                yield _extract_repository(
+                        repo.path, role_name, revs, options, on_extracted)
+            return
+
+        repo_pbar = task_list if isinstance(task_list, tqdm) else None
+        repos = iter(role_repos)
+        max_in_flight = self.config.workers * _REPOS_AHEAD_PER_WORKER
+        with ProcessPoolExecutor(max_workers=self.config.workers) as executor:
+            in_flight: Set['Future[_RepositoryResult]'] = set()
+
+            def submit(count: int) -> None:
+                for repo, role_name, revs in itertools.islice(repos, count):
+                    in_flight.add(executor.submit(
+                            _extract_repository, repo.path, role_name, revs,
+                            options))
+
+            submit(max_in_flight)
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                # Drop each future once its result is yielded.
+                while done:
+                    result = done.pop().result()
+                    submit(max_in_flight - len(in_flight) - len(done))
+                    if rev_pbar is not None:
+                        rev_pbar.update(len(result.model.revisions()))
+                    if repo_pbar is not None:
+                        repo_pbar.update(1)
+                    yield result
+                    del result
+        if repo_pbar is not None:
+            repo_pbar.close()
 
     def get_role_repositories(
             self, role_meta: ResultMap[GalaxyMetadata], clone: ResultMap[GitRepo],
@@ -143,7 +456,7 @@ class ExtractStructuralModels(
                 revs = self._keep_only_semver(revs)
 
             # If there's no commits, the repo is empty, so just skip it.
-            if git_repo_metadata.commits:
+            if not git_repo_metadata.is_empty:
                 results.append((git_repo, role.canonical_id, revs))
                 count += 1
 
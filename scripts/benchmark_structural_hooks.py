@@ -0,0 +1,80 @@
+"""Microbenchmark of the (un)structure hooks of the structural models.
+
+Usage: benchmark_structural_hooks.py DATASET_DIR [MAX_ROLES] [REPEAT]
+
+Structures and unstructures the StructuralModels of a dataset with the
+generated hooks and with the classes' own methods, and reports the cost per
+task. Files are read before timing, so only the conversion is measured.
+"""
+from typing import Any, Callable, List
+
+import sys
+import time
+from pathlib import Path
+
+import cattr
+
+from models.structural.role import CONVERTER, StructuralRoleModel, register_hooks
+from models.structural.storage import format_for_path
+from pipeline.base import read_index
+
+models_dir = Path(sys.argv[1]) / 'StructuralModels'
+max_roles = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+baseline = cattr.GenConverter()
+register_hooks(baseline, generated=False)
+
+index = read_index(models_dir)
+corpus = [
+        format_for_path(models_dir / file_name).load(models_dir / file_name)
+        for file_name in list(index.values())[:max_roles]]
+
+
+def count_tasks(content: List[Any]) -> int:
+    num_tasks = 0
+    for obj in content:
+        if 'block' in obj:
+            for cont_name in ('block', 'rescue', 'always'):
+                num_tasks += count_tasks(obj.get(cont_name) or [])
+        else:
+            num_tasks += 1
+    return num_tasks
+
+
+num_tasks = sum(
+        count_tasks(task_file['content'])
+        for models in corpus for model in models
+        for files in ('task_files', 'handler_files')
+        for task_file in model['role_root'][files])
+num_models = sum(len(models) for models in corpus)
+
+
+def best_time(fn: Callable[[], Any]) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def report(name: str, converter: cattr.GenConverter) -> None:
+    structured = [
+            converter.structure(models, List[StructuralRoleModel])
+            for models in corpus]
+    t_struct = best_time(lambda: [
+            converter.structure(models, List[StructuralRoleModel])
+            for models in corpus])
+    # The model unstructures its role with the module's converter.
+    t_unstruct = best_time(lambda: [
+            converter.unstructure(model.role_root)
+            for models in structured for model in models])
+    print(
+            f'{name:>9}: structure {t_struct / num_tasks * 1e6:.2f} us/task, '
+            f'unstructure {t_unstruct / num_tasks * 1e6:.2f} us/task')
+
+
+print(f'{len(corpus)} roles, {num_models} models, {num_tasks} tasks')
+report('methods', baseline)
+report('generated', CONVERTER)
@@ -0,0 +1,61 @@
+"""Benchmark of the memory used by loaded structural models.
+
+Usage: benchmark_structural_memory.py DATASET_DIR [MAX_ROLES]
+
+Loads the StructuralModels of a dataset, keeping them all in memory, and
+reports the memory that remains allocated per model and per task, as
+measured by tracemalloc.
+"""
+from typing import Any, List
+
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+from models.structural.role import CONVERTER, StructuralRoleModel
+from models.structural.storage import format_for_path
+from pipeline.base import read_index
+
+models_dir = Path(sys.argv[1]) / 'StructuralModels'
+max_roles = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+index = read_index(models_dir)
+file_names = list(index.values())[:max_roles]
+
+
+def count_tasks(content: List[Any]) -> int:
+    num_tasks = 0
+    for obj in content:
+        if 'block' in obj:
+            for cont_name in ('block', 'rescue', 'always'):
+                num_tasks += count_tasks(obj.get(cont_name) or [])
+        else:
+            num_tasks += 1
+    return num_tasks
+
+
+num_models = 0
+num_tasks = 0
+loaded = []
+gc.collect()
+tracemalloc.start()
+before, _ = tracemalloc.get_traced_memory()
+for file_name in file_names:
+    data = format_for_path(models_dir / file_name).load(models_dir / file_name)
+    num_models += len(data)
+    num_tasks += sum(
+            count_tasks(task_file['content'])
+            for model in data
+            for files in ('task_files', 'handler_files')
+            for task_file in model['role_root'][files])
+    loaded.append(CONVERTER.structure(data, List[StructuralRoleModel]))
+    del data
+gc.collect()
+after, _ = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+used = after - before
+print(f'{len(loaded)} roles, {num_models} models, {num_tasks} tasks')
+print(f'{used / 2 ** 20:.1f} MiB in total')
+print(f'{used / num_models / 1024:.1f} KiB per model, {used / num_tasks:.0f} B per task')
@@ -0,0 +1,38 @@
+"""Script to convert a StructuralModels dataset to another storage format.
+
+Usage: convert_structural_models.py DATASET_DIR [FORMAT]
+
+FORMAT is one of the storage formats in models.structural.storage and
+defaults to msgpack. The index is rewritten and the old files are removed.
+"""
+import sys
+from pathlib import Path
+
+from tqdm import tqdm
+
+from models.structural.storage import STORAGE_FORMATS, format_for_path
+from pipeline.base import read_index, write_index
+
+models_dir = Path(sys.argv[1]) / 'StructuralModels'
+target_fmt = STORAGE_FORMATS[sys.argv[2] if len(sys.argv) > 2 else 'msgpack']
+
+index = read_index(models_dir)
+new_index = {}
+old_files = []
+for result_id, file_name in tqdm(index.items(), desc='Converting', unit=' roles'):
+    src_path = models_dir / file_name
+    src_fmt = format_for_path(src_path)
+    if src_fmt is target_fmt:
+        new_index[result_id] = file_name
+        continue
+    dst_path = src_path.with_suffix(target_fmt.suffix)
+    target_fmt.dump(src_fmt.load(src_path), dst_path)
+    new_index[result_id] = str(dst_path.relative_to(models_dir))
+    old_files.append(src_path)
+
+# Only remove the old files once the new index is in place.
+write_index(models_dir, new_index)
+for old_file in old_files:
+    old_file.unlink()
+
+print(f'Converted {len(old_files)} files to {target_fmt.name}')
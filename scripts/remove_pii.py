@@ -1,5 +1,6 @@
 """Anonymise the collected data, remove or obfuscate PII."""
 
+import json
 import yaml
 import sys
 from pathlib import Path
@@ -8,6 +9,8 @@ import tqdm
 
 from yaml import CLoader as Loader, CDumper as Dumper
 
+from pipeline.base import read_index, write_index
+
 assert __name__ == '__main__', 'Can only run this as script, not module'
 
 dataset_path = Path(sys.argv[1])
@@ -54,23 +57,35 @@ for name, f in tqdm.tqdm(gm_idx.items()):
 
 # Repository metadata
 rm = dataset_path / 'RepositoryMetadata'
-rm_idx = yaml.load((rm / 'index.yaml').read_text())
+rm_idx = read_index(rm)
 anon_rm = anon_path / 'RepositoryMetadata'
+pii_attrs = {
+    'commits': ('author_email', 'author_name', 'committer_email', 'committer_name'),
+    'tags': ('tagger_email', 'tagger_name'),
+}
 for rid, mpath in tqdm.tqdm(rm_idx.items()):
     anon_path = anon_rm / mpath
-    anon_path.parent.mkdir(exist_ok=True, parents=True)
-    content = yaml.load((rm / mpath).read_text(), Loader=Loader)
-    for commit in content['commits']:
-        for attr in ('author_email', 'author_name', 'committer_email', 'committer_name'):
-            if commit[attr] is not None:
-                commit[attr] = hashlib.sha1(commit[attr].encode()).hexdigest()
-    for tag in content['tags']:
-        for attr in ('tagger_email', 'tagger_name'):
-            if tag[attr] is not None:
-                tag[attr] = hashlib.sha1(tag[attr].encode()).hexdigest()
+    if (rm / mpath).is_dir():
+        # Commits and tags stored in separate JSON lines files
+        anon_path.mkdir(exist_ok=True, parents=True)
+        content = {
+            key: [json.loads(line) for line in (rm / mpath / f'{key}.jsonl').read_text().splitlines()]
+            for key in pii_attrs}
+    else:
+        anon_path.parent.mkdir(exist_ok=True, parents=True)
+        content = yaml.load((rm / mpath).read_text(), Loader=Loader)
+    for key, attrs in pii_attrs.items():
+        for obj in content[key]:
+            for attr in attrs:
+                if obj[attr] is not None:
+                    obj[attr] = hashlib.sha1(obj[attr].encode()).hexdigest()
 
-    anon_path.write_text(yaml.dump(content, Dumper=Dumper))
+    if (rm / mpath).is_dir():
+        for key, objs in content.items():
+            (anon_path / f'{key}.jsonl').write_text(''.join(json.dumps(obj) + '\n' for obj in objs))
+    else:
+        anon_path.write_text(yaml.dump(content, Dumper=Dumper))
 
-repo_idx = yaml.load((dataset_path / 'Repositories' / 'index.yaml').read_text())
+repo_idx = read_index(dataset_path / 'Repositories')
 new_idx = {gxy_id: rm_idx[repo_path] for gxy_id, repo_path in repo_idx.items()}
-(anon_rm / 'index.yaml').write_text(yaml.dump(new_idx))
+write_index(anon_rm, new_idx)
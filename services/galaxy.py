@@ -1,14 +1,18 @@
 """Ansible Galaxy API service."""
-from typing import Callable, Dict, Iterator, Mapping, Optional, Sequence, Type, TypeVar
+from typing import Any, Callable, Collection, Deque, Dict, Iterable, Iterator, Mapping, Optional, Sequence, Tuple, Type, TypeVar
 
 import enum
 import itertools
 import json
+import math
 import re
+import threading
 import urllib.parse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from json.decoder import JSONDecodeError
 from pathlib import Path
-from time import sleep
+from time import monotonic, sleep
 
 import requests
 import tqdm
@@ -16,6 +20,11 @@ from requests.exceptions import Timeout
 
 from models.galaxy import GalaxyAPIPage, GalaxyImportEventAPIResponse
 
+# Number of pages requested ahead of the consumer per worker, when loading
+# pages concurrently.
+_PAGES_AHEAD_PER_WORKER = 2
+# Likewise for roles, when loading roles concurrently.
+_ROLES_AHEAD_PER_WORKER = 2
 
 def _log(text: str) -> None:
     # Not thread safe, but doesn't really matter that much
@@ -29,99 +38,311 @@ def _remove_unused_params(
     return {k: v for k, v in params.items() if v is not None}
 
 
+class RateLimiter:
+    """Request budget shared by all requests of an API service.
+
+    Spaces requests so that at most `rate` requests per second are sent, if
+    given. When the server signals that we're being rate limited, `backoff`
+    pauses all requests, doubling the delay on every consecutive signal, up to
+    `max_delay` seconds. Thread safe.
+    """
+
+    def __init__(
+            self, rate: Optional[float] = None, base_delay: float = 1.0,
+            max_delay: float = 60.0
+    ) -> None:
+        """Initialize the budget."""
+        self._interval = 1 / rate if rate else 0.0
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._num_backoffs = 0
+
+    def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        with self._lock:
+            now = monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            sleep(slot - now)
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        """Pause all requests after being rate limited, return the delay."""
+        with self._lock:
+            if retry_after is not None:
+                delay = retry_after
+            else:
+                delay = min(
+                        self._base_delay * 2 ** self._num_backoffs,
+                        self._max_delay)
+            self._num_backoffs += 1
+            self._paused_until = max(self._paused_until, monotonic() + delay)
+        return delay
+
+    def reset(self) -> None:
+        """Reset the backoff after a successful request."""
+        with self._lock:
+            self._num_backoffs = 0
+
+
+def _get_retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+
 class GalaxyAPI:
     """Galaxy API service."""
 
     _session: requests.Session
+    _rate_limiter: RateLimiter
 
-    def __init__(self, session: Optional[requests.Session] = None) -> None:
-        """Initialize the API service with an optional session."""
+    def __init__(
+            self, session: Optional[requests.Session] = None,
+            rate_limiter: Optional[RateLimiter] = None
+    ) -> None:
+        """Initialize the API service with an optional session and budget."""
         # TODO(ROpdebee): We might need to include a Galaxy API key in the
         #                 future, probably through an environment variable.
         #                 We should probably accept it as an argument here.
         if session is None:  # pragma: no cover (session required for tests)
             session = requests.Session()
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
         self._session = session
+        self._rate_limiter = rate_limiter
+        self._owner_thread = threading.get_ident()
+        self._thread_sessions = threading.local()
+
+    def _get_session(self) -> requests.Session:
+        """Get the session to use in the current thread.
+
+        Sessions aren't thread safe, so the workers of concurrent requests
+        each get their own session, with the headers of the given one.
+        """
+        if threading.get_ident() == self._owner_thread:
+            return self._session
+        session: Optional[requests.Session] = getattr(self._thread_sessions, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self._session.headers)
+            self._thread_sessions.session = session
+        return session
+
+    def _get_json(
+            self, url: str, final_statuses: Collection[int] = ()
+    ) -> Tuple[requests.Response, Optional[Any]]:
+        """Get a JSON response, retrying on time-outs and rate limits.
+
+        Returns the response and its decoded content. The content is None for
+        500 Internal Server Errors and for the given final status codes,
+        which aren't retried.
+        """
+        while True:
+            self._rate_limiter.acquire()
+            try:
+                result = self._get_session().get(url, timeout=30)
+            except Timeout:
+                # Try again with same link.
+                _log(f'{url}: Timed out')
+                continue
+            if result.status_code == 500 or result.status_code in final_statuses:
+                return result, None
+            try:
+                content = result.json()
+            except JSONDecodeError:
+                # Non-JSON responses are the rate limiter's doing, back off
+                # and retry with the same link
+                content = None
+            if content is None or result.status_code == 429:
+                delay = self._rate_limiter.backoff(_get_retry_after(result))
+                _log(f'{url}: Rate limit? Backing off for {delay:.1f}s')
+                continue
+            self._rate_limiter.reset()
+            return result, content
 
     def _paginate(
-            self, api_url: str,
+            self, api_url: str, start_page: int = 1,
             **params: Optional[str]
-    ) -> Iterator[str]:
+    ) -> Iterator[Tuple[int, str]]:
         """Paginate through the results of an Ansible Galaxy API query.
 
-        Returns an iterable where new pages are lazily loaded. Requires the
-        API URL to return a 'results' field.
+        Returns an iterable where new pages are lazily loaded, along with
+        their page number. Requires the API URL to return a 'results' field.
         """
-        next_link: Optional[str]
+        if start_page > 1:
+            params['page'] = str(start_page)
         next_link = api_url + '?' + urllib.parse.urlencode(
                 _remove_unused_params(params))
-        page_num = 1
         _log(f'{api_url}: Start')
+        yield from self._follow_pages(next_link, start_page)
+        _log(f'{api_url}: Done')
+
+    def _follow_pages(
+            self, next_link: Optional[str], page_num: int
+    ) -> Iterator[Tuple[int, str]]:
+        """Follow the next links of pages, starting at the given page."""
         while next_link is not None:  # pragma: no branch
-            try:
-                result = self._session.get(next_link, timeout=30)
-            except Timeout:
-                # Try again with same link.
-                _log(f'{next_link}: Timed out')
-                continue
-            try:
-                json = result.json()
-            except JSONDecodeError:
-                # Ugly workaround for potential rate limiting. Sleep and retry
-                # with the same link
-                if result.status_code != 500:
-                    _log(f'{next_link}: Rate limit?')
-                    sleep(5)
-                    continue
+            result, page_json = self._get_json(next_link, final_statuses=(404,))
+            if result.status_code == 404:
+                # Past the last page
+                break
+            if page_json is None:
+                _log(f'{next_link}: 500 Server Error')
+                if 'page=' in next_link:
+                    next_link = re.sub(
+                            r'page=\d+', f'page={page_num + 1}', next_link)
                 else:
-                    _log(f'{next_link}: 500 Server Error')
-                    if 'page=' in next_link:
-                        next_link = re.sub(
-                                r'page=\d+', f'page={page_num + 1}', next_link)
-                    else:
-                        next_link = next_link + f'&page={page_num + 1}'
-                    page_num += 1
-                    continue
-
-            if (next_path := json.get('next', None)) is not None:
+                    next_link = next_link + f'&page={page_num + 1}'
+                page_num += 1
+                continue
+
+            if (next_path := page_json.get('next', None)) is not None:
                 next_link = next_path
             else:
                 # End of results
                 next_link = None
 
-            yield result.text
+            yield page_num, result.text
             page_num += 1
-        _log(f'{api_url}: Done')
 
     def load_pages(
             self, page_name: str, page_url: str,
-            page_size: int = 500,
+            page_size: int = 500, workers: int = 1, start_page: int = 1
     ) -> Iterator[GalaxyAPIPage]:
-        """Load API content pages."""
+        """Load API content pages, optionally starting from a later page.
+
+        Pages are numbered like the API numbers them. Pages that fail with a
+        server error are skipped, leaving a gap in the numbering. With
+        multiple workers, the pages are fetched concurrently, see
+        `load_pages_concurrently`.
+        """
+        if workers > 1:
+            yield from self.load_pages_concurrently(
+                    page_name, page_url, page_size, workers, start_page)
+            return
+
         page_it = self._paginate(
-                page_url, page_size=str(page_size))
+                page_url, start_page, page_size=str(page_size))
         yield from (
-                GalaxyAPIPage(page_name, page_num + 1, page)
-                for page_num, page in enumerate(page_it))
+                GalaxyAPIPage(page_name, page_num, page)
+                for page_num, page in page_it)
+
+    def load_pages_concurrently(
+            self, page_name: str, page_url: str, page_size: int, workers: int,
+            start_page: int = 1
+    ) -> Iterator[GalaxyAPIPage]:
+        """Load API content pages with concurrent requests.
+
+        The first page reports the total count, from which the remaining page
+        links are computed and fetched in a thread pool, while pages are still
+        yielded in order. Only `_PAGES_AHEAD_PER_WORKER` pages per worker are
+        requested ahead of the consumer, so that a slow consumer doesn't
+        cause all responses to pile up in memory.
+        """
+        def page_link(page_num: int) -> str:
+            return page_url + '?' + urllib.parse.urlencode(
+                    {'page_size': str(page_size), 'page': str(page_num)})
 
+        _log(f'{page_url}: Start')
+        result, first_json = self._get_json(page_link(start_page), final_statuses=(404,))
+        if result.status_code == 404:
+            # Past the last page
+            return
+        if first_json is None:
+            # Can't compute the number of pages, fall back to following links.
+            _log(f'{page_link(start_page)}: 500 Server Error')
+            yield from (
+                    GalaxyAPIPage(page_name, page_num, page)
+                    for page_num, page in self._follow_pages(
+                        page_link(start_page + 1), start_page + 1))
+            return
+        yield GalaxyAPIPage(page_name, start_page, result.text)
+
+        num_pages = max(1, math.ceil(int(first_json['count']) / page_size))
+        tail_link = first_json.get('next') if num_pages <= start_page else None
+        page_nums = iter(range(start_page + 1, num_pages + 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight: Deque[Tuple[int, Future[Tuple[requests.Response, Optional[Any]]]]] = deque()
+
+            def request_next_page() -> None:
+                page_num = next(page_nums, None)
+                if page_num is not None:
+                    in_flight.append((
+                            page_num,
+                            executor.submit(self._get_json, page_link(page_num))))
+
+            for _ in range(workers * _PAGES_AHEAD_PER_WORKER):
+                request_next_page()
+            try:
+                while in_flight:
+                    page_num, future = in_flight.popleft()
+                    result, page_json = future.result()
+                    request_next_page()
+                    if page_json is None:
+                        _log(f'{page_link(page_num)}: 500 Server Error')
+                        continue
+                    if page_num == num_pages:
+                        tail_link = page_json.get('next')
+                    yield GalaxyAPIPage(page_name, page_num, result.text)
+            finally:
+                # Stop fetching if the consumer stops early.
+                for _, future in in_flight:
+                    future.cancel()
+
+        # Results may have been added since the count was taken.
+        yield from (
+                GalaxyAPIPage(page_name, page_num, page)
+                for page_num, page in self._follow_pages(
+                    tail_link, max(num_pages, start_page) + 1))
+        _log(f'{page_url}: Done')
 
     def load_role(self, role_id: int) -> Optional[Dict[str, object]]:
-        try:
-            result = self._session.get(
-                    f'https://galaxy.ansible.com/api/v1/roles/{role_id}/')
-            if result.status_code == 403:
-                # Forbidden
-                return None
-            return result.json()  # type: ignore[no-any-return]
-        except Timeout:
-            # Try again with same link.
-            _log(f'{role_id}: Timed out')
-            return self.load_role(role_id)
-        except JSONDecodeError:
-            # Try again with same link.
-            if result.status_code != 500:
-                sleep(5)
-                _log(f'{role_id}: Rate limit?')
-                return self.load_role(role_id)
-            else:
-                raise
+        url = f'https://galaxy.ansible.com/api/v1/roles/{role_id}/'
+        result, role_json = self._get_json(url, final_statuses=(403,))
+        if result.status_code == 403:
+            # Forbidden
+            return None
+        if role_json is None:
+            # 500 Internal Server Error
+            result.raise_for_status()
+        return role_json  # type: ignore[no-any-return]
+
+    def load_roles(
+            self, role_ids: Iterable[int], workers: int = 1
+    ) -> Iterator[Tuple[int, Optional[Dict[str, object]]]]:
+        """Load roles by their IDs, concurrently with multiple workers.
+
+        Yields the role ID along with the role, in the given order. Only
+        `_ROLES_AHEAD_PER_WORKER` roles per worker are requested ahead of the
+        consumer.
+        """
+        if workers <= 1:
+            yield from ((role_id, self.load_role(role_id)) for role_id in role_ids)
+            return
+
+        role_id_it = iter(role_ids)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight: Deque[Tuple[int, Future[Optional[Dict[str, object]]]]] = deque()
+
+            def request_next_role() -> None:
+                role_id = next(role_id_it, None)
+                if role_id is not None:
+                    in_flight.append((role_id, executor.submit(self.load_role, role_id)))
+
+            for _ in range(workers * _ROLES_AHEAD_PER_WORKER):
+                request_next_role()
+            try:
+                while in_flight:
+                    role_id, future = in_flight.popleft()
+                    role = future.result()
+                    request_next_role()
+                    yield role_id, role
+            finally:
+                # Stop loading if the consumer stops early.
+                for _, future in in_flight:
+                    future.cancel()
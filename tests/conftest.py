@@ -1,6 +1,10 @@
 """Test configurations."""
-from typing import Any, Dict, Generator, List, TextIO
+from typing import Any, Dict, Generator, List, Set, TextIO
 
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 import betamax
@@ -54,6 +58,74 @@ def betamax_mock_sessions(
     monkeypatch.setattr(requests, 'Session', create_recorded_session)
 
 
+# Total roles and page size of the stub Galaxy API.
+STUB_COUNT = 23
+STUB_PAGE_SIZE = 5
+
+
+class StubGalaxy:
+    """Stub of the paginated Galaxy roles API."""
+
+    def __init__(self) -> None:
+        self.count = STUB_COUNT
+        self.rate_limited: Set[int] = set()
+        self.server_errors: Set[int] = set()
+        self.requests: List[int] = []
+        self.lock = threading.Lock()
+
+    def respond(self, handler: BaseHTTPRequestHandler) -> None:
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(handler.path).query)
+        page = int(query.get('page', ['1'])[0])
+        page_size = int(query['page_size'][0])
+        with self.lock:
+            self.requests.append(page)
+            if page in self.rate_limited:
+                self.rate_limited.remove(page)
+                self._send(handler, 429, b'<html>Slow down</html>')
+                return
+        if page in self.server_errors:
+            self._send(handler, 500, b'<html>Server error</html>')
+            return
+
+        start = (page - 1) * page_size
+        ids = list(range(start, min(start + page_size, self.count)))
+        host, port = handler.server.server_address[:2]
+        next_link = None
+        if start + page_size < self.count:
+            next_link = f'http://{host}:{port}/api/v1/roles/?page={page + 1}&page_size={page_size}'
+        content = {
+            'count': self.count, 'next': next_link,
+            'results': [{'id': role_id} for role_id in ids]}
+        self._send(handler, 200, json.dumps(content).encode())
+
+    def _send(self, handler: BaseHTTPRequestHandler, status: int, body: bytes) -> None:
+        handler.send_response(status)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+@pytest.fixture()
+def galaxy_stub() -> Generator[StubGalaxy, None, None]:
+    """Serve a stub of the paginated Galaxy roles API on localhost."""
+    stub = StubGalaxy()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            stub.respond(self)
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stub.url = 'http://127.0.0.1:{}/api/v1/roles/'.format(server.server_address[1])  # type: ignore[attr-defined]
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
 def pytest_addoption(parser: _pytest.config.argparsing.Parser) -> None:
     """Add options to pytest parser."""
     parser.addoption(
@@ -0,0 +1,83 @@
+"""Tests for the storage of git repository metadata."""
+from pathlib import Path
+
+import attr
+import pendulum
+import pytest
+import yaml
+
+from models.git import GitCommit, GitRepoMetadata, GitTag
+from models.serialize import CONVERTER
+
+
+@pytest.fixture()
+def meta() -> GitRepoMetadata:
+    commits = [
+        GitCommit(
+            sha1=f'{idx:040x}', message=f'Commit {idx}\n',
+            authored_datetime=pendulum.from_timestamp(1600000000 + idx),
+            author_name='Jöhn', author_email='john@example.com',
+            committed_datetime=pendulum.from_timestamp(1600000100 + idx),
+            committer_name='Committer', committer_email='c@example.com')
+        for idx in range(3)]
+    tags = [
+        GitTag(
+            name='v1.0', message=None, commit_sha1=commits[0].sha1,
+            tagged_datetime=None, tagger_name=None, tagger_email=None),
+        GitTag(
+            name='v1.1', message='Release\nnotes', commit_sha1=commits[2].sha1,
+            tagged_datetime=pendulum.from_timestamp(1600000200),
+            tagger_name='Tagger', tagger_email='t@example.com')]
+    return GitRepoMetadata(
+            commits=commits, tags=tags, repo_owner='me', repo_name='my.repo')
+
+
+def _assert_same(loaded: GitRepoMetadata, meta: GitRepoMetadata) -> None:
+    assert loaded.id == meta.id
+    assert [attr.astuple(c) for c in loaded.commits] == [attr.astuple(c) for c in meta.commits]
+    assert [attr.astuple(t) for t in loaded.tags] == [attr.astuple(t) for t in meta.tags]
+
+
+def test_dump_load(meta: GitRepoMetadata, tmp_path: Path) -> None:
+    loaded = GitRepoMetadata.load(meta.id, meta.dump(tmp_path))
+
+    _assert_same(loaded, meta)
+    assert not loaded.is_empty
+    assert isinstance(loaded.commits[0], GitCommit)
+
+
+def test_load_tags_only(meta: GitRepoMetadata, tmp_path: Path) -> None:
+    path = meta.dump(tmp_path)
+    (path / 'commits.jsonl').unlink()
+    loaded = GitRepoMetadata.load(meta.id, path)
+
+    assert [tag.name for tag in loaded.tags] == ['v1.0', 'v1.1']
+
+
+def test_dates_parsed_on_access(meta: GitRepoMetadata, tmp_path: Path) -> None:
+    commit = GitRepoMetadata.load(meta.id, meta.dump(tmp_path)).commits[1]
+
+    assert commit.sha1 == meta.commits[1].sha1
+    assert 'authored_datetime' not in vars(commit)
+    assert commit.authored_datetime == meta.commits[1].authored_datetime
+    assert isinstance(vars(commit)['authored_datetime'], pendulum.DateTime)
+
+
+def test_empty(tmp_path: Path) -> None:
+    meta = GitRepoMetadata(commits=[], tags=[], repo_owner='me', repo_name='empty')
+    loaded = GitRepoMetadata.load(meta.id, meta.dump(tmp_path))
+
+    assert loaded.is_empty
+    assert loaded.commits == [] and loaded.tags == []
+
+
+def test_load_yaml(meta: GitRepoMetadata, tmp_path: Path) -> None:
+    path = tmp_path / 'me' / 'my.repo.yaml'
+    path.parent.mkdir()
+    path.write_text(yaml.dump({
+        'commits': CONVERTER.unstructure(meta.commits),
+        'tags': CONVERTER.unstructure(meta.tags)}))
+    loaded = GitRepoMetadata.load(meta.id, path)
+
+    _assert_same(loaded, meta)
+    assert not loaded.is_empty
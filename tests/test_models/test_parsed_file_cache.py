@@ -0,0 +1,120 @@
+"""Tests for models.structural.cache."""
+from pathlib import Path
+
+import os
+import subprocess
+
+import pytest
+
+import models.structural.cache as cache_mod
+from models.structural.cache import ParsedFileCache, git_blob_sha, has_static_imports
+from models.structural.role import Role
+
+
+def test_git_blob_sha(tmp_path: Path) -> None:
+    content = b'- name: test\n  debug: msg=hi\n'
+    (tmp_path / 'main.yml').write_bytes(content)
+
+    expected = subprocess.run(
+            ['git', 'hash-object', str(tmp_path / 'main.yml')],
+            capture_output=True, check=True, text=True).stdout.strip()
+
+    assert git_blob_sha(content) == expected
+
+
+def test_hit_and_miss(tmp_path: Path) -> None:
+    cache = ParsedFileCache(tmp_path, 1024 * 1024)
+    calls = []
+
+    def parse() -> object:
+        calls.append(1)
+        return {'parsed': True}
+
+    first = cache.get_or_parse('TaskFile', 'tasks/main.yml', b'abc', parse)
+    second = cache.get_or_parse('TaskFile', 'tasks/main.yml', b'abc', parse)
+
+    assert first == second == {'parsed': True}
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_includes_kind_path_and_content(tmp_path: Path) -> None:
+    cache = ParsedFileCache(tmp_path, 1024 * 1024)
+
+    cache.get_or_parse('TaskFile', 'tasks/main.yml', b'abc', lambda: 1)
+    cache.get_or_parse('HandlerFile', 'tasks/main.yml', b'abc', lambda: 2)
+    cache.get_or_parse('TaskFile', 'tasks/other.yml', b'abc', lambda: 3)
+    cache.get_or_parse('TaskFile', 'tasks/main.yml', b'abcd', lambda: 4)
+
+    assert cache.hits == 0
+    assert cache.misses == 4
+
+
+def test_key_includes_models_fingerprint(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache = ParsedFileCache(tmp_path, 1024 * 1024)
+    cache.get_or_parse('TaskFile', 'tasks/main.yml', b'abc', lambda: 1)
+
+    monkeypatch.setattr(cache_mod, 'models_fingerprint', lambda: 'changed')
+
+    assert cache.get_or_parse('TaskFile', 'tasks/main.yml', b'abc', lambda: 2) == 2
+    assert cache.misses == 2
+
+
+def test_uncacheable_not_stored(tmp_path: Path) -> None:
+    cache = ParsedFileCache(tmp_path, 1024 * 1024)
+
+    cache.get_or_parse('MetaFile', 'meta/main.yml', b'x', lambda: 1, lambda _: False)
+    cache.get_or_parse('MetaFile', 'meta/main.yml', b'x', lambda: 1, lambda _: False)
+
+    assert cache.misses == 2
+
+
+def test_persists(tmp_path: Path) -> None:
+    ParsedFileCache(tmp_path, 1024 * 1024).get_or_parse(
+            'TaskFile', 'tasks/main.yml', b'abc', lambda: 'parsed')
+    cache = ParsedFileCache(tmp_path, 1024 * 1024)
+
+    assert cache.get_or_parse(
+            'TaskFile', 'tasks/main.yml', b'abc', lambda: 'other') == 'parsed'
+    assert cache.hits == 1
+
+
+def test_evict_least_recently_used(tmp_path: Path) -> None:
+    cache = ParsedFileCache(tmp_path, 1024 * 1024)
+    for idx in range(4):
+        cache.get_or_parse('TaskFile', f'tasks/{idx}.yml', b'x', lambda: 'x' * 1000)
+    entries = sorted(tmp_path.glob('*/*'))
+    for mtime, entry in enumerate(entries):
+        os.utime(entry, (mtime, mtime))
+
+    cache.max_size = 2 * entries[0].stat().st_size
+    assert cache.evict() == 2
+
+    assert sorted(tmp_path.glob('*/*')) == entries[2:]
+
+
+@pytest.mark.parametrize('content, expected', [
+    (b'- import_tasks: other.yml\n', True),
+    (b'- ansible.builtin.import_role:\n    name: other\n', True),
+    (b'- include: other.yml\n', True),
+    (b'- include_tasks: other.yml\n', False),
+    (b'- debug:\n    msg: import_tasks\n', False),
+])
+def test_has_static_imports(content: bytes, expected: bool) -> None:
+    assert has_static_imports(content) == expected
+
+
+def test_static_imports_not_cached(tmp_path: Path) -> None:
+    role_path = tmp_path / 'role'
+    (role_path / 'tasks').mkdir(parents=True)
+    (role_path / 'tasks' / 'main.yml').write_text('- import_tasks: other.yml\n')
+    (role_path / 'tasks' / 'other.yml').write_text('- debug:\n    msg: hi\n')
+    cache = ParsedFileCache(tmp_path / 'cache', 1024 * 1024)
+
+    assert not Role.load_from_ans_obj(role_path, cache).broken_files
+    (role_path / 'tasks' / 'other.yml').unlink()
+    role = Role.load_from_ans_obj(role_path, cache)
+
+    assert [broken.path for broken in role.broken_files] == ['tasks/main.yml']
@@ -0,0 +1,237 @@
+"""Tests for the matching of tasks and blocks in structural diffs."""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import copy
+import random
+
+from operator import itemgetter
+
+import pytest
+
+from models.structural import diff
+from models.structural.role import Task, TaskFile, CONVERTER
+
+ACTIONS = ['debug', 'command', 'copy', 'template', 'service', 'apt']
+WHENS = [None, 'ansible_os_family == "Debian"', 'x is defined']
+
+
+def _random_task(rng: random.Random) -> Dict[str, Any]:
+    task: Dict[str, Any] = {
+            'action': rng.choice(ACTIONS),
+            'args': {'value': rng.randrange(4)}}
+    if rng.random() < .5:
+        task['name'] = f'Task {rng.randrange(6)}'
+    when = rng.choice(WHENS)
+    if when is not None:
+        task['when'] = when
+    if rng.random() < .3:
+        task['tags'] = [rng.choice(['a', 'b'])]
+    if rng.random() < .2:
+        task['become'] = True
+    return task
+
+
+def _random_block(rng: random.Random, depth: int = 0) -> Dict[str, Any]:
+    content: List[Dict[str, Any]] = []
+    for _ in range(rng.randrange(8)):
+        if depth < 2 and rng.random() < .15:
+            content.append(_random_block(rng, depth + 1))
+        else:
+            content.append(_random_task(rng))
+    if content and rng.random() < .5:
+        # Duplicates are common, e.g. repeated handler notifications.
+        content.append(copy.deepcopy(rng.choice(content)))
+    return {'block': content}
+
+
+def _mutate(rng: random.Random, block: Dict[str, Any]) -> None:
+    content = block['block']
+    for _ in range(rng.randrange(4)):
+        choice = rng.random()
+        if choice < .2 and content:
+            del content[rng.randrange(len(content))]
+        elif choice < .4:
+            content.insert(rng.randrange(len(content) + 1), _random_task(rng))
+        elif choice < .6 and content:
+            content.insert(rng.randrange(len(content) + 1), content.pop(rng.randrange(len(content))))
+        elif choice < .8 and content:
+            target = content[rng.randrange(len(content))]
+            if 'block' in target:
+                _mutate(rng, target)
+            else:
+                target['when'] = rng.choice(WHENS)
+        elif content:
+            # Wrap a task in a new block.
+            idx = rng.randrange(len(content))
+            content[idx] = {'block': [content[idx]]}
+
+
+def _task_files(rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+            {'file_name': f'tasks/file{idx}.yml',
+             'content': [_random_block(rng) for _ in range(rng.randrange(1, 3))]}
+            for idx in range(rng.randrange(1, 3))]
+
+
+def _diff(
+        files1: List[Dict[str, Any]], files2: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    structured1 = CONVERTER.structure(files1, List[TaskFile])
+    structured2 = CONVERTER.structure(files2, List[TaskFile])
+    return [d.unstructure() for d in TaskFile.diff_multiple(structured1, structured2)]
+
+
+def _match_pairwise(
+        children1: Sequence[Task], children2: Sequence[Task],
+        descending: bool,
+        is_relocated: Optional[Callable[[Task, Task], bool]] = None
+) -> List[Tuple[int, int]]:
+    # Reference: score all pairs and greedily match them, as the matchers did
+    # before matching identical objects first, and keep the fully similar ones.
+    sims = [
+            (idx1, idx2, c1.similarity_score(c2) * (
+                .75 if is_relocated is not None and is_relocated(c1, c2) else 1))
+            for idx1, c1 in enumerate(children1)
+            for idx2, c2 in enumerate(children2)]
+    if descending:
+        sims = sims[::-1]
+    sims.sort(key=itemgetter(2), reverse=True)
+    matched: List[Tuple[int, int]] = []
+    for idx1, idx2, sim in sims:
+        if sim < 1:
+            break
+        if all(idx1 != m1 and idx2 != m2 for m1, m2 in matched):
+            matched.append((idx1, idx2))
+    return matched
+
+
+@pytest.mark.parametrize('descending', [True, False])
+@pytest.mark.parametrize('seed', range(40))
+def test_match_identical(seed: int, descending: bool) -> None:
+    rng = random.Random(seed)
+    tasks1 = [_random_task(rng) for _ in range(rng.randrange(12))]
+    tasks2 = [copy.deepcopy(rng.choice(tasks1)) if tasks1 and rng.random() < .6
+              else _random_task(rng)
+              for _ in range(rng.randrange(12))]
+    children1 = [Task.structure(task) for task in tasks1]
+    children2 = [Task.structure(task) for task in tasks2]
+    positions = {
+            id(child): idx for children in (children1, children2)
+            for idx, child in enumerate(children)}
+
+    def is_relocated(c1: Task, c2: Task) -> bool:
+        return positions[id(c1)] % 3 != positions[id(c2)] % 3
+
+    assert diff._match_identical(children1, children2, descending) == (
+            _match_pairwise(children1, children2, descending))
+    assert diff._match_identical(
+            children1, children2, descending, is_relocated) == (
+            _match_pairwise(children1, children2, descending, is_relocated))
+
+
+def test_match_identical_diff() -> None:
+    task = {'action': 'debug', 'args': {'msg': 'a'}}
+    other = {'action': 'command', 'args': {'value': 1}}
+    files1 = [{'file_name': 'tasks/main.yml', 'content': [
+            {'block': [task, other, copy.deepcopy(task)]}]}]
+    files2 = [{'file_name': 'tasks/main.yml', 'content': [
+            {'block': [copy.deepcopy(other), copy.deepcopy(task)]}]}]
+
+    diffs = _diff(files1, files2)
+
+    # Diffs of the matchers that scored all pairs: the first duplicate is
+    # matched to the remaining task, the last one is removed.
+    assert [
+            (d['diff_type'], d.get('previous_location'), d.get('new_location'))
+            for d in diffs] == [
+            ('BlockAddition', None, None),
+            ('BlockRemoval', None, None),
+            ('TaskRelocation', 'tasks/main.yml[0].block[1]', 'tasks/main.yml[0].block[0]'),
+            ('TaskRelocation', 'tasks/main.yml[0].block[0]', 'tasks/main.yml[0].block[1]'),
+            ('TaskRemoval', None, None)]
+    assert diffs[-1]['object_id'] == 'tasks/main.yml[0].block[2]'
+
+
+def test_similarity_memo() -> None:
+    rng = random.Random(0)
+    files1 = _task_files(rng)
+    files2 = copy.deepcopy(files1)
+    for task_file in files2:
+        for block in task_file['content']:
+            _mutate(rng, block)
+
+    reference = _diff(files1, files2)
+    with diff.similarity_memo() as memo:
+        memoized = _diff(files1, files2)
+        with diff.similarity_memo() as nested:
+            assert nested is memo
+
+    assert memoized == reference
+    assert memo.misses
+    assert memo.hits
+
+
+def test_similarity_key() -> None:
+    task = {'action': 'debug', 'args': {'msg': ['a', 1]}, 'tags': ['x']}
+    t1 = Task.structure(task)
+    t2 = Task.structure(copy.deepcopy(task))
+    t3 = Task.structure({**task, 'args': {'msg': ('a', 1)}})
+
+    assert t1.similarity_key() == t2.similarity_key()
+    assert t1.similarity_score(t2) == 1
+    assert t1.similarity_key() != t3.similarity_key()
+    assert t1.similarity_score(t3) < 1
+
+
+def test_similarity_key_unfreezable() -> None:
+    task = Task.structure({'action': 'debug', 'args': {'value': float('nan')}})
+
+    with pytest.raises(TypeError):
+        task.similarity_key()
+
+
+def test_fingerprint_prunes_identical_files() -> None:
+    rng = random.Random(1)
+    files = _task_files(rng)
+    structured1 = CONVERTER.structure(files, List[TaskFile])
+    structured2 = CONVERTER.structure(copy.deepcopy(files), List[TaskFile])
+
+    for f1, f2 in zip(structured1, structured2):
+        assert f1.fingerprint is not None
+        assert f1.fingerprint == f2.fingerprint
+        assert f1.diff(f2) == []
+    assert _diff(files, copy.deepcopy(files)) == []
+
+
+def test_fingerprint_changes() -> None:
+    block = {'block': [{'action': 'debug', 'args': {'msg': 'a'}}]}
+    changed = copy.deepcopy(block)
+    changed['block'][0]['when'] = 'x is defined'
+    moved = {'block': [], 'rescue': copy.deepcopy(block['block'])}
+    files = [
+            [{'file_name': 'tasks/main.yml', 'content': [content]}]
+            for content in (block, changed, moved)]
+    fps = [
+            CONVERTER.structure(f, List[TaskFile])[0].fingerprint
+            for f in files]
+
+    assert None not in fps
+    assert len(set(fps)) == 3
+
+
+def test_fingerprint_empty_block() -> None:
+    files = [{'file_name': 'tasks/main.yml', 'content': [{'block': []}]}]
+    task_file = CONVERTER.structure(files, List[TaskFile])[0]
+
+    # Empty blocks aren't matched to each other, so they can't be pruned.
+    assert task_file[0].fingerprint is None
+    assert task_file.fingerprint is None
+    assert _diff(files, copy.deepcopy(files)) == _diff(files, files)
+
+
+def test_fingerprint_unencodable() -> None:
+    task = Task.structure({'action': 'debug', 'args': {'value': float('nan')}})
+
+    assert task.fingerprint is None
+    with pytest.raises(TypeError):
+        diff.encode_value(float('nan'))
@@ -0,0 +1,153 @@
+"""Tests for the generated (un)structure hooks of the structural models."""
+from typing import Any, Dict, List
+
+import copy
+import pickle
+
+import ansible.playbook.task
+import cattr
+import pytest
+
+from models import serialize
+from models.structural import base, hooks, mixins
+from models.structural.role import (
+        CONVERTER, DefaultVarFile, HandlerFile, StructuralRoleModel, Task,
+        TaskFile, register_hooks)
+
+TASK_FILES = [
+    {'file_name': 'tasks/main.yml', 'content': [
+        {'block': [
+            {'action': 'apt', 'args': {'name': 'nginx'}, 'name': 'Install'},
+            {'block': [{'action': 'debug', 'args': {'msg': 'hi'}, 'tags': ['a']}],
+             'rescue': [{'action': 'fail', 'args': {}}],
+             'when': 'x is defined'},
+        ]},
+        {'block': [], 'always': [{'action': 'command', 'args': {'_raw_params': 'ls'}, 'become': True}]},
+        {'block': [{'action': 'service', 'args': {'name': 'nginx'}, 'loop': '{{ items }}',
+                    'loop_control': {'loop_var': 'item'}, 'ignore_errors': None}]},
+    ]},
+    {'file_name': 'tasks/empty.yml', 'content': []},
+]
+
+MODEL = {
+    'role_id': 'me.role',
+    'role_rev': 'v1.0.0',
+    'role_root': {
+        'role_name': 'role',
+        'broken_files': [],
+        'logs': [],
+        'meta_file': {'file_name': 'meta/main.yml', 'metablock': {'galaxy_info': {'author': 'me'}}},
+        'default_var_files': [{'file_name': 'defaults/main.yml', 'content': {'a': 1, 'b': [1, 2]}}],
+        'role_var_files': [{'file_name': 'vars/main.yml', 'content': {}}],
+        'task_files': TASK_FILES,
+        'handler_files': [{'file_name': 'handlers/main.yml', 'content': [
+            {'block': [{'action': 'service', 'args': {'state': 'restarted'}, 'name': 'restart'}]}]}],
+    },
+}
+
+
+@pytest.fixture()
+def reference() -> cattr.GenConverter:
+    converter = cattr.GenConverter()
+    register_hooks(converter, generated=False)
+    return converter
+
+
+def _assert_same(obj1: Any, obj2: Any) -> None:
+    """Assert that two structured objects have the same attributes."""
+    assert type(obj1) is type(obj2)
+    if isinstance(obj1, (list, tuple)):
+        assert len(obj1) == len(obj2)
+        for el1, el2 in zip(obj1, obj2):
+            _assert_same(el1, el2)
+    elif isinstance(obj1, dict):
+        assert obj1.keys() == obj2.keys()
+        for key in obj1:
+            _assert_same(obj1[key], obj2[key])
+    elif isinstance(obj1, (base.BaseObject, base.BaseFile)) or hasattr(obj1, '__dict__'):
+        attrs1, attrs2 = mixins.get_state(obj1), mixins.get_state(obj2)
+        assert attrs1.keys() == attrs2.keys()
+        for name in attrs1:
+            if name == '_parent':
+                if attrs1[name] is not None:
+                    assert type(attrs1[name]()) is type(attrs2[name]())
+                else:
+                    assert attrs2[name] is None
+            else:
+                _assert_same(attrs1[name], attrs2[name])
+    else:
+        assert obj1 == obj2
+
+
+def test_structure_task_files(reference: cattr.GenConverter) -> None:
+    generated = CONVERTER.structure(copy.deepcopy(TASK_FILES), List[TaskFile])
+    expected = reference.structure(copy.deepcopy(TASK_FILES), List[TaskFile])
+
+    _assert_same(generated, expected)
+    block = generated[0][0]
+    assert block.parent is generated[0]
+    assert all(child.parent is block for child in block)
+    assert CONVERTER.unstructure(generated) == TASK_FILES
+
+
+def test_structure_model(reference: cattr.GenConverter) -> None:
+    generated = CONVERTER.structure(MODEL, StructuralRoleModel)
+    expected = reference.structure(MODEL, StructuralRoleModel)
+
+    _assert_same(generated, expected)
+    assert isinstance(generated.role_root.default_var_files[0], DefaultVarFile)
+    assert isinstance(generated.role_root.handler_files[0], HandlerFile)
+    assert CONVERTER.unstructure(generated) == MODEL
+    assert serialize.CONVERTER.unstructure(
+            serialize.CONVERTER.structure(MODEL, StructuralRoleModel)) == MODEL
+
+
+def test_structure_task_defaults() -> None:
+    task: Dict[str, Any] = {'action': 'debug', 'tags': ['a'], 'become': None}
+    generated = CONVERTER.structure(task, Task)
+
+    _assert_same(generated, Task.structure(task))
+    assert generated.misc_keywords == {'tags': ['a']}
+    assert generated.when is None
+
+
+def test_unknown_initializer() -> None:
+    class CustomTask(Task):
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+
+    with pytest.raises(TypeError):
+        hooks.make_task_structure_fn(CustomTask)
+
+
+def test_compact_objects() -> None:
+    task_file = CONVERTER.structure(copy.deepcopy(TASK_FILES), List[TaskFile])[0]
+    block = task_file[0]
+    task = block[0]
+
+    assert not hasattr(block, '__dict__') and not hasattr(task, '__dict__')
+    assert task.misc_keywords is mixins.NO_KEYWORDS
+    assert task.name == 'Install' and task.when is None
+
+    unpickled = pickle.loads(pickle.dumps(task_file))
+    _assert_same(unpickled, task_file)
+    assert unpickled[0][0].misc_keywords is mixins.NO_KEYWORDS
+    assert all(child.parent is unpickled[0] for child in unpickled[0])
+    assert unpickled.fingerprint == task_file.fingerprint
+
+
+def test_keyword_defaults() -> None:
+    model = CONVERTER.structure(copy.deepcopy(MODEL), StructuralRoleModel)
+    metablock = model.role_root.meta_file.metablock
+    block = model.role_root.task_files[0][0]
+
+    assert metablock.dependencies == () and metablock.dependencies is metablock.dependencies
+    assert block.rescue == () and block.always == ()
+    # Reading the defaults doesn't change what's stored.
+    assert CONVERTER.unstructure(model) == MODEL
+
+
+def test_mutable_keyword_default() -> None:
+    with pytest.raises(AssertionError):
+        class CustomTask(Task, ans_type=ansible.playbook.task.Task, extra_kws={'tags'}):
+            _tags_default = list
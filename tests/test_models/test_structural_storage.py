@@ -0,0 +1,70 @@
+"""Tests for models.structural.storage."""
+from typing import Any
+
+import datetime
+from pathlib import Path
+
+import pytest
+import yaml
+
+from models.structural.storage import STORAGE_FORMATS, check_serializable, format_for_path
+
+DATA = [
+    {'role_id': 'me.role', 'role_rev': 'v1.0.0', 'role_root': {
+        'task_files': [{'file_name': 'tasks/main.yml', 'content': [
+            {'block': [{'action': 'debug', 'args': {'msg': 'hi'}}]}]}],
+        'logs': [],
+    }},
+    {1: 'int key', None: True, 'float': 1.5, 'bytes': b'\x00\x01'},
+    {'set': {1, 2}, 'date': datetime.date(2021, 1, 2),
+     'datetime': datetime.datetime(2021, 1, 2, 3, 4, 5),
+     'big': 2 ** 70},
+]
+
+
+@pytest.mark.parametrize('fmt_name', list(STORAGE_FORMATS))
+@pytest.mark.parametrize('data', DATA)
+def test_roundtrip(fmt_name: str, data: Any, tmp_path: Path) -> None:
+    fmt = STORAGE_FORMATS[fmt_name]
+    if fmt_name == 'msgpack':
+        pytest.importorskip('msgpack')
+    file_path = tmp_path / ('data' + fmt.suffix)
+
+    fmt.dump(data, file_path)
+
+    assert fmt.load(file_path) == data
+
+
+@pytest.mark.parametrize('fmt_name', list(STORAGE_FORMATS))
+def test_format_for_path(fmt_name: str) -> None:
+    fmt = STORAGE_FORMATS[fmt_name]
+
+    assert format_for_path(Path('me.role' + fmt.suffix)) is fmt
+
+
+def test_format_for_path_unknown() -> None:
+    with pytest.raises(ValueError):
+        format_for_path(Path('me.role.txt'))
+
+
+class TaggedStr(str):
+    pass
+
+
+@pytest.mark.parametrize('data', DATA)
+def test_check_serializable(data: Any) -> None:
+    check_serializable(data)
+    assert yaml.safe_dump(data)
+
+
+@pytest.mark.parametrize('data', [
+    [TaggedStr('x')],
+    {'nested': {TaggedStr('key'): 1}},
+    {'path': Path('/')},
+    ({1}, [object()]),
+])
+def test_check_serializable_rejects(data: Any) -> None:
+    with pytest.raises(TypeError):
+        check_serializable(data)
+    with pytest.raises(yaml.representer.RepresenterError):
+        yaml.safe_dump(data)
@@ -0,0 +1,165 @@
+"""Tests for concurrent cloning in pipeline.collect.clone."""
+from typing import List
+
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+
+import git
+import pytest
+import _pytest
+
+from config import CloneConfig, MainConfig
+from pipeline.base import ResultMap
+from pipeline.collect.clone import Clone, CloneException
+
+REPO_NAMES = ['role-a', 'role-b', 'role-c']
+
+
+def _run_git(cwd: Path, *args: str) -> None:
+    subprocess.run(
+            ['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com',
+             *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture()
+def remote(
+        tmp_path: Path, monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> Path:
+    """Create local bare repositories that stand in for GitHub."""
+    remote_dir = tmp_path / 'remote'
+    for name in REPO_NAMES:
+        work = tmp_path / 'work' / name
+        work.mkdir(parents=True)
+        _run_git(work, 'init', '-q')
+        for idx in range(3):
+            (work / 'README').write_text(f'{name} {idx}\n')
+            _run_git(work, 'add', 'README')
+            _run_git(work, 'commit', '-q', '-m', f'Commit {idx}')
+        _run_git(tmp_path, 'clone', '-q', '--bare', str(work), str(remote_dir / 'owner' / f'{name}.git'))
+        _run_git(remote_dir / 'owner' / f'{name}.git', 'config', 'uploadpack.allowFilter', 'true')
+
+    # Redirect GitHub URLs to the local repositories.
+    monkeypatch.setenv('GIT_CONFIG_COUNT', '1')
+    monkeypatch.setenv('GIT_CONFIG_KEY_0', f'url.file://{remote_dir}/.insteadOf')
+    monkeypatch.setenv('GIT_CONFIG_VALUE_0', 'https://github.com/')
+    return remote_dir
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> CloneConfig:
+    mc = MainConfig()
+    mc.output = tmp_path / 'output'
+    mc.dataset = 'test'
+    return CloneConfig(mc)
+
+
+def _role_metadata(names: List[str]) -> ResultMap:  # type: ignore[type-arg]
+    repos = {
+        idx: SimpleNamespace(
+            entity_id=idx, github_url=f'https://github.com/owner/{name}')
+        for idx, name in enumerate(names)}
+    return ResultMap({'dummy': SimpleNamespace(repositories=repos)})
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_clone_concurrent(
+        config: CloneConfig, remote: Path, workers: int
+) -> None:
+    config.workers = workers
+    config.progress = True
+    stage = Clone(config)
+
+    results = stage.run(_role_metadata(REPO_NAMES + ['missing']))
+
+    assert {repo.name for repo in results.values()} == set(REPO_NAMES)
+    for repo in results.values():
+        repo_path = stage.repo_path / repo.path
+        assert (repo_path / 'README').read_text() == f'{repo.name} 2\n'
+    assert not (stage.repo_path / 'owner' / 'missing').exists()
+
+
+@pytest.mark.parametrize('resume', [True, False])
+def test_clone_concurrent_duplicates(
+        config: CloneConfig, remote: Path, resume: bool
+) -> None:
+    config.workers = 3
+    config.resume = resume
+    stage = Clone(config)
+
+    results = stage.run(_role_metadata(['role-a'] * 3))
+
+    # The duplicates don't fail the clone or remove it.
+    assert {repo.path for repo in results.values()} == {Path('owner/role-a')}
+    assert (stage.repo_path / 'owner' / 'role-a' / 'README').read_text() == 'role-a 2\n'
+
+
+def test_clone_shallow_partial(config: CloneConfig, remote: Path) -> None:
+    config.workers = 2
+    config.depth = 1
+    config.filter = 'blob:none'
+    config.timeout = 60
+    stage = Clone(config)
+
+    results = stage.run(_role_metadata(REPO_NAMES))
+
+    assert len(results) == len(REPO_NAMES)
+    for repo in results.values():
+        clone = git.Repo(stage.repo_path / repo.path)
+        assert len(list(clone.iter_commits())) == 1
+        assert clone.git.config('remote.origin.partialclonefilter') == 'blob:none'
+
+
+def test_clone_resume(config: CloneConfig, remote: Path) -> None:
+    config.workers = 2
+    stage = Clone(config)
+    existing = stage.repo_path / 'owner' / 'role-a'
+    existing.mkdir(parents=True)
+    (existing / 'marker').write_text('already cloned')
+
+    results = stage.run(_role_metadata(REPO_NAMES))
+
+    assert len(results) == len(REPO_NAMES)
+    assert not (existing / 'README').exists()
+
+    config.resume = False
+    with pytest.raises(CloneException):
+        stage.clone('owner', 'role-a', SimpleNamespace(github_url='https://github.com/owner/role-a'))
+
+
+def test_clone_path_traversal(config: CloneConfig, remote: Path) -> None:
+    stage = Clone(config)
+
+    with pytest.raises(CloneException):
+        stage.clone('..', 'role-a', SimpleNamespace(github_url='https://github.com/owner/role-a'))
+
+
+def test_clone_timeout_cleans_up(config: CloneConfig, remote: Path) -> None:
+    config.timeout = 10
+    stage = Clone(config)
+
+    with pytest.raises(CloneException):
+        stage.clone('owner', 'missing', SimpleNamespace(github_url='https://github.com/owner/missing'))
+
+    assert not (stage.repo_path / 'owner' / 'missing').exists()
+
+
+def test_clone_failure_empties_existing_directory(
+        config: CloneConfig, monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    def clone_into(self: Clone, url: str, repo_path: Path, progress: bool) -> None:
+        # Like a git process that's killed halfway.
+        (repo_path / '.git').mkdir()
+        (repo_path / 'README').write_text('partial')
+        raise git.exc.GitCommandError('clone', -9)
+
+    monkeypatch.setattr(Clone, '_clone_into', clone_into)
+    stage = Clone(config)
+    repo_path = stage.repo_path / 'owner' / 'role-a'
+    repo_path.mkdir(parents=True)
+
+    with pytest.raises(CloneException):
+        stage.clone('owner', 'role-a', SimpleNamespace(github_url='https://github.com/owner/role-a'))
+
+    assert repo_path.is_dir()
+    assert not any(repo_path.iterdir())
@@ -0,0 +1,65 @@
+"""Tests for the sparse correlations of the datamine scripts."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline.datamine import correlations
+
+ROWS = [
+    ['apt', 'apt', 'file', 'debug'],
+    ['apt', 'file'],
+    ['debug', 'service'],
+    ['file', 'service', 'unknown'],
+    [],
+    ['apt', 'debug', 'file', 'service'],
+]
+COLUMNS = ['apt', 'debug', 'file', 'service', 'yum']
+
+
+def _dense(binary: bool = False) -> pd.DataFrame:
+    frame = pd.DataFrame(0, index=range(len(ROWS)), columns=COLUMNS)
+    for row_idx, labels in enumerate(ROWS):
+        for label in labels:
+            if label in COLUMNS:
+                frame.loc[row_idx, label] = 1 if binary else frame.loc[row_idx, label] + 1
+    return frame
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_incidence_matrix(binary: bool) -> None:
+    matrix = correlations.incidence_matrix(ROWS, COLUMNS, binary=binary)
+
+    assert matrix.shape == (len(ROWS), len(COLUMNS))
+    assert (matrix.toarray() == _dense(binary).to_numpy()).all()
+
+
+def test_correlation_matrix_matches_pandas() -> None:
+    matrix = correlations.incidence_matrix(ROWS, COLUMNS)
+
+    result = correlations.correlation_matrix(matrix)
+
+    np.testing.assert_allclose(result, _dense().corr().to_numpy(), atol=1e-12)
+    assert np.isnan(result[:, -1]).all()
+
+
+@pytest.mark.parametrize('block_elements', [1, 1 << 22])
+def test_strong_correlations(block_elements: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(correlations, '_BLOCK_ELEMENTS', block_elements)
+    expected = _dense().corr().to_numpy()
+    matrix = correlations.incidence_matrix(ROWS, COLUMNS)
+
+    firsts, seconds, values = correlations.strong_correlations(matrix, 0.3)
+
+    assert [(first, second) for first, second in zip(firsts, seconds)] == [
+            (first, second)
+            for first in range(len(COLUMNS)) for second in range(len(COLUMNS))
+            if first != second and abs(expected[first, second]) >= 0.3]
+    np.testing.assert_allclose(values, expected[firsts, seconds], atol=1e-12)
+
+
+def test_strong_correlations_empty() -> None:
+    matrix = correlations.incidence_matrix([], [])
+
+    firsts, seconds, values = correlations.strong_correlations(matrix, 0.6)
+
+    assert len(firsts) == len(seconds) == len(values) == 0
@@ -0,0 +1,237 @@
+"""Tests for the shared scan engine of the datamine scripts."""
+from typing import Any, Dict, List
+
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+
+from config import DatamineConfig, MainConfig
+from pipeline.base import write_index
+from pipeline.datamine import engine
+from pipeline.datamine.cache import PartialResultCache
+from pipeline.datamine.datamine_roles import DatamineStage, load_script, load_scripts
+
+DATAMINE_DIR = Path(__file__).parents[2] / 'datamine'
+
+
+def _model(role_id: str, rev: str, tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'role_id': role_id,
+        'role_rev': rev,
+        'role_root': {
+            'role_name': role_id,
+            'task_files': [{
+                'file_name': 'tasks/main.yml',
+                'content': [{'block': tasks}]}],
+            'handler_files': []}}
+
+
+@pytest.fixture()
+def output_dir(tmp_path: Path) -> Path:
+    models_dir = tmp_path / 'StructuralModels'
+    models_dir.mkdir()
+    apt = {'action': 'apt', 'args': {'name': 'nginx', 'state': 'present'}}
+    looped = {'action': 'apt', 'args': {'name': '{{ item }}'}, 'loop': '{{ items }}'}
+    debug = {'action': 'debug', 'args': {'msg': 'hi'}, 'when': 'x is defined'}
+    models = {
+        'me.first': [
+            _model('me.first', 'v1.0', [apt]),
+            _model('me.first', 'HEAD', [apt, looped, debug])],
+        'me.second': [_model('me.second', 'HEAD', [debug, debug])]}
+    for role_id, role_models in models.items():
+        (models_dir / f'{role_id}.yaml').write_text(yaml.safe_dump(role_models))
+    write_index(models_dir, {role_id: f'{role_id}.yaml' for role_id in models})
+    return tmp_path
+
+
+def _config(output_dir: Path, *paths: Path, workers: int = 1) -> DatamineConfig:
+    mc = MainConfig()
+    mc.output = output_dir.parent
+    mc.dataset = output_dir.name
+    config = DatamineConfig(mc)
+    config.path = list(paths)
+    config.options = {}
+    config.workers = workers
+    config.scan_cache = False
+    return config
+
+
+def test_iter_models(output_dir: Path) -> None:
+    models = list(engine.iter_models(output_dir / 'StructuralModels' / 'me.first.yaml'))
+
+    assert [(m.role_rev, m.position, m.num_revisions) for m in models] == [
+            ('v1.0', 0, 2), ('HEAD', 1, 2)]
+    assert models[1].is_head and not models[0].is_head
+    assert [task['action'] for task in models[1].tasks] == ['apt', 'apt', 'debug']
+
+
+def test_scan_plugins(output_dir: Path) -> None:
+    module_usage = load_script(DATAMINE_DIR / 'module_usage_analysis.py')
+    loop_usage = load_script(DATAMINE_DIR / 'loop_usage_analysis.py')
+    plugins = [module_usage.PLUGIN({}), loop_usage.PLUGIN({})]
+
+    roles, loops = engine.scan(output_dir / 'StructuralModels', plugins)
+
+    assert {role.name: {m.name: m.uses for m in role.modules} for role in roles} == {
+            'me.first': {'apt': 3, 'debug': 1}, 'me.second': {'debug': 2}}
+    assert {loop.module: loop.loop_percentage for loop in loops} == {
+            'apt': 50, 'debug': 0}
+
+
+def test_parallel_scan(output_dir: Path) -> None:
+    paths = [DATAMINE_DIR / script_name for script_name in (
+            'module_usage_analysis.py', 'loop_usage_analysis.py',
+            'when_usage_analysis.py', 'module_transition_analysis.py',
+            'argument_usage_analysis.py')]
+    plugins = [load_script(path).PLUGIN({}) for path in paths]
+    models_dir = output_dir / 'StructuralModels'
+
+    *serial, serial_args = engine.scan(models_dir, plugins)
+    *parallel, parallel_args = engine.scan(
+            models_dir, plugins, workers=2, initializer=load_scripts,
+            initargs=(paths,))
+
+    assert repr(parallel) == repr(serial)
+    assert {args.module: set(args.common_args) for args in parallel_args} == {
+            args.module: set(args.common_args) for args in serial_args}
+
+
+def test_cached_scan(output_dir: Path, tmp_path: Path) -> None:
+    paths = [DATAMINE_DIR / script_name for script_name in (
+            'module_usage_analysis.py', 'loop_usage_analysis.py')]
+    plugins = [load_script(path).PLUGIN({}) for path in paths]
+    models_dir = output_dir / 'StructuralModels'
+    cache = PartialResultCache(tmp_path / 'cache')
+
+    first = engine.scan(models_dir, plugins, cache=cache)
+    second = engine.scan(models_dir, plugins, cache=cache)
+
+    assert repr(second) == repr(first) == repr(engine.scan(models_dir, plugins))
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    second_path = models_dir / 'me.second.yaml'
+    second_path.write_text(yaml.safe_dump([_model('me.second', 'HEAD', [])]))
+    changed = engine.scan(
+            models_dir, plugins, workers=2, initializer=load_scripts,
+            initargs=(paths,), cache=cache)
+
+    assert repr(changed) == repr(engine.scan(models_dir, plugins))
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_cache_keys(output_dir: Path, tmp_path: Path) -> None:
+    module_usage = load_script(DATAMINE_DIR / 'module_usage_analysis.py')
+    cache = PartialResultCache(tmp_path / 'cache')
+
+    assert cache.plugin_key(module_usage.PLUGIN({})) == cache.plugin_key(
+            module_usage.PLUGIN({}))
+    # The accumulators of the plugin don't depend on the options.
+    assert cache.plugin_key(module_usage.PLUGIN({})) == cache.plugin_key(
+            module_usage.PLUGIN({'num_modules': 5}))
+
+    models_path = output_dir / 'StructuralModels' / 'me.first.yaml'
+    key = cache.file_key(models_path)
+    models_path.write_text(models_path.read_text())
+
+    assert cache.file_key(models_path) == key
+    assert PartialResultCache(tmp_path / 'cache', read=False).load(key) == {}
+
+
+def test_cache_key_sources(tmp_path: Path) -> None:
+    script_path = tmp_path / 'keyed_script.py'
+    script_lines = [
+        'from pipeline.datamine import engine',
+        'def role(model): return model.role_id',
+        'class Roles(engine.ScanPlugin):',
+        '    def new_accumulator(self): return []',
+        '    def visit(self, acc, model): acc.append(role(model))',
+        '    def merge(self, acc, other): return acc + other',
+        '    def finish(self, acc): return acc',
+        'PLUGIN = Roles',
+        'def store_results(result, config, filename):',
+        '    pass']
+    cache = PartialResultCache(tmp_path / 'cache')
+
+    def key(*lines: str) -> str:
+        script_path.write_text('\n'.join(lines))
+        return cache.plugin_key(load_script(script_path).PLUGIN({}))
+
+    original = key(*script_lines)
+
+    assert key(*script_lines[:-1], '    print(result)') == original
+    assert key(script_lines[0], 'def role(model): return model.role_rev',
+               *script_lines[2:]) != original
+
+    # Without declared options, the accumulators depend on all of them.
+    script_path.write_text('\n'.join(script_lines))
+    plugin_cls = load_script(script_path).PLUGIN
+    assert cache.plugin_key(plugin_cls({'a': 1})) != cache.plugin_key(plugin_cls({'a': 2}))
+    plugin_cls.accumulator_options = ('a',)
+    assert cache.plugin_key(plugin_cls({'a': 1})) != cache.plugin_key(plugin_cls({'a': 2}))
+    assert cache.plugin_key(plugin_cls({'a': 1})) == cache.plugin_key(plugin_cls({'a': 1, 'b': 2}))
+
+
+def test_cache_evict(output_dir: Path, tmp_path: Path) -> None:
+    plugins = [load_script(DATAMINE_DIR / 'module_usage_analysis.py').PLUGIN({})]
+    models_dir = output_dir / 'StructuralModels'
+    cache = PartialResultCache(tmp_path / 'cache')
+    engine.scan(models_dir, plugins, cache=cache)
+    old_files = sorted((tmp_path / 'cache').glob('*/*/*'))
+    for old_file in old_files:
+        os.utime(old_file, (0, 0))
+
+    # Both files are extracted again, leaving the old entries unused.
+    for models_path in models_dir.glob('*.yaml'):
+        models_path.write_text(models_path.read_text() + '\n')
+    engine.scan(models_dir, plugins, cache=cache)
+    cache.max_size = sum(path.stat().st_size for path in old_files)
+    assert cache.evict() == len(old_files)
+
+    assert not any(path.exists() for path in old_files)
+    assert engine.scan(models_dir, plugins, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_scan_missing_models(tmp_path: Path) -> None:
+    with pytest.raises(FileNotFoundError):
+        engine.scan(tmp_path / 'StructuralModels', [])
+
+
+def test_stage_runs_all_scripts(output_dir: Path, tmp_path: Path) -> None:
+    plugin_script = tmp_path / 'plugin_script.py'
+    plugin_script.write_text('\n'.join([
+        'from pipeline.datamine import engine',
+        'class Counter(engine.ScanPlugin):',
+        '    def new_accumulator(self): return []',
+        '    def visit(self, acc, model): acc.append(model.role_rev)',
+        '    def merge(self, acc, other): return acc + other',
+        '    def finish(self, acc): return sorted(acc)',
+        'PLUGIN = Counter',
+        'def store_results(result, config, filename):',
+        '    (config.output_directory / "plugin.txt").write_text(repr(result))']))
+    algo_script = tmp_path / 'algo_script.py'
+    algo_script.write_text('\n'.join([
+        'def algo(config, roles_dir_name):',
+        '    return roles_dir_name',
+        'def store_results(result, config, filename):',
+        '    (config.output_directory / "algo.txt").write_text(filename + result)']))
+
+    DatamineStage(_config(output_dir, plugin_script, algo_script)).run()
+
+    assert (output_dir / 'plugin.txt').read_text() == "['HEAD', 'HEAD', 'v1.0']"
+    assert (output_dir / 'algo.txt').read_text() == 'Datamine/algo_script.pyStructuralModels'
+
+    (output_dir / 'plugin.txt').unlink()
+    DatamineStage(_config(output_dir, plugin_script, workers=2)).run()
+
+    assert (output_dir / 'plugin.txt').read_text() == "['HEAD', 'HEAD', 'v1.0']"
+
+    config = _config(output_dir, plugin_script)
+    config.scan_cache = True
+    DatamineStage(config).run()
+    DatamineStage(config).run()
+
+    assert (output_dir / 'plugin.txt').read_text() == "['HEAD', 'HEAD', 'v1.0']"
+    assert len(list((output_dir / 'DatamineCache' / 'entries').rglob('*'))) > 0
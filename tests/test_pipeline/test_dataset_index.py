@@ -0,0 +1,127 @@
+"""Tests for the dataset index and lazily loaded stage results."""
+from typing import ClassVar, Iterator, List
+
+from pathlib import Path
+
+import attr
+import pytest
+import yaml
+
+from config import MainConfig
+import pipeline.base as base
+from pipeline.base import (
+        CacheMiss, LazyResultMap, ResultLoadError, ResultMap, Stage,
+        read_index, write_index)
+
+INDEX = {'b': 'b.txt', 'a': 'a.txt', 'c': 'sub/c.txt'}
+
+
+@attr.s(auto_attribs=True)
+class Entry:
+    name: str
+    content: str
+
+    loaded: ClassVar[List[str]] = []
+
+    @property
+    def id(self) -> str:
+        return self.name
+
+    def dump(self, dirpath: Path) -> Path:
+        file_path = dirpath / f'{self.name}.txt'
+        file_path.write_text(self.content)
+        return file_path
+
+    @classmethod
+    def load(cls, id: str, file_path: Path) -> 'Entry':
+        cls.loaded.append(id)
+        return cls(id, file_path.read_text())
+
+
+class IndexedStage(Stage[Entry, MainConfig]):
+    dataset_dir_name = 'Indexed'
+
+    def run(self) -> ResultMap[Entry]:
+        return ResultMap([Entry(name, name * 2) for name in 'abc'])
+
+    def report_results(self, results: ResultMap[Entry]) -> None:
+        ...
+
+
+@pytest.fixture(autouse=True)
+def clean_stages() -> Iterator[None]:
+    stages = dict(base.STAGES)
+    yield
+    base.STAGES = stages
+
+
+@pytest.fixture()
+def stage(tmp_path: Path) -> IndexedStage:
+    mc = MainConfig()
+    mc.output = tmp_path / 'output'
+    mc.dataset = 'test'
+    return IndexedStage(mc)
+
+
+def test_index_roundtrip(tmp_path: Path) -> None:
+    write_index(tmp_path, INDEX)
+
+    assert read_index(tmp_path) == INDEX
+    assert list(read_index(tmp_path)) == ['a', 'b', 'c']
+    assert yaml.safe_load((tmp_path / 'index.yaml').read_text()) == INDEX
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_index_yaml_fallback(tmp_path: Path) -> None:
+    (tmp_path / 'index.yaml').write_text(yaml.dump(INDEX))
+
+    assert read_index(tmp_path) == INDEX
+
+
+def test_load_from_dataset_lazily(stage: IndexedStage) -> None:
+    stage.store_in_dataset(stage.run())
+    Entry.loaded = []
+
+    results = stage.load_from_dataset()
+
+    assert isinstance(results, LazyResultMap)
+    assert len(results) == 3
+    assert 'b' in results
+    assert Entry.loaded == []
+    assert results['b'] == Entry('b', 'bb')
+    assert results['b'] == Entry('b', 'bb')
+    # Loaded once, and only the accessed entry.
+    assert Entry.loaded == ['b']
+
+
+def test_load_from_dataset_corrupt_index(stage: IndexedStage) -> None:
+    stage.store_in_dataset(stage.run())
+    dataset_dir = stage.config.output_directory / stage.dataset_dir_name
+    (dataset_dir / 'index.jsonl').write_text('["a", "a.tx')
+
+    with pytest.raises(CacheMiss):
+        stage.load_from_dataset()
+
+
+def test_load_from_dataset_missing(stage: IndexedStage) -> None:
+    with pytest.raises(CacheMiss):
+        stage.load_from_dataset()
+
+
+def test_load_from_dataset_missing_result(stage: IndexedStage) -> None:
+    stage.store_in_dataset(stage.run())
+    (stage.config.output_directory / stage.dataset_dir_name / 'b.txt').unlink()
+
+    with pytest.raises(CacheMiss):
+        stage.load_from_dataset()
+
+
+def test_load_corrupt_result(stage: IndexedStage) -> None:
+    stage.store_in_dataset(stage.run())
+    result_path = stage.config.output_directory / stage.dataset_dir_name / 'b.txt'
+    result_path.write_bytes(b'\xff')
+
+    results = stage.load_from_dataset()
+
+    with pytest.raises(ResultLoadError, match='b.txt'):
+        results['b']
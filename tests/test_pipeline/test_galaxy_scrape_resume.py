@@ -0,0 +1,224 @@
+"""Tests for resuming interrupted scrapes in pipeline.collect.galaxy_scrape."""
+from typing import Any, Iterator, List
+
+import json
+from pathlib import Path
+
+import pytest
+import _pytest
+
+from config import GalaxyScrapeConfig, MainConfig
+from models.galaxy import GalaxyAPIPage
+from pipeline.collect import galaxy_scrape
+from pipeline.collect.galaxy_scrape import GalaxyScrape
+from services.galaxy import GalaxyAPI, RateLimiter
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture()
+def stage(
+        tmp_path: Path, galaxy_stub: Any,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> GalaxyScrape:
+    monkeypatch.setattr(galaxy_scrape, 'API_URLS', {'roles': galaxy_stub.url})
+    monkeypatch.setattr(galaxy_scrape, 'PAGE_SIZES', {'roles': 5})
+    mc = MainConfig()
+    mc.output = tmp_path / 'output'
+    mc.dataset = 'test'
+    stage = GalaxyScrape(GalaxyScrapeConfig(mc))
+    stage._api = GalaxyAPI(rate_limiter=RateLimiter(base_delay=0.01))
+    return stage
+
+
+def _crash_after(
+        stage: GalaxyScrape, num_pages: int,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    load_pages = stage.api.load_pages
+
+    def crashing_load_pages(*args: Any, **kwargs: Any) -> Iterator[GalaxyAPIPage]:
+        for idx, page in enumerate(load_pages(*args, **kwargs)):
+            if idx == num_pages:
+                raise Crash()
+            yield page
+
+    monkeypatch.setattr(stage.api, 'load_pages', crashing_load_pages)
+
+
+def _page_nums(pages: List[GalaxyAPIPage]) -> List[int]:
+    return [page.page_num for page in pages]
+
+
+def _manifest(stage: GalaxyScrape) -> Any:
+    return json.loads(stage._manifest_path('roles').read_text())
+
+
+def test_resume_interrupted_scrape(
+        stage: GalaxyScrape, galaxy_stub: Any,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    with monkeypatch.context() as m:
+        _crash_after(stage, 3, m)
+        with pytest.raises(Crash):
+            stage.load_pages('roles', galaxy_stub.url)
+
+    manifest = _manifest(stage)
+    assert manifest['last_page'] == 3
+    assert manifest['count'] == 23
+    assert not manifest['complete']
+    assert stage.try_load_pages('roles') is None
+
+    galaxy_stub.requests.clear()
+    pages = stage.load_pages('roles', galaxy_stub.url)
+
+    assert _page_nums(pages) == [1, 2, 3, 4, 5]
+    assert sorted(galaxy_stub.requests) == [4, 5]
+    assert _manifest(stage)['complete']
+    cached = stage.try_load_pages('roles')
+    assert cached is not None
+    assert _page_nums(cached) == [1, 2, 3, 4, 5]
+
+
+def test_discard_pages_of_other_page_size(
+        stage: GalaxyScrape, galaxy_stub: Any,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    with monkeypatch.context() as m:
+        _crash_after(stage, 3, m)
+        with pytest.raises(Crash):
+            stage.load_pages('roles', galaxy_stub.url)
+
+    monkeypatch.setattr(galaxy_scrape, 'PAGE_SIZES', {'roles': 10})
+    galaxy_stub.requests.clear()
+    pages = stage.load_pages('roles', galaxy_stub.url)
+
+    assert _page_nums(pages) == [1, 2, 3]
+    assert sorted(galaxy_stub.requests) == [1, 2, 3]
+
+
+def test_discard_pages_past_last_page_of_other_page_size(
+        stage: GalaxyScrape, galaxy_stub: Any,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    with monkeypatch.context() as m:
+        _crash_after(stage, 4, m)
+        with pytest.raises(Crash):
+            stage.load_pages('roles', galaxy_stub.url)
+
+    monkeypatch.setattr(galaxy_scrape, 'PAGE_SIZES', {'roles': 10})
+    stage.load_pages('roles', galaxy_stub.url)
+
+    dataset_dir = stage.config.output_directory / stage.dataset_dir_name
+    assert sorted(path.name for path in dataset_dir.glob('roles_*.json')) == [
+            'roles_1.json', 'roles_2.json', 'roles_3.json']
+    cached = stage.try_load_pages('roles')
+    assert cached is not None
+    assert _page_nums(cached) == [1, 2, 3]
+
+
+def test_detect_lost_page(stage: GalaxyScrape, galaxy_stub: Any) -> None:
+    stage.load_pages('roles', galaxy_stub.url)
+    dataset_dir = stage.config.output_directory / stage.dataset_dir_name
+
+    (dataset_dir / 'roles_3.json').unlink()
+
+    assert _manifest(stage)['complete']
+    assert stage.try_load_pages('roles') is None
+
+
+def test_detect_incomplete_legacy_cache(
+        stage: GalaxyScrape, galaxy_stub: Any
+) -> None:
+    stage.load_pages('roles', galaxy_stub.url)
+    # Scrapes from before checkpointing have no manifest.
+    stage._manifest_path('roles').unlink()
+    assert stage.try_load_pages('roles') is not None
+
+    dataset_dir = stage.config.output_directory / stage.dataset_dir_name
+    (dataset_dir / 'roles_3.json').unlink()
+    assert stage.try_load_pages('roles') is None
+
+    galaxy_stub.requests.clear()
+    pages = stage.load_pages('roles', galaxy_stub.url)
+
+    assert _page_nums(pages) == [1, 2, 3, 4, 5]
+    assert sorted(galaxy_stub.requests) == [3, 4, 5]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_accept_skipped_pages(
+        stage: GalaxyScrape, galaxy_stub: Any,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch, workers: int
+) -> None:
+    stage.config.workers = workers
+    galaxy_stub.server_errors = {3}
+    pages = stage.load_pages('roles', galaxy_stub.url)
+
+    assert _page_nums(pages) == [1, 2, 4, 5]
+    assert _manifest(stage)['skipped'] == [3]
+    cached = stage.try_load_pages('roles')
+    assert cached is not None
+    assert _page_nums(cached) == [1, 2, 4, 5]
+
+
+def test_resume_past_skipped_page(
+        stage: GalaxyScrape, galaxy_stub: Any,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    galaxy_stub.server_errors = {2}
+    with monkeypatch.context() as m:
+        _crash_after(stage, 3, m)
+        with pytest.raises(Crash):
+            stage.load_pages('roles', galaxy_stub.url)
+
+    galaxy_stub.requests.clear()
+    pages = stage.load_pages('roles', galaxy_stub.url)
+
+    assert _page_nums(pages) == [1, 3, 4, 5]
+    assert sorted(galaxy_stub.requests) == [5]
+    assert stage.try_load_pages('roles') is not None
+
+
+def test_accept_skipped_last_page(
+        stage: GalaxyScrape, galaxy_stub: Any
+) -> None:
+    stage.config.workers = 2
+    galaxy_stub.server_errors = {5}
+    pages = stage.load_pages('roles', galaxy_stub.url)
+
+    assert _page_nums(pages) == [1, 2, 3, 4]
+    assert _manifest(stage)['skipped'] == [5]
+    assert stage.try_load_pages('roles') is not None
+
+
+def test_rerun_replaces_missing_roles_page(
+        stage: GalaxyScrape, galaxy_stub: Any
+) -> None:
+    stage.config.force = True
+    for _ in range(2):
+        results = GalaxyScrape.process(stage.config)
+
+        assert sorted(page.page_num for page in results.values()) == [1, 2, 3, 4, 5, 6]
+        assert _manifest(stage)['last_page'] == 5
+        cached = stage.try_load_pages('roles')
+        assert cached is not None
+        assert _page_nums(cached) == [1, 2, 3, 4, 5, 6]
+
+
+def test_resume_after_missing_roles_page(
+        stage: GalaxyScrape, galaxy_stub: Any
+) -> None:
+    stage.config.max_roles = 10
+    GalaxyScrape.process(stage.config)
+    assert _manifest(stage)['last_page'] == 2
+
+    stage.config.max_roles = None
+    galaxy_stub.requests.clear()
+    pages = stage.load_pages('roles', galaxy_stub.url)
+
+    # The page of missing roles isn't taken for a listing page.
+    assert _page_nums(pages) == [1, 2, 3, 4, 5]
+    assert sorted(galaxy_stub.requests) == [3, 4, 5]
@@ -0,0 +1,138 @@
+"""Tests for the git metadata extraction."""
+from typing import Any, Dict, List
+
+import subprocess
+from pathlib import Path
+
+import pytest
+import _pytest
+
+from config import ExtractGitMetadataConfig, ExtractStructuralModelsConfig, MainConfig
+from models.git import GitRepo, GitRepoMetadata
+from models.role_metadata import Repository, XrefID
+from pipeline.base import ResultMap
+from pipeline.collect.clone import Clone
+from pipeline.extract.extract_git_metadata import ExtractGitMetadata
+from pipeline.extract.extract_role_metadata import ExtractRoleMetadata
+from pipeline.extract.extract_structural_models import ExtractStructuralModels
+
+_ENV = {
+    'GIT_AUTHOR_NAME': 'Jöhn Dœ', 'GIT_AUTHOR_EMAIL': 'john@example.com',
+    'GIT_COMMITTER_NAME': 'Committer', 'GIT_COMMITTER_EMAIL': 'c@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1', 'HOME': '/nonexistent'}
+
+
+def _git(repo: Path, *args: str, stdin: bytes = b'') -> None:
+    subprocess.run(
+            ['git', '-c', 'init.defaultBranch=main', *args], cwd=repo,
+            env=_ENV, input=stdin, check=True, capture_output=True)
+
+
+@pytest.fixture()
+def repo(tmp_path: Path) -> Path:
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    _git(repo, 'init')
+    (repo / 'a').write_text('a')
+    _git(repo, 'add', 'a')
+    _git(repo, 'commit', '-m', 'First')
+    _git(repo, 'commit', '--allow-empty', '--cleanup=verbatim', '-F', '-',
+         stdin=b'No final newline\r\n\n\n  indented')
+    _git(repo, 'tag', 'v1.0')
+    _git(repo, 'checkout', '-b', 'side')
+    _git(repo, 'commit', '--allow-empty', '-m', 'Side')
+    _git(repo, 'checkout', 'main')
+    _git(repo, 'commit', '--allow-empty', '--allow-empty-message', '-m', '')
+    _git(repo, 'merge', '--no-edit', 'side')
+    _git(repo, '-c', 'i18n.commitEncoding=ISO-8859-1', 'commit',
+         '--allow-empty', '-F', '-', stdin=b'Caf\xe9\n')
+    _git(repo, 'tag', '-a', 'v1.10', '-m', 'Multi\nline\n\n')
+    _git(repo, 'tag', '-a', 'nested', '-m', 'Nested', 'v1.10')
+    _git(repo, 'pack-refs', '--all')
+    _git(repo, 'tag', '-a', 'vé', '-m', '')
+    _git(repo, 'tag', 'V2', 'HEAD~1')
+    return repo
+
+
+def _config(
+        batched: bool = True, workers: int = 1, ordered: bool = False
+) -> ExtractGitMetadataConfig:
+    config = ExtractGitMetadataConfig(MainConfig())
+    config.batched = batched
+    config.workers = workers
+    config.ordered = ordered
+    return config
+
+
+def _extract(repo: Path, batched: bool) -> GitRepoMetadata:
+    return ExtractGitMetadata(_config(batched)).extract_meta(
+            GitRepo('me', repo.name, XrefID(Repository, 0), repo))
+
+
+def test_batched_extraction(repo: Path) -> None:
+    reference = _extract(repo, batched=False)
+    batched = _extract(repo, batched=True)
+
+    assert batched == reference
+    assert len(batched.commits) == 6
+    assert [tag.name for tag in batched.tags] == ['V2', 'nested', 'v1.0', 'v1.10', 'vé']
+
+
+def test_batched_extraction_empty_repo(tmp_path: Path) -> None:
+    _git(tmp_path, 'init')
+
+    assert _extract(tmp_path, batched=True) == _extract(tmp_path, batched=False)
+
+
+@pytest.fixture()
+def repos(tmp_path: Path) -> ResultMap[GitRepo]:
+    git_repos = []
+    for idx in range(6):
+        repo = tmp_path / f'repo{idx}'
+        repo.mkdir()
+        _git(repo, 'init')
+        for commit_idx in range(idx):
+            _git(repo, 'commit', '--allow-empty', '-m', f'Commit {commit_idx}')
+        git_repos.append(GitRepo('me', repo.name, XrefID(Repository, idx), repo))
+    return ResultMap(git_repos)
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_parallel_extraction(repos: ResultMap[GitRepo], ordered: bool) -> None:
+    reference = list(ExtractGitMetadata(_config()).run(repos))
+    parallel: List[GitRepoMetadata] = list(
+            ExtractGitMetadata(_config(workers=3, ordered=ordered)).run(repos))
+
+    if ordered:
+        assert parallel == reference
+    else:
+        assert sorted(parallel, key=lambda meta: meta.id) == reference
+    assert [len(meta.commits) for meta in reference] == list(range(6))
+
+
+def test_extraction_as_dependency(
+        repos: ResultMap[GitRepo], tmp_path: Path,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    inputs: Dict[str, Any] = {}
+
+    def run(self: ExtractStructuralModels, **kwargs: Any) -> ResultMap[Any]:
+        inputs.update(kwargs)
+        return ResultMap([])
+
+    # Only the results of the other dependencies are cached.
+    monkeypatch.setattr(
+            ExtractRoleMetadata, 'load_from_dataset',
+            lambda self: ResultMap({'dummy': None}))
+    monkeypatch.setattr(Clone, 'load_from_dataset', lambda self: repos)
+    monkeypatch.setattr(ExtractStructuralModels, 'run', run)
+    mc = MainConfig()
+    mc.output = tmp_path / 'output'
+    mc.dataset = 'test'
+    config = ExtractStructuralModelsConfig(mc)
+    config.workers = 3
+
+    ExtractStructuralModels.process(config)
+
+    git_meta = inputs['extract_git_metadata']
+    assert sorted(len(meta.commits) for meta in git_meta.values()) == list(range(6))
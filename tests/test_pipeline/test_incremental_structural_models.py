@@ -0,0 +1,127 @@
+"""Tests for incremental structural model extraction."""
+from typing import Any, Dict, List
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import yaml
+import _pytest
+
+from config import ExtractStructuralModelsConfig, MainConfig
+from models.serialize import CONVERTER
+from models.structural import role
+from pipeline.extract import extract_structural_models
+from models.structural.role import (
+        MultiStructuralRoleModel, StructuralRoleModel, _LazyProxy)
+from pipeline.extract.extract_structural_models import (
+        ExtractStructuralModels, _REPOS_AHEAD_PER_WORKER)
+
+
+def _model(role_id: str, rev: str) -> Dict[str, Any]:
+    return {
+        'role_id': role_id,
+        'role_rev': rev,
+        'role_root': {
+            'role_name': role_id,
+            'broken_files': [],
+            'logs': [],
+            'meta_file': {
+                'file_name': 'meta/main.yml',
+                'metablock': {'galaxy_info': {'author': 'me'}}},
+            'default_var_files': [{
+                'file_name': 'defaults/main.yml',
+                'content': {'version': rev}}],
+            'role_var_files': [],
+            'task_files': [],
+            'handler_files': []}}
+
+
+@pytest.fixture()
+def stage(tmp_path: Path) -> ExtractStructuralModels:
+    mc = MainConfig()
+    mc.output = tmp_path / 'output'
+    mc.dataset = 'test'
+    config = ExtractStructuralModelsConfig(mc)
+    config.commits = True
+    config.incremental = True
+    return ExtractStructuralModels(config)
+
+
+@pytest.fixture()
+def stored(tmp_path: Path) -> _LazyProxy:
+    file_path = tmp_path / 'stored' / 'role.yaml'
+    file_path.parent.mkdir()
+    file_path.write_text(yaml.safe_dump([_model('role', rev) for rev in ('v1', 'v2')]))
+    return _LazyProxy('role', file_path)
+
+
+@pytest.fixture()
+def no_structuring(monkeypatch: _pytest.monkeypatch.MonkeyPatch) -> List[Any]:
+    structured: List[Any] = []
+    monkeypatch.setattr(
+            role, 'CONVERTER',
+            SimpleNamespace(structure=lambda obj, cl: structured.append(obj)))
+    return structured
+
+
+def test_keep_missing_revisions(
+        stage: ExtractStructuralModels, stored: _LazyProxy,
+        no_structuring: List[Any]
+) -> None:
+    role_repos = [
+            (None, 'role', [('sha1', 'v1'), ('sha2', 'v2'), ('sha3', 'v3')]),
+            (None, 'up-to-date', [('sha1', 'v1')]),
+            (None, 'new', [('sha1', 'v1')])]
+    up_to_date = MultiStructuralRoleModel.from_unstructured(
+            'up-to-date', [_model('up-to-date', 'v1')])
+
+    missing = stage._keep_missing_revisions(
+            role_repos, {'role': stored, 'up-to-date': up_to_date})  # type: ignore[arg-type]
+
+    assert missing == [
+            (None, 'role', [('sha3', 'v3')]),
+            (None, 'new', [('sha1', 'v1')])]
+    assert stage.count_result(stored) == {'models': 2}
+    assert not no_structuring
+
+
+def test_merge_models(
+        stage: ExtractStructuralModels, stored: _LazyProxy, tmp_path: Path
+) -> None:
+    new = MultiStructuralRoleModel('role', CONVERTER.structure(
+            [_model('role', 'v3'), _model('role', 'v1')],
+            List[StructuralRoleModel]))
+
+    merged = stage._merge_models(
+            stored, new, [('sha2', 'v2'), ('sha3', 'v3'), ('sha4', 'v4')], True)
+
+    assert merged.revisions() == ['v2', 'v3']
+    assert stage.count_result(merged) == {'models': 2}
+    target = merged.dump(tmp_path)
+    reloaded = MultiStructuralRoleModel.load('role', target)
+    assert [model.role_rev for model in reloaded.structural_models] == ['v2', 'v3']
+
+
+def test_extraction_bounds_repositories_in_flight(
+        stage: ExtractStructuralModels,
+        monkeypatch: _pytest.monkeypatch.MonkeyPatch
+) -> None:
+    submitted: List[str] = []
+
+    def extract(repo_path: Path, role_name: str, *args: Any) -> Any:
+        submitted.append(role_name)
+        return SimpleNamespace(model=SimpleNamespace(structural_models=[]))
+
+    monkeypatch.setattr(extract_structural_models, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(extract_structural_models, '_extract_repository', extract)
+    stage.config.workers = 2
+    role_repos = [(SimpleNamespace(path=None), f'role{idx}', []) for idx in range(20)]
+
+    num_results = 0
+    for _ in stage._extract_repositories(
+            role_repos, role_repos, None, None):  # type: ignore[arg-type]
+        num_results += 1
+        assert len(submitted) - num_results <= 2 * _REPOS_AHEAD_PER_WORKER
+    assert num_results == 20
@@ -0,0 +1,158 @@
+"""Tests for stages that stream their results."""
+from typing import ClassVar, Counter, Iterator, List, Mapping, Optional
+
+from pathlib import Path
+
+import attr
+import pytest
+import yaml
+
+from config import MainConfig
+import pipeline.base as base
+from pipeline.base import CacheMiss, LazyResultMap, ResultMap, Stage
+
+
+@attr.s(auto_attribs=True)
+class Item:
+    name: str
+    value: int
+
+    num_loaded: ClassVar[int] = 0
+
+    @property
+    def id(self) -> str:
+        return self.name
+
+    def dump(self, dirpath: Path) -> Path:
+        file_path = dirpath / f'{self.name}.yaml'
+        file_path.write_text(yaml.dump(attr.asdict(self)))
+        return file_path
+
+    @classmethod
+    def load(cls, id: str, file_path: Path) -> 'Item':
+        Item.num_loaded += 1
+        return cls(**yaml.safe_load(file_path.read_text()))
+
+
+ITEMS = [Item('a', 1), Item('b', 2), Item('c', 3)]
+
+
+class Crash(Exception):
+    pass
+
+
+class StreamingStage(Stage[Item, MainConfig]):
+    dataset_dir_name = 'Streaming'
+
+    items: List[Item] = ITEMS
+    crash_after: int = -1
+    # Files on disk when each result was requested.
+    stored_before: List[List[str]] = []
+
+    def run(self) -> Iterator[Item]:
+        dataset_dir = self.config.output_directory / self.dataset_dir_name
+        for idx, item in enumerate(self.items):
+            if idx == self.crash_after:
+                raise Crash()
+            self.stored_before.append(sorted(p.name for p in dataset_dir.glob('*.yaml')))
+            yield item
+
+    # Counts of the last report.
+    reported: Optional[Counter[str]] = None
+
+    def count_result(self, result: Item) -> Mapping[str, int]:
+        return {'value': result.value}
+
+    def report_results(self, results: ResultMap[Item]) -> None:
+        StreamingStage.reported = self.result_counts(results)
+
+
+@pytest.fixture(autouse=True)
+def clean_stages() -> Iterator[None]:
+    stages = dict(base.STAGES)
+    yield
+    base.STAGES = stages
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> MainConfig:
+    mc = MainConfig()
+    mc.output = tmp_path / 'output'
+    mc.dataset = 'test'
+    mc.force = True
+    mc.report = False
+    return mc
+
+
+def test_stream_results(config: MainConfig) -> None:
+    StreamingStage.stored_before = []
+    results = StreamingStage.process(config)
+
+    # Each result was dumped before the next one was produced.
+    assert StreamingStage.stored_before == [[], ['a.yaml'], ['a.yaml', 'b.yaml']]
+    assert isinstance(results, LazyResultMap)
+    assert dict(results) == {item.id: item for item in ITEMS}
+    dataset_dir = config.output_directory / 'Streaming'
+    assert yaml.safe_load((dataset_dir / 'index.yaml').read_text()) == {
+            'a': 'a.yaml', 'b': 'b.yaml', 'c': 'c.yaml'}
+    assert not (dataset_dir / 'index.partial.jsonl').exists()
+
+
+def test_stream_results_report(config: MainConfig) -> None:
+    config.report = True
+    Item.num_loaded = 0
+
+    StreamingStage.process(config)
+
+    assert StreamingStage.reported == {'value': 6}
+    assert Item.num_loaded == 0
+
+    config.force = False
+    StreamingStage.process(config)
+
+    assert StreamingStage.reported == {'value': 6}
+    assert Item.num_loaded == 3
+
+
+def test_stream_results_crash(config: MainConfig) -> None:
+    stage = StreamingStage(config)
+    stage.crash_after = 2
+
+    with pytest.raises(Crash):
+        stage.store_stream_in_dataset(stage.run())
+
+    dataset_dir = config.output_directory / 'Streaming'
+    assert not (dataset_dir / 'index.yaml').exists()
+    assert dict(stage.load_partial_from_dataset()) == {
+            item.id: item for item in ITEMS[:2]}
+
+    # A truncated journal entry is skipped.
+    with (dataset_dir / 'index.partial.jsonl').open('at') as f_journal:
+        f_journal.write('["c", "c.y')
+    assert list(stage.load_partial_from_dataset()) == ['a', 'b']
+
+
+def test_stream_results_crash_on_rerun(config: MainConfig) -> None:
+    StreamingStage.process(config)
+
+    stage = StreamingStage(config)
+    stage.items = [Item('a', 10), Item('b', 20), Item('c', 30)]
+    stage.crash_after = 1
+    with pytest.raises(Crash):
+        stage.store_stream_in_dataset(stage.run())
+
+    # The index of the previous run still exists, but 'a' was overwritten.
+    dataset_dir = config.output_directory / 'Streaming'
+    assert (dataset_dir / 'index.yaml').exists()
+    with pytest.raises(CacheMiss):
+        stage.load_from_dataset()
+    assert dict(stage.load_partial_from_dataset()) == {
+            'a': Item('a', 10), 'b': Item('b', 2), 'c': Item('c', 3)}
+
+    # The next normal run doesn't use the stale results, and completes.
+    config.force = False
+    results = StreamingStage.process(config)
+    assert dict(results) == {item.id: item for item in ITEMS}
+    assert not (dataset_dir / 'index.partial.jsonl').exists()
+    assert dict(StreamingStage(config).load_from_dataset()) == {
+            item.id: item for item in ITEMS}
@@ -0,0 +1,98 @@
+"""Tests for the parallel extraction of structural diffs."""
+from typing import Any, Dict, List, Optional
+
+from pathlib import Path
+
+import pytest
+import yaml
+
+from config import ExtractStructuralDiffsConfig, MainConfig
+from models.structural.role import _LazyProxy
+from pipeline.base import ResultMap
+from pipeline.extract.extract_structural_diffs import (
+        ExtractStructuralDiffs, _diff_models, _diff_revisions)
+
+
+def _model(role_id: str, rev: int) -> Dict[str, Any]:
+    tasks = [
+            {'action': 'debug', 'args': {'msg': f'task {idx}'}, 'name': f'Task {idx}'}
+            for idx in range(rev % 4 + 1)]
+    if rev % 3 == 0:
+        tasks.reverse()
+    return {
+        'role_id': role_id,
+        'role_rev': f'v{rev}',
+        'role_root': {
+            'role_name': role_id,
+            'broken_files': [],
+            'logs': [],
+            'meta_file': {
+                'file_name': 'meta/main.yml',
+                'metablock': {'galaxy_info': {'author': 'me'}}},
+            'default_var_files': [{
+                'file_name': 'defaults/main.yml',
+                'content': {'version': rev // 2}}],
+            'role_var_files': [],
+            'task_files': [{
+                'file_name': 'tasks/main.yml',
+                'content': [{'block': tasks}]}],
+            'handler_files': []}}
+
+
+@pytest.fixture()
+def models(tmp_path: Path) -> ResultMap[_LazyProxy]:
+    proxies = []
+    for role_id, num_revs in (('short.role', 2), ('long.role', 9), ('single.role', 1)):
+        file_path = tmp_path / f'{role_id}.yaml'
+        file_path.write_text(yaml.safe_dump([_model(role_id, rev) for rev in range(num_revs)]))
+        proxies.append(_LazyProxy(role_id, file_path))
+    return ResultMap(proxies)
+
+
+def _extract(
+        models: ResultMap[_LazyProxy], tmp_path: Path, workers: int,
+        pair_chunk_size: Optional[int] = None, strict_validation: bool = False
+) -> Dict[str, List[Dict[str, Any]]]:
+    mc = MainConfig()
+    mc.output = tmp_path / 'output'
+    mc.dataset = 'test'
+    config = ExtractStructuralDiffsConfig(mc)
+    config.workers = workers
+    config.pair_chunk_size = pair_chunk_size
+    config.strict_validation = strict_validation
+    stage = ExtractStructuralDiffs(config)
+    return {
+            evolution.id: [diff_set.unstructure() for diff_set in evolution.diff_sets]
+            for evolution in stage.run(models)}
+
+
+@pytest.mark.parametrize('pair_chunk_size', [None, 1, 3, 20])
+def test_parallel_diffs(
+        models: ResultMap[_LazyProxy], tmp_path: Path,
+        pair_chunk_size: Optional[int]
+) -> None:
+    reference = _extract(models, tmp_path, 1)
+    parallel = _extract(models, tmp_path, 2, pair_chunk_size)
+
+    assert parallel == reference
+    assert [len(reference[role_id]) for role_id in models] == [1, 8, 0]
+    assert [diff_set['new_rev'] for diff_set in parallel['long.role']] == [
+            f'v{rev}' for rev in range(1, 9)]
+
+
+def test_strict_validation(models: ResultMap[_LazyProxy], tmp_path: Path) -> None:
+    assert _extract(models, tmp_path, 1, strict_validation=True) == _extract(models, tmp_path, 1)
+
+
+def test_chunks_load_role_once(models: ResultMap[_LazyProxy]) -> None:
+    first = _diff_revisions(models['long.role'], 4)
+
+    # The remaining chunks get the models after the first chunk.
+    assert first.num_models == 9
+    assert first.rest is not None
+    assert [model['role_rev'] for model in first.rest] == [f'v{rev}' for rev in range(3, 9)]
+    second = _diff_models('long.role', 3, first.rest)
+    assert [diff_set['new_rev'] for diff_set in first.diff_sets + second.diff_sets] == [
+            f'v{rev}' for rev in range(1, 9)]
+
+    assert _diff_revisions(models['short.role'], 4).rest is None
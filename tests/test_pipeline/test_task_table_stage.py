@@ -0,0 +1,166 @@
+"""Tests for the task table and the datamine scripts running on it."""
+from typing import Any, Dict, List
+
+import importlib.util
+from pathlib import Path
+
+import attr
+import pytest
+import yaml
+
+from config import DatamineConfig, ExtractTaskTableConfig, MainConfig
+from models.datamine.tasks import TaskTable
+from pipeline.base import CacheMiss, write_index
+from pipeline.datamine import engine
+from pipeline.datamine.datamine_roles import DatamineStage
+from pipeline.datamine.task_table import ExtractTaskTable
+
+pytest.importorskip('pyarrow')
+
+DATAMINE_DIR = Path(__file__).parents[2] / 'datamine'
+
+TASKS = [
+    {'action': 'apt', 'args': {'name': 'nginx', 'state': 'present'}, 'loop': '{{ items }}'},
+    {'block': [{'action': 'debug', 'args': {'msg': 'nested'}}],
+     'rescue': [{'action': 'fail', 'args': {}}]},
+    {'action': 'command', 'args': 'ls', 'when': ['a', {'b': 1}]},
+    {'action': 'debug', 'args': {'msg': 'hi'}, 'when': 'x is defined'},
+    {'action': 'service', 'when': ''},
+]
+
+
+def _model(role_id: str, rev: str, tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'role_id': role_id,
+        'role_rev': rev,
+        'role_root': {
+            'role_name': role_id,
+            'task_files': [{
+                'file_name': 'tasks/main.yml',
+                'content': [
+                    {'block': tasks},
+                    {'block': [], 'always': [{'action': 'file', 'args': {}}]}]}],
+            'handler_files': []}}
+
+
+@pytest.fixture()
+def output_dir(tmp_path: Path) -> Path:
+    models_dir = tmp_path / 'StructuralModels'
+    models_dir.mkdir()
+    models = {
+        'me.first': [
+            _model('me.first', 'v1.0', TASKS[:1]),
+            _model('me.first', 'v2.0', TASKS[:3]),
+            _model('me.first', 'HEAD', TASKS)],
+        'me.second': [_model('me.second', 'HEAD', TASKS[2:] * 2)]}
+    for role_id, role_models in models.items():
+        (models_dir / f'{role_id}.yaml').write_text(yaml.safe_dump(role_models))
+    write_index(models_dir, {role_id: f'{role_id}.yaml' for role_id in models})
+    return tmp_path
+
+
+def _config(output_dir: Path, table_format: str = 'parquet') -> ExtractTaskTableConfig:
+    mc = MainConfig()
+    mc.output = output_dir.parent
+    mc.dataset = output_dir.name
+    config = ExtractTaskTableConfig(mc)
+    config.table_format = table_format
+    return config
+
+
+def _extract(output_dir: Path, table_format: str = 'parquet') -> TaskTable:
+    results = ExtractTaskTable.process(_config(output_dir, table_format))
+    return results['tasks']
+
+
+def test_table_rows(output_dir: Path) -> None:
+    tasks = _extract(output_dir).frame
+    head = tasks[(tasks['role_id'] == 'me.first') & (tasks['role_rev'] == 'HEAD')]
+
+    assert list(head['block_path']) == [
+            '0.block.0', '0.block.1.block.0', '0.block.1.rescue.0',
+            '0.block.2', '0.block.3', '0.block.4', '1.always.0']
+    assert list(head['top_level']) == [True, False, False, True, True, True, False]
+    assert list(head['action']) == [
+            'apt', 'debug', 'fail', 'command', 'debug', 'service', 'file']
+    assert list(head['arg_keys'].iloc[0]) == ['name', 'state']
+    assert head['arg_keys'].iloc[3] is None
+    assert [list(conds) for conds in head['when']] == [
+            [], [], [], ['a', '{"b": 1}'], ['x is defined'], [], []]
+    assert list(head['has_when']) == [False, False, False, True, True, True, False]
+    assert list(head['has_loop']) == [True] + [False] * 6
+    assert set(head['position']) == {2} and set(head['num_revisions']) == {3}
+
+
+@pytest.mark.parametrize('table_format', ['parquet', 'feather'])
+def test_load_from_dataset(output_dir: Path, table_format: str) -> None:
+    extracted = _extract(output_dir, table_format).frame
+    index = yaml.safe_load((output_dir / 'TaskTable' / 'index.yaml').read_text())
+    loaded = ExtractTaskTable(_config(output_dir)).load_from_dataset()['tasks'].frame
+
+    assert index == {'tasks': f'tasks.{table_format}'}
+    assert list(loaded.dtypes) == list(extracted.dtypes)
+    assert loaded.drop(columns=['arg_keys', 'when']).equals(
+            extracted.drop(columns=['arg_keys', 'when']))
+
+
+def test_outdated_table(output_dir: Path) -> None:
+    _extract(output_dir)
+    models_path = output_dir / 'StructuralModels' / 'me.second.yaml'
+    models_path.write_text(yaml.safe_dump([_model('me.second', 'HEAD', TASKS[:1])]))
+
+    with pytest.raises(CacheMiss):
+        ExtractTaskTable(_config(output_dir)).load_from_dataset()
+    tasks = ExtractTaskTable.process(_config(output_dir), dependency=True)['tasks'].frame
+    assert len(tasks[tasks['role_id'] == 'me.second']) == 2
+    assert ExtractTaskTable(_config(output_dir)).load_from_dataset()
+
+
+def _normalize(result: Any) -> Any:
+    if isinstance(result, list):
+        return [_normalize(el) for el in result]
+    if attr.has(type(result)):
+        return {
+                name: sorted(value) if name in {'common_args', 'conditions'} else _normalize(value)
+                for name, value in attr.asdict(result, recurse=False).items()}
+    return result
+
+
+@pytest.mark.parametrize('script_name', [
+    'module_usage_analysis.py', 'argument_usage_analysis.py',
+    'loop_usage_analysis.py', 'when_usage_analysis.py',
+    'conditions_percentage_analysis.py', 'conditions_usage_analysis.py'])
+def test_table_algo_matches_plugin(output_dir: Path, script_name: str) -> None:
+    spec = importlib.util.spec_from_file_location(
+            f'test_{script_name[:-3]}', DATAMINE_DIR / script_name)
+    assert spec is not None and spec.loader is not None
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)  # type: ignore[attr-defined]
+    tasks = _extract(output_dir).frame
+
+    expected = engine.scan(output_dir / 'StructuralModels', [script.PLUGIN({})])[0]
+
+    assert _normalize(script.table_algo(tasks, {})) == _normalize(expected)
+
+
+def test_datamine_on_task_table(output_dir: Path, tmp_path: Path) -> None:
+    script_path = tmp_path / 'table_script.py'
+    script_path.write_text('\n'.join([
+        'def algo(config, roles_dir_name):',
+        '    raise AssertionError()',
+        'def table_algo(tasks, options):',
+        '    return len(tasks)',
+        'def store_results(result, config, filename):',
+        '    (config.output_directory / "result.txt").write_text(str(result))']))
+    _extract(output_dir)
+    mc = MainConfig()
+    mc.output = output_dir.parent
+    mc.dataset = output_dir.name
+    config = DatamineConfig(mc)
+    config.path = [script_path]
+    config.options = {}
+    config.task_table = True
+
+    DatamineStage(config).run()
+
+    assert (output_dir / 'result.txt').read_text() == '21'
@@ -0,0 +1,118 @@
+"""Tests for concurrent page loading in services.galaxy."""
+from typing import Any, Dict, List
+
+import threading
+import time
+
+import pytest
+import requests
+
+from services import galaxy
+from services.galaxy import GalaxyAPI, RateLimiter
+# Must match the stub in conftest.
+COUNT = 23
+PAGE_SIZE = 5
+
+
+@pytest.fixture()
+def api() -> GalaxyAPI:
+    return GalaxyAPI(requests.Session(), RateLimiter(base_delay=0.01))
+
+
+def _ids(pages: List[Dict[str, object]]) -> List[int]:
+    return [role['id'] for page in pages for role in page['results']]  # type: ignore
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_load_pages(api: GalaxyAPI, galaxy_stub: Any, workers: int) -> None:
+    pages = list(api.load_pages('roles', galaxy_stub.url, PAGE_SIZE, workers=workers))
+
+    assert [page.page_num for page in pages] == [1, 2, 3, 4, 5]
+    assert [page.id for page in pages] == [f'roles/{num}' for num in range(1, 6)]
+    assert _ids([page.response for page in pages]) == list(range(COUNT))
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_load_pages_backoff(api: GalaxyAPI, galaxy_stub: Any, workers: int) -> None:
+    galaxy_stub.rate_limited = {2, 4}
+
+    pages = list(api.load_pages('roles', galaxy_stub.url, PAGE_SIZE, workers=workers))
+
+    assert [page.page_num for page in pages] == [1, 2, 3, 4, 5]
+    assert _ids([page.response for page in pages]) == list(range(COUNT))
+    assert galaxy_stub.requests.count(2) == 2
+    assert galaxy_stub.requests.count(4) == 2
+
+
+def test_load_pages_concurrent_skips_server_errors(api: GalaxyAPI, galaxy_stub: Any) -> None:
+    galaxy_stub.server_errors = {3}
+
+    pages = list(api.load_pages('roles', galaxy_stub.url, PAGE_SIZE, workers=4))
+
+    assert [page.page_num for page in pages] == [1, 2, 4, 5]
+
+
+def test_load_pages_concurrent_count_grew(api: GalaxyAPI, galaxy_stub: Any) -> None:
+    pages_it = api.load_pages('roles', galaxy_stub.url, PAGE_SIZE, workers=4)
+    first = next(pages_it)
+    # More roles were added after the first page was loaded.
+    galaxy_stub.count = COUNT + 10
+
+    pages = [first] + list(pages_it)
+
+    assert [page.page_num for page in pages] == [1, 2, 3, 4, 5, 6, 7]
+    assert _ids([page.response for page in pages]) == list(range(COUNT + 10))
+
+
+def test_load_pages_concurrent_bounded(api: GalaxyAPI, galaxy_stub: Any) -> None:
+    # 12 pages of 2 roles, at most 4 requested ahead by 2 workers.
+    pages_it = api.load_pages('roles', galaxy_stub.url, 2, workers=2)
+    next(pages_it)
+    next(pages_it)
+    time.sleep(0.2)
+
+    assert len(galaxy_stub.requests) <= 2 + 2 * galaxy._PAGES_AHEAD_PER_WORKER
+
+    pages = list(pages_it)
+
+    assert [page.page_num for page in pages] == list(range(3, 13))
+    assert sorted(galaxy_stub.requests) == list(range(1, 13))
+
+
+def test_load_roles_concurrent_bounded(api: GalaxyAPI) -> None:
+    loaded: List[int] = []
+    sessions: Dict[int, requests.Session] = {}
+
+    def load_role(role_id: int) -> Dict[str, object]:
+        loaded.append(role_id)
+        sessions[threading.get_ident()] = api._get_session()
+        return {'id': role_id}
+
+    api.load_role = load_role  # type: ignore[assignment]
+    roles_it = api.load_roles(range(20), workers=2)
+    next(roles_it)
+    time.sleep(0.2)
+
+    assert len(loaded) <= 1 + 2 * galaxy._ROLES_AHEAD_PER_WORKER
+
+    roles = list(roles_it)
+
+    assert roles == [(role_id, {'id': role_id}) for role_id in range(1, 20)]
+    # Each worker has its own session.
+    assert len(set(map(id, sessions.values()))) == len(sessions)
+    assert api._session not in sessions.values()
+
+
+def test_rate_limiter_spacing() -> None:
+    limiter = RateLimiter(rate=1000)
+    for _ in range(5):
+        limiter.acquire()
+
+
+def test_rate_limiter_backoff() -> None:
+    limiter = RateLimiter(base_delay=1, max_delay=4)
+
+    assert [limiter.backoff() for _ in range(4)] == [1, 2, 4, 4]
+    limiter.reset()
+    assert limiter.backoff() == 1
+    assert limiter.backoff(retry_after=0.5) == 0.5